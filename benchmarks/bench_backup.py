@@ -0,0 +1,141 @@
+"""End-to-end benchmark: backup_all_messages against a local fake Slack server.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_backup [--channels 20] [--messages 500] [--workers 1 4]
+
+Each run backs up a freshly generated workspace into a temporary directory
+in a child process and reports wall time, API calls, bytes transferred and
+the child's peak RSS. Pass several `--workers` values to compare them.
+"""
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+import resource
+import tempfile
+import multiprocessing
+
+from benchmarks.fake_slack import FakeSlackServer, generate_workspace
+
+
+CONFIG_TEMPLATE = """[Slack]
+User_OAuth_Token = xoxp-benchmark
+API_Base_URL = {api_url}
+
+[Options]
+Backup_Attachments = {attachments}
+Workers = {workers}
+Rate_Limit_Multiplier = {rate_limit_multiplier}
+"""
+
+
+# Function to run one backup in the current (child) process and report its timings
+def run_backup(work_dir, results):
+    from src.config import load_config
+    from slackdown import backup_all_messages
+
+    os.chdir(work_dir)
+    config = load_config()
+    sys.stdout = open(os.devnull, "w")
+    start = time.perf_counter()
+    backup_all_messages(config)
+    wall_time = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != "darwin":
+        peak_rss *= 1024
+    results.put({"wall_time": wall_time, "peak_rss": peak_rss})
+
+
+# Function to benchmark one backup run against `server` with the given worker count
+def benchmark(server, workers, args):
+    server.reset_stats()
+    with tempfile.TemporaryDirectory() as work_dir:
+        with open(os.path.join(work_dir, "config.txt"), "w") as f:
+            f.write(
+                CONFIG_TEMPLATE.format(
+                    api_url=server.api_url,
+                    attachments=not args.no_attachments,
+                    workers=workers,
+                    rate_limit_multiplier=args.rate_limit_multiplier,
+                )
+            )
+        # A fresh interpreter so peak RSS covers the backup alone
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        process = context.Process(target=run_backup, args=(work_dir, results))
+        process.start()
+        # Poll, so a child that dies without a result fails the run instead of hanging it
+        result = None
+        while result is None:
+            alive = process.is_alive()
+            try:
+                result = results.get(timeout=1)
+            except queue.Empty:
+                if not alive:
+                    break
+        process.join()
+        if result is None or process.exitcode != 0:
+            raise RuntimeError(f"Backup process failed with exit code {process.exitcode}")
+    result.update(server.stats(), workers=workers)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--channels", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=500, help="messages per channel")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--thread-ratio", type=float, default=0.1)
+    parser.add_argument("--attachment-ratio", type=float, default=0.05)
+    parser.add_argument("--no-attachments", action="store_true", help="set Backup_Attachments = False")
+    parser.add_argument("--latency", type=float, default=0.005, help="seconds added to every request")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="answer every Nth API call with 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument(
+        "--rate-limit-multiplier", type=float, default=1000,
+        help="scale SlackDown's own rate limits (1 = Slack's real tiers)",
+    )
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    workspace = generate_workspace(
+        channels=args.channels,
+        messages=args.messages,
+        users=args.users,
+        thread_ratio=args.thread_ratio,
+        attachment_ratio=args.attachment_ratio,
+    )
+    print(
+        f"workspace:    {len(workspace.channels)} conversations, {workspace.message_count} messages, "
+        f"{len(workspace.replies)} threads, {len(workspace.files)} files"
+    )
+
+    results = []
+    with FakeSlackServer(
+        workspace,
+        latency=args.latency,
+        rate_limit_every=args.rate_limit_every,
+        retry_after=args.retry_after,
+    ) as server:
+        for workers in args.workers:
+            result = benchmark(server, workers, args)
+            results.append(result)
+            print(
+                f"workers={workers:<3} {result['wall_time']:.2f}s, {result['api_calls']} API calls "
+                f"({result['calls'].get('rate_limited', 0)} rate limited), "
+                f"{result['calls'].get('files', 0)} downloads, "
+                f"{result['bytes_sent'] / 2**20:.1f} MiB, peak RSS {result['peak_rss'] / 2**20:.1f} MiB"
+            )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""Memory benchmark: full Slack message payloads vs. CompactMessage records.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_messages [--messages 20000]
+
+Builds a synthetic channel history shaped like real `conversations.history`
+messages (rich-text blocks, client IDs, reactions with their users, full file
+metadata, link unfurls), parses it from JSON the way the API client does and
+measures with tracemalloc what keeping the parsed dicts costs per message
+compared with keeping only their compact projections.
+"""
+import gc
+import json
+import uuid
+import random
+import argparse
+import tracemalloc
+
+from src.messages import compact_message
+
+
+WORDS = "the build is green again please review deploy after lunch thanks".split()
+ALIASES = ["+1", "tada", "eyes", "rocket", "white_check_mark", "joy", "fire"]
+USERS = [f"U{i:08d}" for i in range(200)]
+
+
+# Function to build the rich-text blocks Slack sends along with a message's text
+def text_blocks(rng, text):
+    elements = []
+    for word in text.split():
+        if word.startswith("<@"):
+            elements.append({"type": "user", "user_id": word[2:-1]})
+        else:
+            elements.append({"type": "text", "text": f"{word} "})
+    return [
+        {
+            "type": "rich_text",
+            "block_id": uuid.UUID(int=rng.getrandbits(128)).hex[:5],
+            "elements": [{"type": "rich_text_section", "elements": elements}],
+        }
+    ]
+
+
+# Function to build a file object with the metadata Slack returns for it
+def file_object(rng, user, ts):
+    file_id = f"F{rng.getrandbits(40):011X}"
+    info = {
+        "id": file_id,
+        "created": int(float(ts)),
+        "timestamp": int(float(ts)),
+        "name": "screenshot.png",
+        "title": "screenshot.png",
+        "mimetype": "image/png",
+        "filetype": "png",
+        "pretty_type": "PNG",
+        "user": user,
+        "user_team": "T00000001",
+        "editable": False,
+        "size": rng.randint(10_000, 5_000_000),
+        "mode": "hosted",
+        "is_external": False,
+        "external_type": "",
+        "is_public": True,
+        "public_url_shared": False,
+        "display_as_bot": False,
+        "username": "",
+        "url_private": f"https://files.slack.com/files-pri/T00000001-{file_id}/screenshot.png",
+        "url_private_download": f"https://files.slack.com/files-pri/T00000001-{file_id}/download/screenshot.png",
+        "media_display_type": "unknown",
+        "permalink": f"https://acme.slack.com/files/{user}/{file_id}/screenshot.png",
+        "permalink_public": f"https://slack-files.com/T00000001-{file_id}-{rng.getrandbits(40):x}",
+        "is_starred": False,
+        "has_rich_preview": False,
+        "file_access": "visible",
+    }
+    for size in (64, 80, 160, 360, 480, 720, 800, 960, 1024):
+        info[f"thumb_{size}"] = f"https://files.slack.com/files-tmb/T00000001-{file_id}-{size}/screenshot_{size}.png"
+        info[f"thumb_{size}_w"] = size
+        info[f"thumb_{size}_h"] = size * 9 // 16
+    return info
+
+
+# Function to generate a channel history as the JSON of its API pages
+def make_history(count, seed=42):
+    rng = random.Random(seed)
+    messages = []
+    for n in range(count):
+        ts = f"{1_700_000_000 - n * 60:.6f}"
+        user = rng.choice(USERS)
+        tokens = [
+            f"<@{rng.choice(USERS)}>" if rng.random() < 0.05 else rng.choice(WORDS)
+            for _ in range(rng.randint(3, 40))
+        ]
+        text = " ".join(tokens)
+        message = {
+            "client_msg_id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "type": "message",
+            "text": text,
+            "user": user,
+            "ts": ts,
+            "blocks": text_blocks(rng, text),
+            "team": "T00000001",
+        }
+        if rng.random() < 0.2:
+            reactors = rng.randint(1, 8)
+            message["reactions"] = [
+                {"name": rng.choice(ALIASES), "users": rng.sample(USERS, reactors), "count": reactors}
+            ]
+        if rng.random() < 0.1:
+            message["files"] = [file_object(rng, user, ts)]
+            message["upload"] = False
+            message["display_as_bot"] = False
+        if rng.random() < 0.05:
+            message["attachments"] = [
+                {
+                    "from_url": "https://example.com/post",
+                    "service_name": "example.com",
+                    "title": "A linked post",
+                    "title_link": "https://example.com/post",
+                    "text": " ".join(rng.choice(WORDS) for _ in range(40)),
+                    "fallback": "example.com: A linked post",
+                    "image_url": "https://example.com/preview.png",
+                    "image_width": 1200,
+                    "image_height": 630,
+                    "id": 1,
+                    "original_url": "https://example.com/post",
+                }
+            ]
+        if rng.random() < 0.1:
+            message.update(
+                thread_ts=ts,
+                reply_count=rng.randint(1, 20),
+                reply_users_count=3,
+                latest_reply=f"{float(ts) + 300:.6f}",
+                reply_users=rng.sample(USERS, 3),
+                is_locked=False,
+                subscribed=False,
+            )
+        messages.append(message)
+    return [json.dumps({"ok": True, "messages": messages[i : i + 200]}) for i in range(0, count, 200)]
+
+
+# Function to measure the memory kept alive by what `ingest` returns for every page
+def retained_bytes(pages, ingest):
+    gc.collect()
+    tracemalloc.start()
+    kept = [ingest(json.loads(page)["messages"]) for page in pages]
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=20000)
+    args = parser.parse_args()
+
+    pages = make_history(args.messages)
+    full = retained_bytes(pages, lambda messages: messages)
+    compact = retained_bytes(pages, lambda messages: [compact_message(m) for m in messages])
+    per_message = lambda size: size / args.messages
+
+    print(f"messages:        {args.messages}")
+    print(f"full payloads:   {full / 2**20:.1f} MiB ({per_message(full):.0f} B/message)")
+    print(f"compact records: {compact / 2**20:.1f} MiB ({per_message(compact):.0f} B/message)")
+    print(f"reduction:       {full / compact:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Micro-benchmark: single-pass renderer vs. the previous multi-pass text pipeline.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_renderer [--messages 20000]
+"""
+import random
+import argparse
+import timeit
+
+import emoji
+
+from src.renderer import SLACK_EMOJI_MAPPING, render_reaction, render_text
+
+
+WORDS = "the build is green again please review deploy after lunch thanks".split()
+ALIASES = list(SLACK_EMOJI_MAPPING) + ["thumbs_up", "rocket", "eyes", "fire", "nope"]
+USERS = {f"U{i:05d}": f"user{i}" for i in range(200)}
+
+
+# Function to generate a synthetic corpus of Slack message texts
+def make_corpus(count, seed=42):
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(count):
+        tokens = []
+        for _ in range(rng.randint(5, 40)):
+            roll = rng.random()
+            if roll < 0.08:
+                tokens.append(f"<@{rng.choice(list(USERS))}>")
+            elif roll < 0.15:
+                tokens.append(f":{rng.choice(ALIASES)}:")
+            elif roll < 0.16:
+                tokens.append("<!channel>")
+            else:
+                tokens.append(rng.choice(WORDS))
+        text = " ".join(tokens)
+        if rng.random() < 0.1:
+            text += "\n```\nmake test\n```"
+        corpus.append(text)
+    return corpus
+
+
+# Previous implementation, kept here as the baseline
+def legacy_replace_emoji_labels(text):
+    for alias, emoji_char in SLACK_EMOJI_MAPPING.items():
+        text = text.replace(f":{alias}:", emoji_char)
+    return emoji.emojize(text)
+
+
+def legacy_replace_user_ids_and_channels(resolve_user, text):
+    if not text:
+        return text
+    processed_lines = []
+    for line in text.split("\n"):
+        indent = " " * (len(line) - len(line.lstrip()))
+        words = line.strip().split()
+        for i, word in enumerate(words):
+            if word.startswith("<@") and word.endswith(">"):
+                words[i] = f"`@{resolve_user(word[2:-1])}`"
+            elif word == "<!channel>":
+                words[i] = "`@channel`"
+        processed_lines.append(indent + " ".join(words))
+    return "\n".join(processed_lines)
+
+
+def legacy_render(text, resolve_user):
+    text = legacy_replace_emoji_labels(legacy_replace_user_ids_and_channels(resolve_user, text))
+    if "```" in text:
+        parts = text.split("```")
+        text = "\n".join(
+            f"```\n{part.strip()}\n```" if i % 2 else part for i, part in enumerate(parts)
+        )
+    return text
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.messages)
+    reactions = ALIASES * (args.messages // len(ALIASES))
+    resolve_user = USERS.get
+
+    def run_legacy():
+        for text in corpus:
+            legacy_render(text, resolve_user)
+        for name in reactions:
+            legacy_replace_emoji_labels(f":{name}:")
+
+    def run_single_pass():
+        for text in corpus:
+            render_text(text, resolve_user)
+        for name in reactions:
+            render_reaction(name)
+
+    legacy = min(timeit.repeat(run_legacy, number=1, repeat=args.repeat))
+    single_pass = min(timeit.repeat(run_single_pass, number=1, repeat=args.repeat))
+    per_message = lambda seconds: seconds / args.messages * 1e6
+
+    print(f"messages:     {args.messages} (+{len(reactions)} reactions)")
+    print(f"multi-pass:   {legacy:.3f}s ({per_message(legacy):.1f} us/message)")
+    print(f"single-pass:  {single_pass:.3f}s ({per_message(single_pass):.1f} us/message)")
+    print(f"speedup:      {legacy / single_pass:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
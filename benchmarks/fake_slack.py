@@ -0,0 +1,362 @@
+"""A local stand-in for the Slack Web API, serving a synthetic workspace.
+
+Implements the methods SlackDown calls (`conversations.list`,
+`conversations.history`, `conversations.replies`, `users.info`, `users.list`)
+plus file downloads, with cursor pagination, optional per-request latency and
+HTTP 429 injection. Every request is counted so benchmarks can report API
+calls and bytes transferred.
+
+    workspace = generate_workspace(channels=20, messages=500)
+    with FakeSlackServer(workspace, latency=0.01) as server:
+        ...  # point API_Base_URL at server.api_url
+"""
+import json
+import random
+import threading
+import time
+
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+WORDS = "the build is green again please review deploy after lunch thanks".split()
+ALIASES = ["+1", "tada", "eyes", "rocket", "white_check_mark", "joy", "fire"]
+# Default page size Slack uses when a request does not pass `limit`
+DEFAULT_LIMIT = 100
+
+
+class Workspace:
+    """Users, conversations, messages and files of a synthetic Slack workspace."""
+
+    def __init__(self):
+        self.users = []
+        self.channels = []  # conversation objects, each with an extra "type" key
+        self.history = {}  # channel id -> messages, newest first
+        self.replies = {}  # (channel id, thread ts) -> parent followed by its replies
+        self.files = {}  # download path -> content
+
+    @property
+    def message_count(self):
+        return sum(len(messages) for messages in self.history.values())
+
+
+# Function to generate a synthetic workspace
+# `messages` is per conversation; a `thread_ratio` share of them start a thread
+# of up to `max_replies` replies and an `attachment_ratio` share carry a file.
+def generate_workspace(
+    channels=10,
+    messages=200,
+    users=50,
+    dms=2,
+    thread_ratio=0.1,
+    max_replies=5,
+    attachment_ratio=0.05,
+    attachment_size=16 * 1024,
+    messages_per_day=50,
+    seed=42,
+):
+    rng = random.Random(seed)
+    workspace = Workspace()
+    # Messages are spread evenly over `messages / messages_per_day` days ending here
+    end = 1_700_000_000
+
+    for i in range(users):
+        workspace.users.append(
+            {
+                "id": f"U{i:07d}",
+                "name": f"user{i}",
+                "profile": {"display_name": f"User {i}", "real_name": f"Real User {i}"},
+            }
+        )
+    user_ids = [user["id"] for user in workspace.users]
+
+    for i in range(channels):
+        workspace.channels.append(
+            {
+                "id": f"C{i:07d}",
+                "name": f"channel-{i}",
+                "type": "public_channel",
+                "is_channel": True,
+                "is_private": False,
+                "num_members": rng.randint(2, users),
+                "updated": end * 1000,
+                "created": int(end - messages * 86400 / messages_per_day),
+            }
+        )
+    for i in range(dms):
+        workspace.channels.append(
+            {
+                "id": f"D{i:07d}",
+                "user": user_ids[i % users],
+                "type": "im",
+                "is_im": True,
+                "created": int(end - messages * 86400 / messages_per_day),
+                "updated": end * 1000,
+            }
+        )
+
+    def text():
+        tokens = []
+        for _ in range(rng.randint(3, 30)):
+            roll = rng.random()
+            if roll < 0.05:
+                tokens.append(f"<@{rng.choice(user_ids)}>")
+            elif roll < 0.1:
+                tokens.append(f":{rng.choice(ALIASES)}:")
+            else:
+                tokens.append(rng.choice(WORDS))
+        return " ".join(tokens)
+
+    file_number = 0
+    step = 86400 / messages_per_day
+    for channel in workspace.channels:
+        history = []
+        for n in range(messages):
+            ts = f"{end - n * step:.6f}"
+            message = {"type": "message", "ts": ts, "user": rng.choice(user_ids), "text": text()}
+            if rng.random() < 0.1:
+                message["reactions"] = [
+                    {"name": rng.choice(ALIASES), "count": rng.randint(1, 5), "users": []}
+                ]
+            if rng.random() < attachment_ratio:
+                file_id = f"F{file_number:07d}"
+                file_number += 1
+                path = f"/files/{file_id}/report.bin"
+                workspace.files[path] = rng.randbytes(attachment_size)
+                message["files"] = [
+                    {
+                        "id": file_id,
+                        "name": "report.bin",
+                        "mimetype": "application/octet-stream",
+                        "size": attachment_size,
+                        "url_private": path,  # made absolute by the server
+                    }
+                ]
+            if rng.random() < thread_ratio:
+                replies = [
+                    {
+                        "type": "message",
+                        "ts": f"{end - n * step + r + 1:.6f}",
+                        "thread_ts": ts,
+                        "user": rng.choice(user_ids),
+                        "text": text(),
+                    }
+                    for r in range(rng.randint(1, max_replies))
+                ]
+                message.update(
+                    thread_ts=ts, reply_count=len(replies), latest_reply=replies[-1]["ts"]
+                )
+                workspace.replies[(channel["id"], ts)] = [message] + replies
+            history.append(message)
+        workspace.history[channel["id"]] = history
+
+    return workspace
+
+
+class FakeSlackHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+    def _params(self, url):
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            body = self.rfile.read(length).decode("utf-8")
+            if self.headers.get("Content-Type", "").startswith("application/json"):
+                params.update(json.loads(body))
+            else:
+                params.update({key: values[-1] for key, values in parse_qs(body).items()})
+        return params
+
+    def _handle(self):
+        server = self.server
+        url = urlparse(self.path)
+        params = self._params(url)
+        if server.latency:
+            time.sleep(server.latency)
+
+        if url.path.startswith("/files/"):
+            server.count("files")
+            content = server.workspace.files.get(url.path)
+            if content is None:
+                self._send(404, b"not found", "text/plain")
+            else:
+                self._send_file(content)
+            return
+
+        method = url.path.rsplit("/", 1)[-1]
+        if server.count(method) and server.should_rate_limit():
+            server.count("rate_limited")
+            self._send(
+                429,
+                json.dumps({"ok": False, "error": "ratelimited"}).encode("utf-8"),
+                headers={"Retry-After": str(server.retry_after)},
+            )
+            return
+
+        handler = getattr(server, "api_" + method.replace(".", "_"), None)
+        payload = handler(params) if handler else {"ok": False, "error": "unknown_method"}
+        self._send(200, json.dumps(payload).encode("utf-8"))
+
+    def _send_file(self, content):
+        start = 0
+        range_header = self.headers.get("Range", "")
+        if range_header.startswith("bytes=") and range_header.endswith("-"):
+            start = int(range_header[6:-1])
+            if start >= len(content):
+                self._send(416, b"", "application/octet-stream")
+                return
+            self._send(206, content[start:], "application/octet-stream")
+        else:
+            self._send(200, content, "application/octet-stream")
+
+    def _send(self, status, body, content_type="application/json", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.add_bytes(len(body))
+
+
+class FakeSlackServer(ThreadingHTTPServer):
+    """Serve a Workspace on a local port (in a background thread while used as a context manager).
+
+    `latency` seconds are added to every request; with `rate_limit_every=N`
+    every Nth API call is answered with 429 and `Retry-After: retry_after`.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, workspace, host="127.0.0.1", port=0, latency=0.0, rate_limit_every=0, retry_after=1):
+        super().__init__((host, port), FakeSlackHandler)
+        self.workspace = workspace
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self._thread = None
+        self.reset_stats()
+
+    def handle_error(self, request, client_address):
+        # Clients that go away mid-response (e.g. an interrupted backup) are expected
+        pass
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def api_url(self):
+        return f"{self.base_url}/api/"
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+    # Statistics
+
+    def reset_stats(self):
+        with self._lock:
+            self.calls = Counter()
+            self.bytes_sent = 0
+            self._api_calls = 0
+
+    def count(self, method):
+        """Count a request; returns True for API calls."""
+        with self._lock:
+            self.calls[method] += 1
+            if method in ("files", "rate_limited"):
+                return False
+            self._api_calls += 1
+            return True
+
+    def should_rate_limit(self):
+        with self._lock:
+            return bool(self.rate_limit_every) and self._api_calls % self.rate_limit_every == 0
+
+    def add_bytes(self, count):
+        with self._lock:
+            self.bytes_sent += count
+
+    def stats(self):
+        with self._lock:
+            return {
+                "api_calls": self._api_calls,
+                "calls": dict(self.calls),
+                "bytes_sent": self.bytes_sent,
+            }
+
+    # Web API methods
+
+    def _page(self, items, params, default_limit=DEFAULT_LIMIT):
+        start = int(params.get("cursor") or 0)
+        limit = int(params.get("limit") or default_limit)
+        end = start + limit
+        return items[start:end], {"next_cursor": str(end) if end < len(items) else ""}
+
+    def _absolute(self, message):
+        if "files" not in message:
+            return message
+        files = [dict(f, url_private=self.base_url + f["url_private"]) for f in message["files"]]
+        return dict(message, files=files)
+
+    def api_conversations_list(self, params):
+        types = (params.get("types") or "public_channel").split(",")
+        channels = [
+            {key: value for key, value in channel.items() if key != "type"}
+            for channel in self.workspace.channels
+            if channel["type"] in types
+        ]
+        page, metadata = self._page(channels, params)
+        return {"ok": True, "channels": page, "response_metadata": metadata}
+
+    def api_conversations_history(self, params):
+        history = self.workspace.history.get(params.get("channel"))
+        if history is None:
+            return {"ok": False, "error": "channel_not_found"}
+        oldest = float(params.get("oldest") or 0)
+        latest = float(params.get("latest") or "inf")
+        if oldest or params.get("latest"):
+            history = [m for m in history if oldest < float(m["ts"]) < latest]
+        page, metadata = self._page(history, params)
+        return {
+            "ok": True,
+            "messages": [self._absolute(m) for m in page],
+            "has_more": bool(metadata["next_cursor"]),
+            "response_metadata": metadata,
+        }
+
+    def api_conversations_replies(self, params):
+        thread = self.workspace.replies.get((params.get("channel"), params.get("ts")))
+        if thread is None:
+            return {"ok": False, "error": "thread_not_found"}
+        page, metadata = self._page(thread, params, default_limit=10)
+        return {"ok": True, "messages": page, "response_metadata": metadata}
+
+    def api_users_list(self, params):
+        page, metadata = self._page(self.workspace.users, params)
+        return {"ok": True, "members": page, "response_metadata": metadata}
+
+    def api_users_info(self, params):
+        for user in self.workspace.users:
+            if user["id"] == params.get("user"):
+                return {"ok": True, "user": user}
+        return {"ok": False, "error": "user_not_found"}
@@ -1,43 +1,580 @@
-from src.api import SlackAPI
-from src.config import load_config
-from src.message_processor import fetch_and_save_messages
+import os
+import zlib
+import time
+import sqlite3
+import cProfile
+import argparse
+import threading
+
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from src.api import SlackAPI, slack_api_options
+from src.channel_directory import CONVERSATION_TYPES, ChannelDirectory, conversation_type
+from src.checkpoint import Checkpoint
+from src.config import load_config, load_profiles
+from src.downloader import DownloadPool
+from src.message_processor import ChannelContext, fetch_and_save_messages, render_saved_messages
+from src.metrics import METRICS, Metrics, write_metrics
+from src.planner import load_plan, plan_conversation, save_plan
+from src.raw_store import RawStore
+from src.search_index import SearchIndex
+from src.sync_state import SyncState
+
+try:
+    from src.async_engine import run_jobs_async
+except ImportError:  # The asyncio engine needs the optional aiohttp package
+    run_jobs_async = None
+
+try:
+    from src.analytics import export_analytics
+except ImportError:  # The columnar export needs the optional pyarrow package
+    export_analytics = None
+
+
+# Function to tell whether a conversation belongs to this process's shard of the workspace
+# Public channels are spread over every token of a workspace by a stable hash of
+# their ID. Other conversations are only visible to some of the tokens (and
+# direct messages are named after the other user), so the first token keeps them all.
+def in_shard(channel_id, channel_type, shard):
+    if shard is None:
+        return True
+    index, count = shard
+    if channel_type != "public_channel":
+        return index == 0
+    return zlib.crc32(channel_id.encode("utf-8")) % count == index
+
+
+# Function to collect the conversations selected by Backup_List as (id, name, type, channel) jobs
+# One paginated conversations.list sweep covers every conversation type; the
+# listing is stored in the channel directory.
+def collect_backup_jobs(slack, config, directory=None):
+    channels = slack.get_conversations_list(
+        types=",".join(CONVERSATION_TYPES), limit=config["conversations_page_size"]
+    )
+    if channels is None:
+        return []  # Error already reported
+    if directory is not None:
+        directory.update(channels)
+
+    jobs = []
+    for channel in channels:
+        channel_type = conversation_type(channel)
+        if not in_shard(channel["id"], channel_type, config["shard"]):
+            continue  # Backed up by another token of the workspace
+        if channel_type == "im":
+            # Direct messages (im) are named after the other user (from the user directory)
+            name = slack.get_user_display_name(channel["user"])
+        else:
+            # Public channels, private channels and multiparty direct messages (mpim)
+            name = channel["name"]
+        if config["backup_list"] == ["all"] or name in config["backup_list"]:
+            jobs.append((channel["id"], name, channel_type, channel))
+
+    # Same order as before: public, private, mpim, then direct messages
+    jobs.sort(key=lambda job: CONVERSATION_TYPES.index(job[2]))
+    return jobs
+
+
+# Function to tell whether a conversation has had no activity since its last backup
+def is_unchanged(job, directory, sync_state, config):
+    channel_id, channel_name, channel_type, _ = job
+    return (
+        directory.is_unchanged(channel_id)
+        and sync_state.get_latest(channel_id) is not None
+        and os.path.exists(ChannelContext(channel_id, channel_name, channel_type, config).file_path)
+    )
+
+
+# Function to order jobs so the biggest conversations start first
+# (estimated seconds from a saved `--plan`, then messages saved by earlier runs,
+# then member count as a tie-breaker)
+def schedule_jobs(jobs, sync_state, plan=None):
+    plan = plan or {}
+    return sorted(
+        jobs,
+        key=lambda job: (
+            plan.get(job[0], 0),
+            sync_state.get_message_count(job[0]),
+            job[3].get("num_members", 0),
+        ),
+        reverse=True,
+    )
+
+
+# Function to back up several conversations at once with a pool of worker threads
+def run_jobs_concurrently(
+    jobs, slack, sync_state, config, downloads, checkpoint=None, search_index=None
+):
+    print_lock = threading.Lock()
+    done = 0
+
+    def run(job):
+        channel_id, channel_name, channel_type, channel = job
+        return fetch_and_save_messages(
+            channel_id,
+            channel_name,
+            channel_type,
+            slack=slack,
+            sync_state=sync_state,
+            config=config,
+            progress=False,
+            downloads=downloads,
+            checkpoint=checkpoint,
+            search_index=search_index,
+            created=channel.get("created"),
+        )
+
+    with ThreadPoolExecutor(max_workers=config["workers"]) as executor:
+        futures = {executor.submit(run, job): job for job in jobs}
+        for future in as_completed(futures):
+            channel_name = futures[future][1]
+            try:
+                count = future.result()
+                status = (
+                    f"Saved {count} messages from {channel_name}"
+                    if count is not None
+                    else f"Failed to back up {channel_name}"
+                )
+            except Exception as e:
+                status = f"Error backing up {channel_name}: {e}"
+            with print_lock:
+                done += 1
+                print(f"[{done}/{len(jobs)}] {status}")
 
 
 # Fetch all channels and messages
-def backup_all_messages(config):
-    slack = SlackAPI(config["slack_token"])
+# With `resume=True` an interrupted run is continued from its checkpoint: finished
+# conversations are skipped and half-fetched ones pick up at their saved cursor.
+# Returns the run's metrics summary.
+def backup_all_messages(config, resume=False):
+    METRICS.reset()
+    slack = SlackAPI(config["slack_token"], **slack_api_options(config))
 
     slack.test_token()
 
-    # Fetch public channels
-    public_channels = slack.get_conversations_list(type="public_channel")
-    for channel in public_channels:
-        if config["backup_list"] == ["all"] or channel["name"] in config["backup_list"]:
-            fetch_and_save_messages(channel["id"], channel["name"], "public_channel")
-
-    # Fetch private channels
-    private_channels = slack.get_conversations_list(type="private_channel")
-    for channel in private_channels:
-        if config["backup_list"] == ["all"] or channel["name"] in config["backup_list"]:
-            fetch_and_save_messages(channel["id"], channel["name"], "private_channel")
-
-    # Fetch multiparty direct messages (mpim)
-    mpim_channels = slack.get_conversations_list(type="mpim")
-    for channel in mpim_channels:
-        if config["backup_list"] == ["all"] or channel["name"] in config["backup_list"]:
-            fetch_and_save_messages(channel["id"], channel["name"], "mpim")
-
-    # Fetch direct messages (im)
-    im_channels = slack.get_conversations_list(type="im")
-    for channel in im_channels:
-        user_display_name = slack.get_user_display_name(channel["user"])
-        if (
-            config["backup_list"] == ["all"]
-            or user_display_name in config["backup_list"]
-        ):
-            fetch_and_save_messages(channel["id"], user_display_name, "im")
+    # Resolve every user name up front (one paginated users.list sweep)
+    slack.load_user_directory()
+
+    # Newest message already backed up per channel, shared by every channel below
+    sync_state = SyncState(os.path.join(config["state_dir"], "sync_state.json"))
+
+    if config["engine"] == "async" and run_jobs_async is None:
+        print("Engine = async needs the aiohttp package: pip install aiohttp")
+        exit(-1)
+    if config["analytics_export"] and not can_export_analytics(config):
+        exit(-1)
+
+    # One attachment download pool (and HTTP session) for the whole run
+    downloads = None
+    if config["engine"] != "async":
+        downloads = DownloadPool(config["slack_token"], config["download_workers"])
+
+    # Full-text index filled as messages are rendered (optional)
+    search_index = None
+    if config["search_index"]:
+        search_index = SearchIndex(os.path.join(config["state_dir"], "search.db"))
+
+    # Progress of this run, saved as it goes so an interrupted run can be resumed
+    checkpoint = Checkpoint(shard_state_path(config, "checkpoint.json"))
+    if resume:
+        # Continue in the mode the interrupted run was started with
+        config = dict(config, full_resync=checkpoint.full_resync)
+    else:
+        checkpoint.start(full_resync=config["full_resync"])
+
+    # Every conversation in one paginated sweep, cached with its last activity
+    directory = ChannelDirectory(os.path.join(config["state_dir"], "channels.json"))
+    jobs = collect_backup_jobs(slack, config, directory)
+
+    # The longest conversations of a saved `--plan` are started first
+    plan_file = os.path.join(config["state_dir"], "plan.json")
+    plan = load_plan(plan_file)
+    pending = [job for job in jobs if not checkpoint.is_completed(job[0])]
+    if len(pending) < len(jobs):
+        print(f"Resuming: {len(jobs) - len(pending)} of {len(jobs)} conversations already backed up")
+
+    # Conversations with no activity since their last backup need no history call
+    if config["skip_unchanged"] and not config["full_resync"]:
+        unchanged = [job for job in pending if is_unchanged(job, directory, sync_state, config)]
+        if unchanged:
+            print(f"Skipping {len(unchanged)} conversations without new activity")
+            pending = [job for job in pending if job not in unchanged]
+
+    try:
+        if config["engine"] == "async":
+            # Every conversation at once on one event loop, bounded by Async_Concurrency
+            run_jobs_async(
+                schedule_jobs(pending, sync_state, plan),
+                slack,
+                sync_state,
+                config,
+                checkpoint,
+                search_index,
+            )
+        elif config["workers"] > 1:
+            run_jobs_concurrently(
+                schedule_jobs(pending, sync_state, plan),
+                slack,
+                sync_state,
+                config,
+                downloads,
+                checkpoint,
+                search_index,
+            )
+        else:
+            for channel_id, channel_name, channel_type, channel in schedule_jobs(pending, sync_state, plan):
+                fetch_and_save_messages(
+                    channel_id,
+                    channel_name,
+                    channel_type,
+                    slack=slack,
+                    sync_state=sync_state,
+                    config=config,
+                    downloads=downloads,
+                    checkpoint=checkpoint,
+                    search_index=search_index,
+                    created=channel.get("created"),
+                )
+    finally:
+        if downloads is not None:
+            downloads.close()
+        if search_index is not None:
+            search_index.close()
+
+    # Remember the activity each conversation was backed up at
+    for job in pending:
+        if checkpoint.is_completed(job[0]):
+            directory.mark_synced(job[0])
+    directory.save()
+
+    # Keep the checkpoint while any conversation failed, so --resume only retries those
+    # (the plan is used up by the run it was made for)
+    if all(checkpoint.is_completed(job[0]) for job in pending):
+        checkpoint.clear()
+        if plan is not None:
+            try:
+                os.remove(plan_file)
+            except FileNotFoundError:
+                pass  # Removed by another shard of the workspace
+
+    # Persist names resolved individually during this run
+    slack.users.save()
+
+    # Bring the columnar export up to date with the months this run changed
+    if config["analytics_export"]:
+        with METRICS.timer("write", phase="analytics"):
+            export_analytics(config)
+
+    # Run summary for monitoring (JSON plus a Prometheus node_exporter textfile)
+    return write_metrics(
+        config["metrics_file"] or shard_state_path(config, "metrics.json"),
+        config["prometheus_textfile"] or shard_state_path(config, "metrics.prom"),
+    )
+
+
+# Function to format a byte count for the plan table
+def format_bytes(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+# Function to format a duration for the plan table
+def format_duration(seconds):
+    minutes, seconds = divmod(round(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m{seconds:02d}s"
+
+
+# Estimate a backup without running it (`--plan`): only the conversation listing and a
+# few of the newest history pages of each conversation are fetched, nothing is
+# downloaded or rendered. The plan is printed longest first and saved to
+# State_Directory/plan.json, where the next backup picks up its order.
+def plan_backup(config):
+    slack = SlackAPI(config["slack_token"], **slack_api_options(config))
+    slack.test_token()
+    slack.load_user_directory()
+    sync_state = SyncState(os.path.join(config["state_dir"], "sync_state.json"))
+
+    # The same selection as backup_all_messages (the listing is not saved)
+    directory = ChannelDirectory(os.path.join(config["state_dir"], "channels.json"))
+    jobs = collect_backup_jobs(slack, config, directory)
+    unchanged = []
+    if config["skip_unchanged"] and not config["full_resync"]:
+        unchanged = [job for job in jobs if is_unchanged(job, directory, sync_state, config)]
+        jobs = [job for job in jobs if job not in unchanged]
+
+    with ThreadPoolExecutor(max_workers=config["workers"]) as executor:
+        conversations = list(
+            executor.map(lambda job: plan_conversation(slack, job, sync_state, config), jobs)
+        )
+    plan = save_plan(
+        os.path.join(config["state_dir"], "plan.json"), conversations, config["rate_limit_multiplier"]
+    )
+
+    print(
+        f"{'Conversation':<30} {'Messages':>9} {'Threads':>8} {'Files':>6} "
+        f"{'Attachments':>11} {'API calls':>9} {'Time':>8}"
+    )
+    for conversation in plan["conversations"]:
+        name = conversation["name"][:30]
+        if "error" in conversation:
+            print(f"{name:<30} error: {conversation['error']}")
+            continue
+        approx = "" if conversation["exact"] else "~"
+        print(
+            f"{name:<30} {approx + str(conversation['messages']):>9} {conversation['threads']:>8} "
+            f"{conversation['files']:>6} {format_bytes(conversation['attachment_bytes']):>11} "
+            f"{sum(conversation['api_calls'].values()):>9} {format_duration(conversation['seconds']):>8}"
+        )
+    totals = plan["totals"]
+    if unchanged:
+        print(f"{len(unchanged)} conversations without new activity are skipped")
+    print(
+        f"Total: {len(conversations)} conversations, {totals['messages']} messages, "
+        f"{totals['threads']} threads, {totals['files']} files ({format_bytes(totals['attachment_bytes'])}), "
+        f"{sum(totals['api_calls'].values())} API calls, at least {format_duration(totals['seconds'])} "
+        f"under the rate limits (plus attachment downloads)"
+    )
+    return plan
+
+
+# Function to tell whether the columnar export can run, explaining why not
+def can_export_analytics(config):
+    if export_analytics is None:
+        print("The analytics export needs the pyarrow package: pip install pyarrow")
+        return False
+    if not config["keep_raw_messages"]:
+        print("The analytics export is built from the raw message store: set Keep_Raw_Messages = True")
+        return False
+    return True
+
+
+# Print the messages matching a full-text query, most relevant first
+def search_messages(config, query, channel=None, user=None, limit=20):
+    db_path = os.path.join(config["state_dir"], "search.db")
+    if not os.path.exists(db_path):
+        print("No search index yet: set Search_Index = True in config.txt and run a backup.")
+        return []
+    search_index = SearchIndex(db_path)
+    try:
+        start = time.perf_counter()
+        results = search_index.search(query, channel=channel, user=user, limit=limit)
+        elapsed = (time.perf_counter() - start) * 1000
+    except sqlite3.Error as e:
+        print(f"Invalid search query {query!r}: {e}")
+        return []
+    finally:
+        search_index.close()
+    for result in results:
+        time_str = datetime.fromtimestamp(float(result["ts"])).strftime("%H:%M:%S")
+        print(f"{result['date']} {time_str} #{result['channel']} {result['user']}: {result['snippet']}")
+    print(f"{len(results)} results in {elapsed:.1f} ms")
+    return results
+
+
+# Function to get the path of a state file each process of a sharded workspace keeps for itself
+# Everything else in State_Directory (sync state, raw store, search index, user
+# and channel directories) is shared by the workspace's processes.
+def shard_state_path(config, file_name):
+    if config["shard"] is None:
+        return os.path.join(config["state_dir"], file_name)
+    return os.path.join(config["state_dir"], f"shard-{config['shard'][0]}", file_name)
+
+
+# Function to load the config of a workspace profile (in its own process)
+# The process works in the profile's directory, so the relative output folders
+# of its config resolve there.
+def load_workspace_config(profile, overrides=None):
+    os.makedirs(profile["directory"], exist_ok=True)
+    os.chdir(profile["directory"])
+    config = dict(load_config(profile["config_file"]), **(overrides or {}))
+    if profile["rate_limit_multiplier"] is not None:
+        config["rate_limit_multiplier"] = profile["rate_limit_multiplier"]
+    return config
+
+
+# Function to back up one token's shard of a workspace profile (runs in its own process)
+# Several tokens of one workspace share its state directory; each only keeps
+# its checkpoint and metrics apart, and the analytics export is left to
+# run_workspaces once they are all done.
+def run_workspace_shard(profile, index, overrides=None, resume=False):
+    config = load_workspace_config(profile, overrides)
+    config["slack_token"] = profile["tokens"][index]
+    count = len(profile["tokens"])
+    if count > 1:
+        config["shard"] = (index, count)
+        config["analytics_export"] = False
+    return backup_all_messages(config, resume=resume)
+
+
+# Function to update the analytics export of a sharded workspace profile (in its own process)
+def export_workspace(profile, overrides=None):
+    config = load_workspace_config(profile, overrides)
+    if config["analytics_export"] and can_export_analytics(config):
+        export_analytics(config)
+
+
+# Function to total a metrics summary's counter (over all labels)
+def counter_total(summary, name):
+    return sum(c["value"] for c in summary["counters"] if c["name"] == name)
+
+
+# Back up every workspace profile at once: one process per token, each with its own
+# rate limiter, and print a merged summary (also written to .slackdown/workspaces.*)
+def run_workspaces(profiles_file, overrides=None, resume=False):
+    profiles = load_profiles(profiles_file)
+    shards = [(profile, index) for profile in profiles for index in range(len(profile["tokens"]))]
+    if not shards:
+        print(f"No workspace with a User_OAuth_Token in {profiles_file}")
+        return None
+
+    merged = Metrics()
+    lines = []
+    with ProcessPoolExecutor(max_workers=len(shards)) as executor:
+        futures = {
+            executor.submit(run_workspace_shard, profile, index, overrides, resume): (profile, index)
+            for profile, index in shards
+        }
+        for future in as_completed(futures):
+            profile, index = futures[future]
+            label = f"{profile['name']} [{index + 1}/{len(profile['tokens'])}]"
+            try:
+                summary = future.result()
+            except (Exception, SystemExit) as e:
+                lines.append(f"{label}: failed ({e!r})")
+                merged.incr("shard_failures", workspace=profile["name"])
+                continue
+            merged.merge(summary, workspace=profile["name"], shard=str(index))
+            lines.append(
+                f"{label}: {counter_total(summary, 'channels')} conversations, "
+                f"{counter_total(summary, 'messages')} messages, "
+                f"{counter_total(summary, 'channel_failures')} failed "
+                f"in {summary['duration_seconds']:.1f}s"
+            )
+
+        # Workspaces backed up by several tokens are exported once all of them are done
+        exports = {
+            executor.submit(export_workspace, profile, overrides): profile
+            for profile in profiles
+            if len(profile["tokens"]) > 1
+        }
+        for future in as_completed(exports):
+            try:
+                future.result()
+            except (Exception, SystemExit) as e:
+                lines.append(f"{exports[future]['name']}: analytics export failed ({e!r})")
+
+    summary = write_metrics(
+        os.path.join(".slackdown", "workspaces.json"), os.path.join(".slackdown", "workspaces.prom"), merged
+    )
+    for line in sorted(lines):
+        print(line)
+    print(
+        f"Total: {counter_total(summary, 'channels')} conversations, "
+        f"{counter_total(summary, 'messages')} messages, "
+        f"{counter_total(summary, 'channel_failures')} failed conversations, "
+        f"{counter_total(summary, 'shard_failures')} failed processes "
+        f"in {summary['duration_seconds']:.1f}s"
+    )
+    return summary
+
+
+# Rebuild every Markdown file from the raw message store, one process per channel
+def render_all_messages(config):
+    channel_ids = RawStore(os.path.join(config["state_dir"], "raw")).list_channels()
+    with ProcessPoolExecutor(max_workers=config["render_workers"]) as executor:
+        futures = {
+            executor.submit(render_saved_messages, channel_id, config): channel_id
+            for channel_id in channel_ids
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                status = f"Rendered {future.result()} messages from {futures[future]}"
+            except Exception as e:
+                status = f"Error rendering {futures[future]}: {e}"
+            print(f"[{done}/{len(channel_ids)}] {status}")
 
 
 if __name__ == "__main__":
-    config = load_config()
-    backup_all_messages(config)
+    parser = argparse.ArgumentParser(description="Back up Slack conversations to Markdown.")
+    parser.add_argument(
+        "command",
+        nargs="?",
+        default="backup",
+        choices=["backup", "render", "search", "export", "workspaces"],
+        help="backup (default): fetch from Slack; render: rebuild the Markdown from the raw message store without network access; search: query the full-text index; export: update the Parquet analytics export from the raw message store; workspaces: back up every workspace of the profiles file.",
+    )
+    parser.add_argument("query", nargs="*", help="Search terms (FTS5 query syntax) for the search command.")
+    parser.add_argument("--channel", help="search: only messages from this conversation.")
+    parser.add_argument("--user", help="search: only messages from this user (display name).")
+    parser.add_argument("--limit", type=int, default=20, help="search: maximum number of results (default: 20).")
+    parser.add_argument(
+        "--profiles",
+        default="profiles.txt",
+        help="workspaces: the profiles file listing every workspace and its tokens (default: profiles.txt).",
+    )
+    parser.add_argument(
+        "--full-resync",
+        action="store_true",
+        help="Refetch the whole history of every conversation instead of only new messages.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Number of conversations to back up (or render) concurrently (overrides Workers / Render_Workers in config.txt).",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=["threads", "async"],
+        help="Backup engine: worker threads or asyncio (overrides Engine in config.txt).",
+    )
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        help="backup: only estimate messages, threads, attachment volume, API calls and time per conversation from a sample of their history, and save the order for the next backup.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue an interrupted backup from its last checkpoint instead of starting over.",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="FILE",
+        help="Run under cProfile and save the stats to FILE (inspect with `python -m pstats FILE`).",
+    )
+    args = parser.parse_args()
+
+    # Command-line settings override config.txt (and every workspace's config)
+    overrides = {}
+    if args.full_resync:
+        overrides["full_resync"] = True
+    if args.workers:
+        overrides["workers"] = overrides["render_workers"] = args.workers
+    if args.engine:
+        overrides["engine"] = args.engine
+    config = dict(load_config(), **overrides)
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler:
+        profiler.enable()
+    try:
+        if args.command == "render":
+            render_all_messages(config)
+        elif args.command == "search":
+            search_messages(config, " ".join(args.query), args.channel, args.user, args.limit)
+        elif args.command == "export":
+            if can_export_analytics(config):
+                export_analytics(config)
+        elif args.command == "workspaces":
+            run_workspaces(args.profiles, overrides, resume=args.resume)
+        elif args.plan:
+            plan_backup(config)
+        else:
+            backup_all_messages(config, resume=args.resume)
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
@@ -0,0 +1,208 @@
+import os
+import hashlib
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from datetime import datetime, timezone
+from src.helper import load_json, save_json
+from src.raw_store import REPLIES_KEY, RawStore
+from src.threads import is_thread_parent
+from src.user_directory import UserDirectory
+
+
+# Bumped whenever the tables change in a way that must rewrite every partition
+EXPORT_VERSION = 1
+
+TIME = pa.timestamp("us", tz="UTC")
+
+# One Parquet dataset per table, partitioned as <table>/channel=<id>/month=<YYYY-MM>
+SCHEMAS = {
+    "messages": pa.schema(
+        [
+            ("channel_name", pa.string()),
+            ("channel_type", pa.string()),
+            ("ts", pa.string()),
+            ("time", TIME),
+            ("date", pa.string()),
+            ("user_id", pa.string()),
+            ("text", pa.string()),
+            ("thread_ts", pa.string()),
+            ("reply_count", pa.int32()),
+            ("reaction_count", pa.int32()),
+            ("file_count", pa.int32()),
+            ("edited_ts", pa.string()),
+        ]
+    ),
+    "replies": pa.schema(
+        [
+            ("thread_ts", pa.string()),
+            ("ts", pa.string()),
+            ("time", TIME),
+            ("user_id", pa.string()),
+            ("text", pa.string()),
+        ]
+    ),
+    "reactions": pa.schema(
+        [
+            ("ts", pa.string()),
+            ("name", pa.string()),
+            ("count", pa.int32()),
+        ]
+    ),
+    "files": pa.schema(
+        [
+            ("ts", pa.string()),
+            ("file_id", pa.string()),
+            ("name", pa.string()),
+            ("mimetype", pa.string()),
+            ("size", pa.int64()),
+            ("mode", pa.string()),
+        ]
+    ),
+}
+
+
+# Function to convert a Slack ts to a UTC datetime
+def ts_time(ts):
+    return datetime.fromtimestamp(float(ts), tz=timezone.utc)
+
+
+# Function to turn one stored day of a conversation into table rows
+def day_rows(info, date, messages):
+    rows = {table: [] for table in SCHEMAS}
+    for message in messages:
+        ts = message.get("ts")
+        reactions = message.get("reactions") or []
+        files = message.get("files") or []
+        rows["messages"].append(
+            {
+                "channel_name": info["name"],
+                "channel_type": info["type"],
+                "ts": ts,
+                "time": ts_time(ts),
+                "date": date,
+                "user_id": message.get("user"),
+                "text": message.get("text"),
+                "thread_ts": message.get("thread_ts"),
+                "reply_count": message.get("reply_count"),
+                "reaction_count": sum(r.get("count") or 0 for r in reactions),
+                "file_count": len(files),
+                "edited_ts": (message.get("edited") or {}).get("ts"),
+            }
+        )
+        if is_thread_parent(message):
+            for reply in message.get(REPLIES_KEY, []):
+                rows["replies"].append(
+                    {
+                        "thread_ts": ts,
+                        "ts": reply.get("ts"),
+                        "time": ts_time(reply.get("ts")),
+                        "user_id": reply.get("user"),
+                        "text": reply.get("text"),
+                    }
+                )
+        for reaction in reactions:
+            rows["reactions"].append({"ts": ts, "name": reaction.get("name"), "count": reaction.get("count")})
+        for file_info in files:
+            rows["files"].append(
+                {
+                    "ts": ts,
+                    "file_id": file_info.get("id"),
+                    "name": file_info.get("name"),
+                    "mimetype": file_info.get("mimetype"),
+                    "size": file_info.get("size"),
+                    "mode": file_info.get("mode"),
+                }
+            )
+    return rows
+
+
+# Function to get the folder of one partition of a table
+def partition_path(analytics_dir, table, channel_id, month):
+    return os.path.join(analytics_dir, table, f"channel={channel_id}", f"month={month}")
+
+
+# Function to write (or remove, when empty) one partition of a table
+def write_partition(analytics_dir, table, channel_id, month, rows):
+    folder = partition_path(analytics_dir, table, channel_id, month)
+    file_path = os.path.join(folder, "part-0.parquet")
+    if not rows:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        return
+    os.makedirs(folder, exist_ok=True)
+    temp_path = f"{file_path}.{os.getpid()}.tmp"
+    pq.write_table(pa.Table.from_pylist(rows, schema=SCHEMAS[table]), temp_path)
+    os.replace(temp_path, file_path)
+
+
+# Function to fingerprint the stored days of each month of a conversation
+# A month is exported again only when one of its day files was written since.
+def month_signatures(raw_store, channel_id, days_by_month):
+    signatures = {}
+    for month, dates in days_by_month.items():
+        days = [[date, *raw_store.day_signature(channel_id, date)] for date in dates]
+        signatures[month] = hashlib.sha256(f"{EXPORT_VERSION}:{days}".encode("utf-8")).hexdigest()
+    return signatures
+
+
+# Function to export the changed months of one conversation from the raw store
+# `exported` is the conversation's {month: signature} from the last export and
+# is updated in place. Returns the number of months written.
+def export_channel(raw_store, channel_id, analytics_dir, exported):
+    info = raw_store.read_channel(channel_id)
+    days_by_month = {}
+    for date in raw_store.list_days(channel_id):
+        days_by_month.setdefault(date[:7], []).append(date)
+    signatures = month_signatures(raw_store, channel_id, days_by_month)
+    written = 0
+    for month in sorted(set(signatures) | set(exported)):
+        if exported.get(month) == signatures.get(month):
+            continue
+        rows = {table: [] for table in SCHEMAS}
+        for date in days_by_month.get(month, []):
+            for table, day in day_rows(info, date, raw_store.read_day(channel_id, date)).items():
+                rows[table].extend(day)
+        for table in SCHEMAS:
+            write_partition(analytics_dir, table, channel_id, month, rows[table])
+        if month in signatures:
+            exported[month] = signatures[month]
+        else:
+            exported.pop(month, None)  # No longer stored
+        written += 1
+    return written
+
+
+# Function to write the user ID -> display name table used to label the other tables
+def write_users(analytics_dir, users):
+    names = users.names()
+    os.makedirs(analytics_dir, exist_ok=True)
+    file_path = os.path.join(analytics_dir, "users.parquet")
+    temp_path = f"{file_path}.{os.getpid()}.tmp"
+    table = pa.table(
+        {"user_id": list(names), "name": list(names.values())},
+        schema=pa.schema([("user_id", pa.string()), ("name", pa.string())]),
+    )
+    pq.write_table(table, temp_path)
+    os.replace(temp_path, file_path)
+
+
+# Function to bring the columnar export up to date with the raw message store
+# Only months of conversations whose stored days changed since the last export
+# are rewritten, so it is cheap to run after every backup. Returns the number
+# of (conversation, month) partitions written.
+def export_analytics(config):
+    raw_store = RawStore(os.path.join(config["state_dir"], "raw"))
+    state_file = os.path.join(config["state_dir"], "analytics.json")
+    state = load_json(state_file, {}) or {}
+    analytics_dir = config["analytics_dir"]
+
+    written = 0
+    channel_ids = raw_store.list_channels()
+    for channel_id in channel_ids:
+        written += export_channel(raw_store, channel_id, analytics_dir, state.setdefault(channel_id, {}))
+        save_json(state_file, state)
+    write_users(analytics_dir, UserDirectory(os.path.join(config["state_dir"], "users.json")))
+    print(f"Exported {written} changed months of {len(channel_ids)} conversations to {analytics_dir}")
+    return written
@@ -1,64 +1,301 @@
 import os
 import time
+import asyncio
 import certifi
+import threading
 
 from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
+from src.metrics import METRICS
+from src.user_directory import UserDirectory, display_name_of
+
+
+# Requests per minute allowed by each Slack Web API rate-limit tier
+TIER_LIMITS = {1: 1, 2: 20, 3: 50, 4: 100}
+
+# Rate-limit tier of every Web API method SlackDown calls
+METHOD_TIERS = {
+    "users_list": 2,
+    "users_info": 4,
+    "conversations_list": 2,
+    "conversations_history": 3,
+    "conversations_replies": 3,
+}
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at `rate_per_minute`.
+
+    `reserve()` takes a token immediately (the balance may go negative) and
+    returns how long the caller has to wait before using it, so waiting can be
+    done outside the lock with either `time.sleep` or `asyncio.sleep`.
+    """
+
+    def __init__(self, rate_per_minute, burst=None):
+        self.max_rate = rate_per_minute / 60.0
+        self.rate = self.max_rate
+        self.capacity = burst or max(1, rate_per_minute // 10)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait, self.blocked_until - now)
+
+    def penalize(self, retry_after):
+        """Block the bucket for `retry_after` seconds and slow it down after a 429."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.blocked_until = max(self.blocked_until, now + retry_after)
+            self.rate = max(self.max_rate / 4, self.rate * 0.75)
+            self.tokens = min(self.tokens, 0.0)
+
+    def recover(self):
+        """Creep back towards the nominal rate after a successful call."""
+        with self._lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate * 1.05)
+
+
+class RateLimiter:
+    """One token bucket per Slack rate-limit tier, shared by every caller.
+
+    Safe to share between threads; async code uses `acquire_async`.
+    """
+
+    def __init__(self, tier_limits=TIER_LIMITS, max_retries=5):
+        self.buckets = {tier: TokenBucket(limit) for tier, limit in tier_limits.items()}
+        self.max_retries = max_retries
+
+    def bucket_for(self, method):
+        return self.buckets[METHOD_TIERS.get(method, 3)]
+
+    def acquire(self, method):
+        wait = self.bucket_for(method).reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, method):
+        wait = self.bucket_for(method).reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def call(self, method, func, **kwargs):
+        """Call a WebClient method under the limiter, retrying on HTTP 429."""
+        for attempt in range(self.max_retries + 1):
+            with METRICS.timer("rate_limit_wait", method=method):
+                self.acquire(method)
+            try:
+                with METRICS.timer("api", method=method):
+                    response = func(**kwargs)
+            except SlackApiError as e:
+                retry_after = retry_after_of(e)
+                if retry_after is None or attempt == self.max_retries:
+                    METRICS.incr("api_errors", method=method)
+                    raise
+                METRICS.incr("api_rate_limited", method=method)
+                self.bucket_for(method).penalize(retry_after)
+                continue
+            self.bucket_for(method).recover()
+            return response
+
+    async def call_async(self, method, func, **kwargs):
+        """Await an AsyncWebClient method under the limiter, retrying on HTTP 429."""
+        for attempt in range(self.max_retries + 1):
+            with METRICS.timer("rate_limit_wait", method=method):
+                await self.acquire_async(method)
+            try:
+                with METRICS.timer("api", method=method):
+                    response = await func(**kwargs)
+            except SlackApiError as e:
+                retry_after = retry_after_of(e)
+                if retry_after is None or attempt == self.max_retries:
+                    METRICS.incr("api_errors", method=method)
+                    raise
+                METRICS.incr("api_rate_limited", method=method)
+                self.bucket_for(method).penalize(retry_after)
+                continue
+            self.bucket_for(method).recover()
+            return response
+
+
+# Function to read the Retry-After delay of a rate-limited (HTTP 429) response
+def retry_after_of(error):
+    response = error.response
+    if getattr(response, "status_code", None) != 429:
+        return None
+    headers = getattr(response, "headers", None) or {}
+    retry_after = headers.get("Retry-After") or headers.get("retry-after") or 1
+    try:
+        return float(retry_after)
+    except (TypeError, ValueError):
+        return 1.0
+
+
+class HistoryPage(list):
+    """One page of `conversations.history` messages plus the cursor of the next page."""
+
+    def __init__(self, messages, next_cursor=None):
+        super().__init__(messages)
+        self.next_cursor = next_cursor or None
+
+
+# Function to build the SlackAPI keyword arguments described by a loaded config
+def slack_api_options(config):
+    tier_limits = {
+        tier: limit * config["rate_limit_multiplier"] for tier, limit in TIER_LIMITS.items()
+    }
+    return {
+        "user_cache_file": os.path.join(config["state_dir"], "users.json"),
+        "user_cache_ttl": config["user_cache_ttl"],
+        "rate_limiter": RateLimiter(tier_limits),
+        "base_url": config["api_base_url"],
+    }
 
 
 class SlackAPI:
-    def __init__(self, token):
+    def __init__(
+        self,
+        token,
+        user_cache_file=None,
+        user_cache_ttl=24 * 3600,
+        rate_limiter=None,
+        base_url=WebClient.BASE_URL,
+    ):
         os.environ["SSL_CERT_FILE"] = certifi.where()
 
         # Initialize Slack client
-        self.client = WebClient(token=token)
+        self.client = WebClient(token=token, base_url=base_url)
+
+        # Every call goes through the same per-tier limiter (shared across threads)
+        self.rate_limiter = rate_limiter or RateLimiter()
+
+        # User ID -> display name, shared by every lookup made through this client
+        self.users = UserDirectory(user_cache_file, user_cache_ttl)
+        self._first_users_page = None
+
+    # Function to call a Web API method through the rate limiter
+    def _call(self, method, **kwargs):
+        return self.rate_limiter.call(method, getattr(self.client, method), **kwargs)
 
     # Function to get user info by ID
     def get_user_display_name(self, user_id):
+        name = self.users.get(user_id)
+        if name is not None:
+            return name
         try:
-            user_info = self.client.users_info(user=user_id)
-            return (
-                user_info["user"]["profile"]["display_name"]
-                or user_info["user"]["profile"]["real_name"]
-            )
+            user_info = self._call("users_info", user=user_id)
+            name = display_name_of(user_info["user"])
+            self.users.set(user_id, name)
+            return name
         except SlackApiError as e:
             print(f"Error fetching user info: {e.response['error']}")
+            self.users.mark_unknown(user_id)
             return "Unknown User"
 
-    def get_conversations_list(self, type):
+    # Function to load every workspace member into the user directory
+    def load_user_directory(self, force=False):
+        if not force and not self.users.is_stale():
+            self._first_users_page = None
+            return
         try:
-            return self.client.conversations_list(types=type)["channels"]
+            # Reuse the first page already fetched by test_token, if any
+            response, self._first_users_page = self._first_users_page, None
+            cursor = None
+            while True:
+                if response is None:
+                    response = self._call("users_list", cursor=cursor, limit=200)
+                self.users.update_from_members(response["members"])
+                cursor = response.get("response_metadata", {}).get("next_cursor")
+                if not cursor:
+                    break
+                response = None
+            self.users.save()
         except SlackApiError as e:
-            print(f"Error fetching channels: {e.response['error']}")
+            print(f"Error fetching user list: {e.response['error']}")
 
-    def get_conversations_history(self, channel_id, channel_name):
+    # Function to list every conversation of the given (comma-separated) types, all pages
+    def get_conversations_list(self, types, limit=200):
         try:
-            messages = []
+            channels = []
             cursor = None
             while True:
-                response = self.client.conversations_history(
-                    channel=channel_id, cursor=cursor, limit=200
+                response = self._call(
+                    "conversations_list",
+                    types=types,
+                    cursor=cursor,
+                    limit=limit,
                 )
-                messages.extend(response["messages"])
+                channels.extend(response["channels"])
                 cursor = response.get("response_metadata", {}).get("next_cursor")
                 if not cursor:
                     break
-                time.sleep(1)  # Rate limit handling
-            return messages
+            return channels
         except SlackApiError as e:
-            print(f"Error fetching messages from {channel_name}: {e.response['error']}")
+            print(f"Error fetching channels: {e.response['error']}")
+
+    # Function to stream a channel's history one page (newest messages first) at a time
+    # Raises SlackApiError so callers can tell a partial history from a complete one.
+    # Each page is a HistoryPage carrying the cursor of the page after it, so a
+    # checkpointed backup can continue from `cursor` later.
+    def iter_conversations_history(self, channel_id, channel_name, oldest=None, cursor=None, latest=None):
+        # Only messages newer than `oldest` (exclusive) when syncing incrementally,
+        # and older than `latest` (exclusive) for one time window of the history
+        extra = {"oldest": oldest} if oldest else {}
+        if latest:
+            extra["latest"] = latest
+        while True:
+            response = self._call(
+                "conversations_history",
+                channel=channel_id,
+                cursor=cursor,
+                limit=200,
+                **extra,
+            )
+            cursor = response.get("response_metadata", {}).get("next_cursor")
+            yield HistoryPage(response["messages"], cursor)
+            if not cursor:
+                break
 
+    # Function to fetch every reply of a thread (all pages), parent message first
     def get_conversations_replies(self, channel_id, channel_name, thread_ts):
         try:
-            return self.client.conversations_replies(channel=channel_id, ts=thread_ts)[
-                "messages"
-            ]
+            messages = []
+            cursor = None
+            while True:
+                response = self._call(
+                    "conversations_replies",
+                    channel=channel_id,
+                    ts=thread_ts,
+                    cursor=cursor,
+                    limit=200,
+                )
+                # Later pages may repeat the parent message
+                messages.extend(
+                    m for m in response["messages"] if not (messages and m.get("ts") == thread_ts)
+                )
+                cursor = response.get("response_metadata", {}).get("next_cursor")
+                if not cursor:
+                    break
+            return messages
         except SlackApiError as e:
             print(f"Error fetching messages from {channel_name}: {e.response['error']}")
 
     def test_token(self):
         try:
-            self.client.users_list()
+            # Keep the first page so load_user_directory does not fetch it again
+            self._first_users_page = self._call("users_list", limit=200)
         except SlackApiError as e:
             if e.response["error"] == "invalid_auth":
                 print(
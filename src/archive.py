@@ -0,0 +1,349 @@
+import os
+import re
+import shutil
+import hashlib
+import itertools
+
+from src.helper import load_json, save_json
+
+
+# Function to format one day section exactly as it is stored in the Markdown file
+def format_day(date, messages):
+    return f"#### {date}\n" + "".join(f"{message}\n" for message in messages) + "\n"
+
+
+class MarkdownArchive:
+    """A channel's Markdown file plus a sidecar index of its day sections.
+
+    The index (`<file>.idx.json`) maps each `#### date` section to its byte
+    offset, length and SHA-256, so a sync only reads and rewrites the part of
+    the file from the first changed day onwards; that part is kept in a
+    `<file>.journal` until the write is done. The index is validated
+    against the file's size and mtime and rebuilt with one scan if the file
+    was changed by anything else.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.index_path = f"{file_path}.idx.json"
+        self.journal_path = f"{file_path}.journal"
+        replay_journal(file_path)
+        self.days = self._load_index()
+
+    def _file_stat(self):
+        stat = os.stat(self.file_path)
+        return stat.st_size, stat.st_mtime_ns
+
+    def _load_index(self):
+        if not os.path.exists(self.file_path):
+            return {}
+        index = load_json(self.index_path)
+        if index and [index.get("size"), index.get("mtime_ns")] == list(self._file_stat()):
+            return index["days"]
+        return self._scan()
+
+    def _scan(self):
+        """Index every day section of the file (one sequential read)."""
+        days = {}
+        current_date, start, sha256_hash = None, 0, None
+        offset = 0
+        with open(self.file_path, "rb") as file:
+            for line in file:
+                if line.startswith(b"#### "):
+                    if current_date is not None:
+                        days[current_date] = [start, offset - start, sha256_hash.hexdigest()]
+                    current_date = line[5:].strip().decode("utf-8")
+                    start, sha256_hash = offset, hashlib.sha256()
+                if sha256_hash is not None:
+                    sha256_hash.update(line)
+                offset += len(line)
+        if current_date is not None:
+            days[current_date] = [start, offset - start, sha256_hash.hexdigest()]
+        return days
+
+    def _save_index(self):
+        size, mtime_ns = self._file_stat()
+        save_json(self.index_path, {"size": size, "mtime_ns": mtime_ns, "days": self.days})
+
+    def _read_block(self, file, date):
+        offset, length, _ = self.days[date]
+        file.seek(offset)
+        return file.read(length).decode("utf-8")
+
+    def write_days(self, new_days, incremental=False, replace_from=None):
+        """Merge (date, messages) days in ascending order into the file.
+
+        By default new days replace every existing day from the first new date
+        (or from `replace_from`, if earlier) onwards. With `incremental=True` the
+        new messages are a delta newer than the file, so they are appended to
+        their day and existing days are kept. A day given as (date, None) is
+        known to be unchanged and keeps its current block. Leading days whose
+        content is unchanged are left untouched on disk. The replaced tail is
+        saved to a journal first, so an interrupted write is undone (here or
+        when the archive is next opened) instead of losing archived days.
+        Returns the number of days written.
+        """
+        new_days = iter(new_days)
+        next_new = next(new_days, None)
+        if next_new is None:
+            return 0  # Skip saving if there are no messages
+
+        exists = os.path.exists(self.file_path)
+        ordered = sorted(self.days.items(), key=lambda item: item[1][0])
+        # Existing days from the first new date onwards make up the tail to rewrite
+        start = next_new[0] if replace_from is None else min(replace_from, next_new[0])
+        tail = [date for date, _ in ordered if date >= start]
+        cut = self.days[tail[0]][0] if tail else (os.path.getsize(self.file_path) if exists else 0)
+
+        written = 0
+        try:
+            with open(self.file_path, "r+b" if exists else "w+b") as file:
+                # Skip days that are unchanged or would be rewritten byte for byte
+                if not incremental:
+                    while next_new is not None and tail and next_new[0] == tail[0]:
+                        if next_new[1] is not None:
+                            block = format_day(*next_new).encode("utf-8")
+                            if hashlib.sha256(block).hexdigest() != self.days[tail[0]][2]:
+                                break
+                        cut += self.days[tail[0]][1]
+                        tail.pop(0)
+                        next_new = next(new_days, None)
+                    if next_new is None and not tail:
+                        return 0  # Every day is already archived as it is
+
+                # Existing tail days are merged with the delta, or kept when passed as None
+                tail_blocks = {date: self._read_block(file, date) for date in tail} if incremental else {}
+                old_days = {date: self.days.pop(date) for date in tail}
+                self._write_journal(file, cut)
+                file.seek(cut)
+                file.truncate()
+
+                def kept_block(date):
+                    if date not in old_days:
+                        raise ValueError(f"{date} is not in {self.file_path} and cannot be kept")
+                    offset, length, _ = old_days[date]
+                    with open(self.journal_path, "rb") as journal:
+                        journal.readline()
+                        journal.seek(offset - cut, os.SEEK_CUR)
+                        return journal.read(length).decode("utf-8")
+
+                def append(date, block):
+                    data = block.encode("utf-8")
+                    self.days[date] = [file.tell(), len(data), hashlib.sha256(data).hexdigest()]
+                    file.write(data)
+
+                pending = sorted(tail_blocks.items())
+                while next_new is not None or pending:
+                    if pending and (next_new is None or pending[0][0] < next_new[0]):
+                        append(*pending.pop(0))
+                        continue
+                    date, messages = next_new
+                    if messages is None:
+                        block = pending.pop(0)[1] if pending and pending[0][0] == date else kept_block(date)
+                    elif pending and pending[0][0] == date:
+                        # Same day already in the file: keep it as is and add the delta
+                        block = pending.pop(0)[1]
+                        if block.endswith("\n\n"):
+                            block = block[:-1]
+                        block += "".join(f"{m}\n" for m in messages) + "\n"
+                        written += 1
+                    else:
+                        block = format_day(date, messages)
+                        written += 1
+                    append(date, block)
+                    next_new = next(new_days, None)
+        except BaseException:
+            # Put the replaced tail back (the file is closed, so nothing else is flushed into it)
+            replay_journal(self.file_path)
+            self.days = self._load_index()
+            raise
+
+        self._save_index()
+        os.remove(self.journal_path)
+        return written
+
+    def _write_journal(self, file, cut):
+        """Save the cut offset and the bytes of the file after it to the journal."""
+        temp_path = f"{self.journal_path}.tmp"
+        with open(temp_path, "wb") as journal:
+            journal.write(f"{cut}\n".encode("ascii"))
+            file.seek(cut)
+            shutil.copyfileobj(file, journal)
+            journal.flush()
+            os.fsync(journal.fileno())
+        os.replace(temp_path, self.journal_path)
+
+
+# Function to undo an interrupted MarkdownArchive.write_days from its journal
+# The journal holds the offset the file was cut at and the bytes that followed,
+# so the file is cut there again and they are written back. Returns whether
+# there was a journal to replay.
+def replay_journal(file_path):
+    journal_path = f"{file_path}.journal"
+    if not os.path.exists(journal_path):
+        return False
+    with open(journal_path, "rb") as journal, open(file_path, "r+b" if os.path.exists(file_path) else "w+b") as file:
+        file.seek(int(journal.readline()))
+        file.truncate()
+        shutil.copyfileobj(journal, file)
+    os.remove(journal_path)
+    return True
+
+
+# Characters of the date that name a shard, per sharded layout
+SHARD_LAYOUTS = {"month": len("YYYY-MM"), "year": len("YYYY")}
+
+# First line of a generated shard index page
+SHARD_INDEX_MARKER = "<!-- slackdown:shard-index -->"
+
+
+# Function to tell a generated shard index page from a single-file archive
+def is_shard_index(file_path):
+    if not os.path.exists(file_path):
+        return False
+    with open(file_path, "r", encoding="utf-8") as file:
+        return file.readline().strip() == SHARD_INDEX_MARKER
+
+
+# Function to delete an archive file together with its day index
+def remove_archive(file_path):
+    for path in (file_path, f"{file_path}.idx.json", f"{file_path}.journal"):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+# Function to list the shards next to an archive's index page as {key: path}
+# Shards of `<name>.md` are named `<name>.<YYYY-MM>.md` (or `<name>.<YYYY>.md`).
+def list_shards(file_path):
+    folder = os.path.dirname(file_path) or "."
+    base = os.path.basename(file_path)[: -len(".md")]
+    pattern = re.compile(re.escape(base) + r"\.(\d{4}(?:-\d{2})?)\.md$")
+    if not os.path.isdir(folder):
+        return {}
+    shards = {}
+    for name in os.listdir(folder):
+        match = pattern.match(name)
+        if match:
+            shards[match.group(1)] = os.path.join(folder, name)
+    return dict(sorted(shards.items()))
+
+
+# Function to concatenate the shards of an archive back into one file
+def join_shards(file_path):
+    temp_path = f"{file_path}.tmp"
+    shards = list_shards(file_path)
+    with open(temp_path, "wb") as output:
+        for shard_path in shards.values():
+            replay_journal(shard_path)
+            with open(shard_path, "rb") as shard:
+                shutil.copyfileobj(shard, output)
+    remove_archive(file_path)
+    os.replace(temp_path, file_path)
+    for shard_path in shards.values():
+        remove_archive(shard_path)
+
+
+class ShardedArchive:
+    """A channel archive split into one Markdown file per month or year.
+
+    `<name>.md` becomes a small generated index page linking the shards
+    `<name>.<period>.md`, each a MarkdownArchive of its own, so a sync only
+    rewrites the shards its new days fall into. A single-file archive (or one
+    sharded by another period) is converted on first use.
+    """
+
+    def __init__(self, file_path, layout="month"):
+        self.file_path = file_path
+        self.key_length = SHARD_LAYOUTS[layout]
+        self.shard_prefix = file_path[: -len(".md")]
+
+        if os.path.exists(file_path) and not is_shard_index(file_path):
+            self._split()
+        elif any(len(key) != self.key_length for key in list_shards(file_path)):
+            join_shards(file_path)
+            self._split()
+
+    def shard_path(self, key):
+        return f"{self.shard_prefix}.{key}.md"
+
+    @property
+    def days(self):
+        """Index entries of the days of every shard."""
+        days = {}
+        for shard_path in list_shards(self.file_path).values():
+            days.update(MarkdownArchive(shard_path).days)
+        return days
+
+    def _split(self):
+        """Stream a single-file archive into shards (one sequential read).
+
+        Shards are written to temp files and renamed only after the whole
+        file was read, so a split that is interrupted is simply done again.
+        """
+        replay_journal(self.file_path)
+        temp_paths, output, key = {}, None, None
+        with open(self.file_path, "rb") as file:
+            for line in file:
+                if line.startswith(b"#### "):
+                    line_key = line[5:].strip().decode("utf-8")[: self.key_length]
+                    if line_key != key:
+                        if output is not None:
+                            output.close()
+                        key = line_key
+                        mode = "ab" if key in temp_paths else "wb"
+                        temp_paths.setdefault(key, f"{self.shard_path(key)}.{os.getpid()}.tmp")
+                        output = open(temp_paths[key], mode)
+                if output is not None:
+                    output.write(line)
+        if output is not None:
+            output.close()
+        for key, temp_path in temp_paths.items():
+            os.replace(temp_path, self.shard_path(key))
+        remove_archive(self.file_path)
+        self.write_index()
+
+    def write_index(self):
+        title = os.path.basename(self.shard_prefix)
+        lines = [SHARD_INDEX_MARKER, f"# {title}", ""]
+        for key, path in list_shards(self.file_path).items():
+            lines.append(f"- [{key}]({os.path.basename(path)})")
+        temp_path = f"{self.file_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            file.write("\n".join(lines) + "\n")
+        os.replace(temp_path, self.file_path)
+
+    def write_days(self, new_days, incremental=False):
+        """Same contract as MarkdownArchive.write_days, applied shard by shard."""
+        written = 0
+        first_key = None
+        touched = set()
+        for key, days in itertools.groupby(new_days, key=lambda day: day[0][: self.key_length]):
+            first_day = next(days)
+            if first_key is None:
+                first_key, first_date = key, first_day[0]
+            # Later shards also lose their days before their first new day
+            written += MarkdownArchive(self.shard_path(key)).write_days(
+                itertools.chain([first_day], days),
+                incremental,
+                replace_from=None if incremental else first_date,
+            )
+            touched.add(key)
+        if first_key is None:
+            return 0  # Skip saving if there are no messages
+
+        if not incremental:
+            # Later shards without any new day were replaced by nothing
+            for key, shard_path in list_shards(self.file_path).items():
+                if key > first_key and key not in touched:
+                    remove_archive(shard_path)
+        self.write_index()
+        return written
+
+
+# Function to open a channel archive in the configured layout ("single", "month" or "year")
+def open_archive(file_path, layout="single"):
+    if layout == "single":
+        if is_shard_index(file_path):
+            join_shards(file_path)
+        return MarkdownArchive(file_path)
+    return ShardedArchive(file_path, layout)
@@ -0,0 +1,133 @@
+import asyncio
+
+from slack_sdk.errors import SlackApiError
+from slack_sdk.web.async_client import AsyncWebClient
+from src.api import HistoryPage, RateLimiter
+from src.renderer import TOKEN_PATTERN
+from src.user_directory import UserDirectory, display_name_of
+
+
+class AsyncSlackAPI:
+    """asyncio counterpart of SlackAPI for the per-conversation calls, built on AsyncWebClient.
+
+    Every call goes through the same per-tier RateLimiter as SlackAPI and
+    holds one slot of `limit` (an asyncio.Semaphore shared with the
+    attachment downloads) while it is in flight. Resolved user names land in
+    the shared UserDirectory, so the synchronous renderer can read them with
+    `get_user_display_name` once `resolve_users` has been awaited.
+    """
+
+    def __init__(
+        self,
+        token,
+        users=None,
+        rate_limiter=None,
+        base_url=AsyncWebClient.BASE_URL,
+        session=None,
+        limit=None,
+    ):
+        # A shared aiohttp session keeps connections alive across requests
+        self.client = AsyncWebClient(token=token, base_url=base_url, session=session)
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.limit = limit or asyncio.Semaphore(100)
+        self.users = users if users is not None else UserDirectory()
+        # User ID -> task, so concurrent conversations look a user up only once
+        self._lookups = {}
+
+    async def _request(self, method, **kwargs):
+        async with self.limit:
+            return await getattr(self.client, method)(**kwargs)
+
+    # Function to call a Web API method through the rate limiter
+    async def _call(self, method, **kwargs):
+        async def request(**kwargs):
+            return await self._request(method, **kwargs)
+
+        return await self.rate_limiter.call_async(method, request, **kwargs)
+
+    # Function to get a user's display name from the directory (no request)
+    def get_user_display_name(self, user_id):
+        name = self.users.get(user_id)
+        if name is None:
+            name = self.users.get(user_id, allow_stale=True) or "Unknown User"
+        return name
+
+    # Function to get user info by ID
+    async def get_user_display_name_async(self, user_id):
+        name = self.users.get(user_id)
+        if name is not None:
+            return name
+        task = self._lookups.get(user_id)
+        if task is None:
+            task = self._lookups[user_id] = asyncio.ensure_future(self._lookup_user(user_id))
+        return await task
+
+    async def _lookup_user(self, user_id):
+        try:
+            user_info = await self._call("users_info", user=user_id)
+            name = display_name_of(user_info["user"])
+            self.users.set(user_id, name)
+            return name
+        except SlackApiError as e:
+            print(f"Error fetching user info: {e.response['error']}")
+            self.users.mark_unknown(user_id)
+            return "Unknown User"
+        finally:
+            self._lookups.pop(user_id, None)
+
+    # Function to resolve every user a batch of messages (and thread replies) shows or mentions
+    async def resolve_users(self, messages):
+        user_ids = set()
+        for message in messages:
+            user_ids.add(message.get("user", ""))
+            for match in TOKEN_PATTERN.finditer(message.get("text", "")):
+                if match.group("user"):
+                    user_ids.add(match.group("user"))
+        missing = [user_id for user_id in user_ids if self.users.get(user_id) is None]
+        if missing:
+            await asyncio.gather(*(self.get_user_display_name_async(user_id) for user_id in missing))
+
+    # Function to stream a channel's history one page (newest messages first) at a time
+    # Same pages as SlackAPI.iter_conversations_history; raises SlackApiError.
+    async def iter_conversations_history(self, channel_id, channel_name, oldest=None, cursor=None, latest=None):
+        # Only messages newer than `oldest` (exclusive) when syncing incrementally,
+        # and older than `latest` (exclusive) for one time window of the history
+        extra = {"oldest": oldest} if oldest else {}
+        if latest:
+            extra["latest"] = latest
+        while True:
+            response = await self._call(
+                "conversations_history",
+                channel=channel_id,
+                cursor=cursor,
+                limit=200,
+                **extra,
+            )
+            cursor = response.get("response_metadata", {}).get("next_cursor")
+            yield HistoryPage(response["messages"], cursor)
+            if not cursor:
+                break
+
+    # Function to fetch every reply of a thread (all pages), parent message first
+    async def get_conversations_replies(self, channel_id, channel_name, thread_ts):
+        try:
+            messages = []
+            cursor = None
+            while True:
+                response = await self._call(
+                    "conversations_replies",
+                    channel=channel_id,
+                    ts=thread_ts,
+                    cursor=cursor,
+                    limit=200,
+                )
+                # Later pages may repeat the parent message
+                messages.extend(
+                    m for m in response["messages"] if not (messages and m.get("ts") == thread_ts)
+                )
+                cursor = response.get("response_metadata", {}).get("next_cursor")
+                if not cursor:
+                    break
+            return messages
+        except SlackApiError as e:
+            print(f"Error fetching messages from {channel_name}: {e.response['error']}")
@@ -0,0 +1,159 @@
+import os
+import time
+import asyncio
+import hashlib
+import aiohttp
+
+from concurrent.futures import Future
+from src.downloader import join_downloads
+from src.helper import DOWNLOAD_TIMEOUT, commit_part_file, resume_part_file
+from src.metrics import METRICS
+
+
+# Limits on connecting and on each read (as helper.DOWNLOAD_TIMEOUT) but none on the
+# whole transfer: the session's default 5 minute total would kill large attachments
+ASYNC_DOWNLOAD_TIMEOUT = aiohttp.ClientTimeout(
+    total=None, sock_connect=DOWNLOAD_TIMEOUT[0], sock_read=DOWNLOAD_TIMEOUT[1]
+)
+
+
+# Function to download a file straight into its target folder without blocking the event loop
+# asyncio counterpart of helper.download_file (with a session), sharing its
+# part-file resume and commit steps, which run in a worker thread: the bytes
+# are streamed into `.<final_name>.part` and hashed as they arrive, an
+# interrupted transfer is resumed with an HTTP Range request, and the finished
+# file is committed with one atomic rename (or dropped if identical content is
+# already stored). Returns (success, stored_path).
+async def download_file_async(
+    session,
+    file_url,
+    target_folder,
+    file_name,
+    final_name,
+    headers=None,
+    manifest=None,
+    retries=3,
+):
+    os.makedirs(target_folder, exist_ok=True)
+    final_file_path = os.path.join(target_folder, final_name)
+    part_file_path = os.path.join(target_folder, f".{final_name}.part")
+
+    started = time.perf_counter()
+    try:
+        for attempt in range(retries):
+            # Pick up where a previous attempt stopped (hashing the part file off the event loop)
+            sha256_hash, offset = await asyncio.to_thread(resume_part_file, part_file_path)
+            request_headers = dict(headers or {})
+            if offset:
+                request_headers["Range"] = f"bytes={offset}-"
+                METRICS.incr("download_resumed")
+
+            async with session.get(
+                file_url, headers=request_headers, timeout=ASYNC_DOWNLOAD_TIMEOUT
+            ) as response:
+                if response.status == 416 and offset:
+                    break  # The partial file is already complete
+                if response.status not in (200, 206):
+                    print(f"Failed to download file: {file_name} (HTTP {response.status})")
+                    METRICS.incr("downloads", result="failed")
+                    return False, None
+                if response.status == 200 and offset:
+                    # The server ignored the range: start over
+                    sha256_hash = hashlib.sha256()
+                    offset = 0
+
+                try:
+                    with open(part_file_path, "ab" if offset else "wb") as f:
+                        async for chunk in response.content.iter_chunked(65536):
+                            f.write(chunk)
+                            sha256_hash.update(chunk)
+                            METRICS.incr("download_bytes", len(chunk))
+                    break
+                except (aiohttp.ClientPayloadError, aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                    if attempt == retries - 1:
+                        raise  # keep the partial file for the next run
+
+        return await asyncio.to_thread(
+            commit_part_file, part_file_path, final_file_path, sha256_hash.hexdigest(), manifest
+        )
+    except Exception as e:
+        print(f"Error downloading file: {e}")
+        METRICS.incr("downloads", result="failed")
+        return False, None
+    finally:
+        METRICS.observe("download", time.perf_counter() - started)
+
+
+class AsyncDownloadPool:
+    """asyncio counterpart of DownloadPool, on a shared aiohttp session.
+
+    `submit` starts a download task and returns a concurrent.futures.Future
+    (with the same `final_path` and `args` attributes as DownloadPool's), so
+    the renderer and the checkpoint treat both pools alike; `join` is awaited.
+    Each download holds one slot of `limit` while it transfers.
+    """
+
+    def __init__(self, token, session, limit):
+        self.session = session
+        self.headers = {"Authorization": f"Bearer {token}"}
+        self.limit = limit
+        # final_path -> future, so a file shared in several messages downloads once
+        self._in_flight = {}
+        self._tasks = set()
+
+    async def _download(self, future, file_url, target_folder, file_name, final_path, manifest, file_id):
+        try:
+            async with self.limit:
+                # Stored under final_path, or under an existing file with the same content
+                success, stored_path = await download_file_async(
+                    self.session,
+                    file_url,
+                    target_folder,
+                    file_name,
+                    os.path.basename(final_path),
+                    headers=self.headers,
+                    manifest=manifest,
+                )
+            if success and manifest is not None:
+                manifest.add_file(file_id, stored_path)
+            future.set_result(stored_path if success else None)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            self._in_flight.pop(final_path, None)
+
+    def submit(
+        self, file_url, target_folder, file_name, final_path, manifest=None, file_id=None
+    ):
+        """Start a download of `file_url` to `final_path` and return its future.
+
+        The future resolves to the path the file was stored at, or None on failure.
+        """
+        future = self._in_flight.get(final_path)
+        if future is not None:
+            return future
+        future = Future()
+        future.final_path = final_path
+        # What to queue again when a checkpointed backup is resumed
+        future.args = (file_url, target_folder, file_name, final_path, file_id)
+        self._in_flight[final_path] = future
+        task = asyncio.ensure_future(
+            self._download(future, file_url, target_folder, file_name, final_path, manifest, file_id)
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return future
+
+    async def join(self, jobs):
+        """Wait for (future, success_text, failure_text) jobs; see downloader.join_downloads."""
+        futures = {future for future, _, _ in jobs if not future.done()}
+        if futures:
+            await asyncio.wait([asyncio.wrap_future(future) for future in futures])
+        return join_downloads(jobs)
+
+    async def close(self):
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -0,0 +1,233 @@
+import ssl
+import asyncio
+import certifi
+import aiohttp
+
+from slack_sdk.errors import SlackApiError
+from src.async_api import AsyncSlackAPI
+from src.async_downloader import AsyncDownloadPool
+from src.message_processor import ChannelBackup, DayGrouper, page_until, plan_slices
+from src.messages import compact_page
+from src.metrics import METRICS
+from src.threads import AsyncThreadFetcher, thread_cache_path, thread_reply_store
+
+
+# Function to group an async stream of history pages into days
+# asyncio counterpart of message_processor.iter_messages_by_date (same DayGrouper,
+# same callbacks); `on_page` writes a checkpoint, so it runs in a worker thread.
+async def aiter_messages_by_date(pages, partial=None, on_page=None):
+    days = DayGrouper(partial)
+    async for page in pages:
+        for day in days.add(page):
+            yield day
+        if on_page is not None:
+            await asyncio.to_thread(on_page, page, days.partial_day())
+    for day in days.finish():
+        yield day
+
+
+async def no_pages():
+    return
+    yield
+
+
+# Function to project every message of an async history page stream (see messages.compact_pages)
+# The page is projected (and spooled for the raw store) in a worker thread.
+async def acompact_pages(pages, keep_raw=None):
+    async for page in pages:
+        yield await asyncio.to_thread(compact_page, page, keep_raw)
+
+
+async def chain_pages(first, pages):
+    yield first
+    async for page in pages:
+        yield page
+
+
+# Function to cut an async history page stream off at `boundary` (see message_processor.pages_until)
+async def apages_until(pages, boundary):
+    async for page in pages:
+        kept = page_until(page, boundary)
+        yield kept
+        if len(kept) < len(page):
+            return
+
+
+# Function to split a full async history fetch into time windows (see message_processor.slice_history)
+async def aslice_history(pages, created, slices, fetch):
+    first = await anext(pages, None)
+    if first is None:
+        return []
+    plan = plan_slices(first, created, slices)
+    if plan is None:
+        return [chain_pages(first, pages)]
+    boundary, windows = plan
+    return [apages_until(chain_pages(first, pages), boundary)] + [fetch(**bounds) for bounds in windows]
+
+
+# Function to fetch and save one conversation with asyncio
+# Same steps and files as message_processor.fetch_and_save_messages; before a
+# day is rendered (synchronously) its thread replies and every user it shows
+# are awaited, so the renderer never has to make a request itself. Every step
+# that reads or writes files (opening the archive, thread cache and attachment
+# manifest, checkpoints, the sync state) runs in a worker thread.
+# Returns the number of messages saved, or None if the history could not be fetched.
+async def fetch_and_save_messages_async(
+    channel_id,
+    channel_name,
+    channel_type,
+    slack,
+    sync_state,
+    config,
+    downloads,
+    checkpoint=None,
+    search_index=None,
+    created=None,
+):
+    threads = await asyncio.to_thread(
+        AsyncThreadFetcher,
+        slack,
+        channel_id,
+        channel_name,
+        cache_file=thread_cache_path(config["state_dir"], channel_id),
+        raw_store=thread_reply_store(config),
+    )
+    backup = await asyncio.to_thread(
+        ChannelBackup,
+        channel_id,
+        channel_name,
+        channel_type,
+        slack,
+        threads,
+        sync_state,
+        config,
+        downloads,
+        checkpoint,
+        search_index,
+    )
+    request = backup.history_request()
+    if request is None:
+        history = no_pages()
+    else:
+        history = slack.iter_conversations_history(channel_id, channel_name, **request)
+    pages = threads.iter_pages(acompact_pages(history, backup.keep_raw))
+    finished = False
+
+    # Days are rendered on the event loop and written to disk in a worker thread,
+    # one at a time per conversation (time windows share its spool)
+    write_lock = asyncio.Lock()
+
+    async def add_days(pages, partial=None, on_page=None):
+        async for date, date_messages in aiter_messages_by_date(pages, partial, on_page):
+            if backup.skip_day(date, date_messages):
+                continue
+            await threads.wait(date_messages)
+            await slack.resolve_users(
+                date_messages + [reply for m in date_messages for reply in threads.cached_replies(m)]
+            )
+            rendered, rows = backup.render(date, date_messages)
+            async with write_lock:
+                await asyncio.to_thread(backup.write_day, date, date_messages, rendered, rows)
+
+    try:
+        streams = [pages]
+        if config["history_slices"] > 1 and created and request == {"oldest": None}:
+            streams = await aslice_history(
+                pages,
+                created,
+                config["history_slices"],
+                lambda **bounds: threads.iter_pages(
+                    acompact_pages(
+                        slack.iter_conversations_history(channel_id, channel_name, **bounds), backup.keep_raw
+                    )
+                ),
+            )
+        if len(streams) > 1:
+            # Time windows of one conversation are fetched at the same time (not checkpointed)
+            windows = [asyncio.ensure_future(add_days(window)) for window in streams]
+            try:
+                await asyncio.gather(*windows)
+            finally:
+                for window in windows:
+                    window.cancel()
+        elif streams:
+            await add_days(streams[0], backup.partial, backup.save_progress)
+
+        # Wait for this channel's attachments and mark the ones that failed
+        with METRICS.timer("download_wait"):
+            failures = await downloads.join(backup.channel.pending_downloads)
+        await asyncio.to_thread(backup.write_archive, failures)
+        finished = True
+    except SlackApiError as e:
+        # Keep the previous archive and high-water mark untouched
+        print(f"Error fetching messages from {channel_name}: {e.response['error']}")
+        METRICS.incr("channel_failures", type=channel_type)
+        return None
+    finally:
+        await asyncio.to_thread(backup.close, finished)
+        await threads.close()
+        await asyncio.to_thread(threads.save)
+
+    return await asyncio.to_thread(backup.complete)
+
+
+# Function to back up (id, name, type, channel) jobs with the asyncio engine
+# All conversations share one aiohttp session, the rate limiter and user
+# directory of `slack`, and at most Async_Concurrency requests (API calls
+# and attachment downloads together) in flight.
+async def backup_jobs_async(jobs, slack, sync_state, config, checkpoint=None, search_index=None):
+    concurrency = config["async_concurrency"]
+    limit = asyncio.Semaphore(concurrency)
+    channels = asyncio.Semaphore(concurrency)
+    connector = aiohttp.TCPConnector(
+        limit=concurrency, ssl=ssl.create_default_context(cafile=certifi.where())
+    )
+    done = 0
+
+    async with aiohttp.ClientSession(connector=connector) as session:
+        async_slack = AsyncSlackAPI(
+            config["slack_token"],
+            users=slack.users,
+            rate_limiter=slack.rate_limiter,
+            base_url=config["api_base_url"],
+            session=session,
+            limit=limit,
+        )
+        downloads = AsyncDownloadPool(config["slack_token"], session, limit)
+
+        async def run(job):
+            nonlocal done
+            channel_id, channel_name, channel_type, channel = job
+            async with channels:
+                try:
+                    count = await fetch_and_save_messages_async(
+                        channel_id,
+                        channel_name,
+                        channel_type,
+                        async_slack,
+                        sync_state,
+                        config,
+                        downloads,
+                        checkpoint,
+                        search_index,
+                        channel.get("created"),
+                    )
+                    status = (
+                        f"Saved {count} messages from {channel_name}"
+                        if count is not None
+                        else f"Failed to back up {channel_name}"
+                    )
+                except Exception as e:
+                    status = f"Error backing up {channel_name}: {e}"
+            done += 1
+            print(f"[{done}/{len(jobs)}] {status}")
+
+        try:
+            await asyncio.gather(*(run(job) for job in jobs))
+        finally:
+            await downloads.close()
+
+
+# Function to run the asyncio engine from synchronous code
+def run_jobs_async(jobs, slack, sync_state, config, checkpoint=None, search_index=None):
+    asyncio.run(backup_jobs_async(jobs, slack, sync_state, config, checkpoint, search_index))
@@ -0,0 +1,75 @@
+import os
+import threading
+
+from src.helper import calculate_file_hash, load_json, save_json
+
+
+MANIFEST_FILE_NAME = ".manifest.json"
+
+
+class AttachmentManifest:
+    """Persistent index of one attachment folder.
+
+    Maps Slack file IDs and SHA-256 content hashes to the stored file names so
+    deduplication and "do we already have it?" checks are dictionary lookups
+    instead of directory rescans. Folders created before the manifest existed
+    are indexed once on first use.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.manifest_path = os.path.join(folder, MANIFEST_FILE_NAME)
+        self._lock = threading.Lock()
+        manifest = load_json(self.manifest_path)
+        if manifest is None:
+            manifest = self._scan_folder()
+        self.files = manifest.get("files", {})
+        self.hashes = manifest.get("hashes", {})
+
+    def _scan_folder(self):
+        """Build the index of a folder that has no manifest yet (one-time migration)."""
+        files, hashes = {}, {}
+        if not os.path.isdir(self.folder):
+            return {"files": files, "hashes": hashes}
+        # Newest copy wins: names carry a -YYYYmmddHHMMSS suffix when renamed on conflict
+        for name in sorted(os.listdir(self.folder), key=lambda x: x.split("-")[-1].split(".")[0]):
+            path = os.path.join(self.folder, name)
+            # Skip the manifest itself and partial downloads (.<name>.part)
+            if name.startswith(".") or not os.path.isfile(path):
+                continue
+            hashes.setdefault(calculate_file_hash(path), name)
+            # Stored names follow the {file_id}_{user}_{name} pattern
+            file_id = name.split("_", 1)[0]
+            if "_" in name:
+                files[file_id] = name
+        return {"files": files, "hashes": hashes}
+
+    def _existing_path(self, name):
+        if name is None:
+            return None
+        path = os.path.join(self.folder, name)
+        return path if os.path.exists(path) else None
+
+    def find_file(self, file_id):
+        """Return the stored path of a Slack file ID, or None."""
+        with self._lock:
+            name = self.files.get(file_id)
+        return self._existing_path(name)
+
+    def find_hash(self, content_hash):
+        """Return the stored path of a file with this content, or None."""
+        with self._lock:
+            name = self.hashes.get(content_hash)
+        return self._existing_path(name)
+
+    def add_file(self, file_id, path):
+        with self._lock:
+            self.files[file_id] = os.path.basename(path)
+
+    def add_hash(self, content_hash, path):
+        with self._lock:
+            self.hashes[content_hash] = os.path.basename(path)
+
+    def save(self):
+        with self._lock:
+            save_json(self.manifest_path, {"files": self.files, "hashes": self.hashes})
@@ -0,0 +1,99 @@
+import threading
+
+from src.helper import load_json, update_json
+
+
+# Conversation types in the order they are backed up
+CONVERSATION_TYPES = ("public_channel", "private_channel", "mpim", "im")
+
+
+# Function to tell the type of a conversation object from `conversations.list`
+def conversation_type(channel):
+    if channel.get("is_im"):
+        return "im"
+    if channel.get("is_mpim"):
+        return "mpim"
+    if channel.get("is_private") or channel.get("is_group"):
+        return "private_channel"
+    return "public_channel"
+
+
+# Function to read what a listing says about a conversation's latest activity
+# (its `latest` message ts when Slack includes it, and its `updated` time)
+def activity_marker(channel):
+    latest = channel.get("latest")
+    if isinstance(latest, dict):
+        latest = latest.get("ts")
+    if latest is None and channel.get("updated") is None:
+        return None
+    return [channel.get("updated"), latest]
+
+
+class ChannelDirectory:
+    """Every conversation seen by the last discovery sweep, persisted between runs.
+
+    Stored as {channel_id: {"name", "type", "user", "num_members", "marker",
+    "synced"}} where `marker` is the activity marker from the latest listing
+    and `synced` the marker at the last successful backup of the conversation.
+    A conversation whose marker has not moved since then has nothing new.
+    `save` keeps the `synced` markers other processes of the workspace saved
+    for the conversations this one did not back up.
+    """
+
+    def __init__(self, cache_file=None):
+        self.cache_file = cache_file
+        self._lock = threading.Lock()
+        self.channels = (load_json(cache_file, {}) or {}) if cache_file else {}
+        self._synced = set()
+
+    def update(self, channels):
+        """Replace the directory with a fresh listing, keeping what was synced."""
+        with self._lock:
+            previous = self.channels
+            self.channels = {
+                channel["id"]: {
+                    "name": channel.get("name"),
+                    "type": conversation_type(channel),
+                    "user": channel.get("user"),
+                    "num_members": channel.get("num_members"),
+                    "marker": activity_marker(channel),
+                    "synced": previous.get(channel["id"], {}).get("synced"),
+                }
+                for channel in channels
+            }
+
+    def is_unchanged(self, channel_id):
+        """Tell whether the listing shows nothing new since the last backup.
+
+        Only a listing carrying the conversation's `latest` message counts:
+        `updated` alone tracks changes to the conversation itself (topic,
+        purpose, members) and stays put while messages are posted.
+        """
+        with self._lock:
+            entry = self.channels.get(channel_id)
+            if entry is None or entry["marker"] is None or entry["marker"][1] is None:
+                return False
+            return entry["marker"] == entry["synced"]
+
+    def mark_synced(self, channel_id):
+        with self._lock:
+            entry = self.channels.get(channel_id)
+            if entry is not None:
+                entry["synced"] = entry["marker"]
+                self._synced.add(channel_id)
+
+    def save(self):
+        if not self.cache_file:
+            return
+        with self._lock:
+            channels = {channel_id: dict(entry) for channel_id, entry in self.channels.items()}
+            synced = set(self._synced)
+
+        def merge(saved):
+            saved = saved or {}
+            for channel_id, entry in channels.items():
+                if channel_id not in synced and channel_id in saved:
+                    entry["synced"] = saved[channel_id].get("synced")
+            return channels
+
+        update_json(self.cache_file, merge)
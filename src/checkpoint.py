@@ -0,0 +1,68 @@
+import os
+import threading
+
+from src.helper import load_json, save_json
+
+
+class Checkpoint:
+    """Progress of the current backup run, persisted so `--resume` can continue it.
+
+    Stored as {"full_resync": bool, "completed": [channel_id, ...],
+    "channels": {channel_id: {...}}}. A channel entry holds what
+    `fetch_and_save_messages` needs to pick up a half-fetched history: the
+    cursor of the next page, the spooled days, the messages of the day still
+    being collected and the attachment downloads queued so far.
+    """
+
+    def __init__(self, state_file=None):
+        self.state_file = state_file
+        self._lock = threading.Lock()
+        self._data = (load_json(state_file, None) if state_file else None) or self._empty()
+
+    @staticmethod
+    def _empty(full_resync=False):
+        return {"full_resync": full_resync, "completed": [], "channels": {}}
+
+    @property
+    def full_resync(self):
+        return self._data["full_resync"]
+
+    def start(self, full_resync=False):
+        """Forget any previous run and record the settings of a new one."""
+        with self._lock:
+            self._data = self._empty(full_resync)
+        self.save()
+
+    def is_completed(self, channel_id):
+        with self._lock:
+            return channel_id in self._data["completed"]
+
+    def mark_completed(self, channel_id):
+        with self._lock:
+            self._data["channels"].pop(channel_id, None)
+            if channel_id not in self._data["completed"]:
+                self._data["completed"].append(channel_id)
+        self.save()
+
+    def get_channel(self, channel_id):
+        """Return the channel's saved progress, or None to start it from scratch."""
+        with self._lock:
+            return self._data["channels"].get(channel_id)
+
+    def set_channel(self, channel_id, entry):
+        with self._lock:
+            self._data["channels"][channel_id] = entry
+        self.save()
+
+    def save(self):
+        if not self.state_file:
+            return
+        with self._lock:
+            save_json(self.state_file, self._data)
+
+    def clear(self):
+        """Remove the checkpoint once the run has finished."""
+        with self._lock:
+            self._data = self._empty()
+        if self.state_file and os.path.exists(self.state_file):
+            os.remove(self.state_file)
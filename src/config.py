@@ -1,24 +1,89 @@
+import os
 import configparser
 
 
 
-def load_config():
+def load_config(config_file="config.txt"):
 
     # Load configuration from config.txt
     config = configparser.ConfigParser()
-    config.read("config.txt")
+    config.read(config_file)
 
     return {
         # Slack token
-        "slack_token": config.get("Slack", "User_OAuth_Token"),
+        "slack_token": config.get("Slack", "User_OAuth_Token", fallback=None),
+        "api_base_url": config.get("Slack", "API_Base_URL", fallback="https://slack.com/api/"),
 
         # Directories
         "direct_msg_dir": config.get("Directories", "Direct_Msg_Directory", fallback="dm"),
         "group_msg_dir": config.get("Directories", "Group_Msg_Directory", fallback="groups"),
         "channel_msg_dir": config.get("Directories", "Channel_Msg_Directory", fallback="channels"),
         "attachments_dir": config.get("Directories", "Attachment_Directory", fallback="attachments"),
+        "state_dir": config.get("Directories", "State_Directory", fallback=".slackdown"),
+        "analytics_dir": config.get("Directories", "Analytics_Directory", fallback="analytics"),
 
         # Backup options
+        "archive_layout": config.get("Options", "Archive_Layout", fallback="single").strip().lower(),
         "backup_attachments": config.getboolean("Options", "Backup_Attachments", fallback=True),
         "backup_list": config.get("Options", "Backup_List", fallback="all").split(","),
-    }
\ No newline at end of file
+        "full_resync": config.getboolean("Options", "Full_Resync", fallback=False),
+        "skip_unchanged_days": config.getboolean("Options", "Skip_Unchanged_Days", fallback=True),
+        "download_workers": config.getint("Options", "Download_Workers", fallback=4),
+        "thread_workers": config.getint("Options", "Thread_Workers", fallback=4),
+        "keep_raw_messages": config.getboolean("Options", "Keep_Raw_Messages", fallback=True),
+        "search_index": config.getboolean("Options", "Search_Index", fallback=False),
+        "analytics_export": config.getboolean("Options", "Analytics_Export", fallback=False),
+        "render_workers": config.getint("Options", "Render_Workers", fallback=os.cpu_count() or 1),
+        "workers": config.getint("Options", "Workers", fallback=1),
+        "engine": config.get("Options", "Engine", fallback="threads").strip().lower(),
+        "async_concurrency": config.getint("Options", "Async_Concurrency", fallback=100),
+        "conversations_page_size": config.getint("Options", "Conversations_Page_Size", fallback=200),
+        "skip_unchanged": config.getboolean("Options", "Skip_Unchanged_Conversations", fallback=True),
+        "rate_limit_multiplier": config.getfloat("Options", "Rate_Limit_Multiplier", fallback=1.0),
+        "checkpoint_pages": config.getint("Options", "Checkpoint_Pages", fallback=10),
+        "history_slices": config.getint("Options", "History_Slices", fallback=1),
+        "plan_sample_pages": config.getint("Options", "Plan_Sample_Pages", fallback=2),
+        "metrics_file": config.get("Options", "Metrics_File", fallback=None),
+        "prometheus_textfile": config.get("Options", "Prometheus_Textfile", fallback=None),
+        "user_cache_ttl": config.getfloat("Options", "User_Cache_TTL_Hours", fallback=24) * 3600,
+
+        # (index, count) when this process is one of several tokens backing up the
+        # workspace (set by `python slackdown.py workspaces`, not read from config.txt)
+        "shard": None,
+    }
+
+
+# Function to load the workspace profiles run by `python slackdown.py workspaces`
+# Every section of the profiles file is one workspace: `Directory` is its output
+# root (default: the section name), `Config` its options file (default:
+# `<Directory>/config.txt` if it exists, else ./config.txt), `User_OAuth_Token`
+# one or more comma-separated tokens and an optional `Rate_Limit_Multiplier`.
+# Relative paths are resolved against the profiles file's folder.
+def load_profiles(profiles_file="profiles.txt"):
+    parser = configparser.ConfigParser()
+    if not parser.read(profiles_file):
+        raise FileNotFoundError(f"Profiles file not found: {profiles_file}")
+    base = os.path.dirname(os.path.abspath(profiles_file))
+
+    profiles = []
+    for name in parser.sections():
+        section = parser[name]
+        directory = os.path.join(base, section.get("Directory", fallback=name))
+        config_file = section.get("Config", fallback=None)
+        if config_file is not None:
+            config_file = os.path.join(base, config_file)
+        elif os.path.exists(os.path.join(directory, "config.txt")):
+            config_file = os.path.join(directory, "config.txt")
+        else:
+            config_file = os.path.join(base, "config.txt")
+        tokens = [token.strip() for token in section.get("User_OAuth_Token", fallback="").split(",")]
+        profiles.append(
+            {
+                "name": name,
+                "directory": directory,
+                "config_file": config_file,
+                "tokens": [token for token in tokens if token],
+                "rate_limit_multiplier": section.getfloat("Rate_Limit_Multiplier", fallback=None),
+            }
+        )
+    return profiles
\ No newline at end of file
@@ -0,0 +1,64 @@
+import os
+import json
+import hashlib
+
+from src.helper import load_json, save_json
+
+
+# Bumped whenever rendering changes in a way that must invalidate stored fingerprints
+FINGERPRINT_VERSION = 1
+
+
+# Function to fingerprint one day of raw messages
+# Covers everything that changes how the day renders: the messages themselves,
+# edits, thread activity, reactions and attached files (and their expiry).
+def day_fingerprint(messages, salt=""):
+    sha256_hash = hashlib.sha256(f"{FINGERPRINT_VERSION}:{salt}".encode("utf-8"))
+    for message in messages:
+        parts = [
+            message.get("ts"),
+            (message.get("edited") or {}).get("ts"),
+            message.get("reply_count"),
+            message.get("latest_reply"),
+            [(r.get("name"), r.get("count")) for r in message.get("reactions", [])],
+            [(f.get("id"), f.get("mode")) for f in message.get("files", [])],
+        ]
+        sha256_hash.update(json.dumps(parts).encode("utf-8"))
+    return sha256_hash.hexdigest()
+
+
+# Function to get the fingerprint file of a channel
+def fingerprint_path(state_dir, channel_id):
+    return os.path.join(state_dir, "fingerprints", f"{channel_id}.json")
+
+
+class DayFingerprints:
+    """Fingerprint of each day of a channel as it was last written to the archive.
+
+    Stored as {date: sha256}. A day fetched again with the same fingerprint
+    renders to the same Markdown, so it is neither rendered nor rewritten.
+    """
+
+    def __init__(self, state_file=None):
+        self.state_file = state_file
+        self.days = (load_json(state_file, {}) or {}) if state_file else {}
+
+    def get(self, date):
+        return self.days.get(date)
+
+    def replace_from(self, days):
+        """Record the days of a full write: stored days from the first one onwards are replaced."""
+        if not days:
+            return
+        first = min(days)
+        self.days = {date: value for date, value in self.days.items() if date < first}
+        self.days.update(days)
+
+    def discard(self, dates):
+        """Forget days whose archived content is no longer described by a fingerprint."""
+        for date in dates:
+            self.days.pop(date, None)
+
+    def save(self):
+        if self.state_file:
+            save_json(self.state_file, self.days)
@@ -0,0 +1,142 @@
+import os
+import threading
+import requests
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from src.helper import download_file
+
+
+class DownloadPool:
+    """Bounded pool of attachment downloads sharing one keep-alive HTTP session.
+
+    Rendering queues downloads with `submit` and carries on with the text it
+    would write on success; `join` waits for a batch and returns the
+    replacements that turn those texts into failure markers (or point them at
+    a deduplicated copy).
+    """
+
+    def __init__(self, token, workers=4):
+        self.session = requests.Session()
+        self.session.headers["Authorization"] = f"Bearer {token}"
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self._lock = threading.Lock()
+        # final_path -> future, so a file shared in several messages downloads once
+        self._in_flight = {}
+
+    def _download(self, file_url, target_folder, file_name, final_path, manifest, file_id):
+        # Stored under final_path, or under an existing file with the same content
+        success, stored_path = download_file(
+            file_url,
+            target_folder,
+            file_name,
+            session=self.session,
+            manifest=manifest,
+            final_name=os.path.basename(final_path),
+        )
+        if not success:
+            return None
+        if manifest is not None:
+            manifest.add_file(file_id, stored_path)
+        return stored_path
+
+    def submit(
+        self, file_url, target_folder, file_name, final_path, manifest=None, file_id=None
+    ):
+        """Queue a download of `file_url` to `final_path` and return its future.
+
+        The future resolves to the path the file was stored at (which differs
+        from `final_path` when the manifest found a duplicate), or None on failure.
+        """
+        with self._lock:
+            future = self._in_flight.get(final_path)
+            if future is not None:
+                return future
+            future = self.executor.submit(
+                self._download,
+                file_url,
+                target_folder,
+                file_name,
+                final_path,
+                manifest,
+                file_id,
+            )
+            future.final_path = final_path
+            # What to queue again when a checkpointed backup is resumed
+            future.args = (file_url, target_folder, file_name, final_path, file_id)
+            self._in_flight[final_path] = future
+        # Registered outside the lock: it runs inline if the download already finished
+        future.add_done_callback(lambda _: self._forget(final_path))
+        return future
+
+    def _forget(self, final_path):
+        with self._lock:
+            self._in_flight.pop(final_path, None)
+
+    def join(self, jobs):
+        return join_downloads(jobs)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.session.close()
+
+
+class NoDownloads:
+    """Stand-in for DownloadPool when rendering offline: every missing file is reported as failed."""
+
+    def submit(self, *args, **kwargs):
+        future = Future()
+        future.final_path = None
+        future.set_result(None)
+        return future
+
+    def join(self, jobs):
+        return join_downloads(jobs)
+
+    def close(self):
+        pass
+
+
+# Function to wait for (future, success_text, failure_text) download jobs
+# Returns {success_text: replacement} for downloads that failed (failure marker)
+# or were deduplicated onto another stored file (rewritten link).
+def join_downloads(jobs):
+    replacements = {}
+    for future, success_text, failure_text in jobs:
+        try:
+            stored_path, final_path = future.result(), future.final_path
+        except Exception as e:
+            print(f"Error downloading file: {e}")
+            stored_path = None
+        if stored_path is None:
+            replacements[success_text] = failure_text
+        elif stored_path != final_path:
+            replacements[success_text] = success_text.replace(
+                os.path.basename(final_path), os.path.basename(stored_path)
+            )
+    return replacements
+
+
+# Function to swap the rendered text of failed or deduplicated downloads
+def apply_download_failures(days, failures):
+    if not failures:
+        yield from days
+        return
+    for date, messages in days:
+        if messages is None:
+            yield date, None  # Unchanged day, kept as it is in the archive
+            continue
+        patched = []
+        for message in messages:
+            for success_text, failure_text in failures.items():
+                if success_text in message:
+                    message = message.replace(success_text, failure_text)
+                # Image tags are written with forward slashes on every platform
+                forward_slash_text = success_text.replace("\\", "/")
+                if forward_slash_text != success_text and forward_slash_text in message:
+                    message = message.replace(forward_slash_text, failure_text)
+            patched.append(message)
+        yield date, patched
@@ -1,11 +1,62 @@
 import os
+import json
+import time
 import hashlib
-import shutil
-import tempfile
 import requests
+import threading
 
 from datetime import datetime
 from src.config import load_config
+from src.metrics import METRICS
+
+try:
+    import fcntl
+except ImportError:  # Windows: update_json merges without serializing processes
+    fcntl = None
+
+
+# (connect, read) timeout of an attachment request: a stalled transfer raises
+# instead of holding a download worker forever
+DOWNLOAD_TIMEOUT = (10, 60)
+
+def load_json(file_path, default=None):
+    """Load a JSON state file, returning `default` if it is missing or unreadable."""
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def save_json(file_path, data):
+    """Atomically write a JSON state file (write to a sibling temp file, then rename).
+
+    The temp file is named after the process and thread, so concurrent writers
+    of one file never share it.
+    """
+    folder = os.path.dirname(file_path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    temp_path = f"{file_path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(temp_path, file_path)
+
+
+def update_json(file_path, merge, default=None):
+    """Merge this process's changes into a JSON state file that other processes also write.
+
+    `merge(current)` gets the file's current content (or `default`) and returns
+    what to save. Where fcntl is available the read-merge-write runs under an
+    exclusive lock on `<file>.lock`, so concurrent updates are never lost.
+    """
+    folder = os.path.dirname(file_path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with open(f"{file_path}.lock", "a") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        save_json(file_path, merge(load_json(file_path, default)))
 
 
 def calculate_file_hash(file_path):
@@ -20,52 +71,131 @@ def calculate_url_hash(url):
     return hashlib.sha256(url).hexdigest()[:16]
 
 
-def resolve_file_name_conflict(target_folder, file_name):
-    """Resolve file name conflicts by checking content hashes."""
+def find_duplicate_file(target_folder, content_hash, manifest=None):
+    """Return the path of a file in `target_folder` with the given content hash, or None.
+
+    With an AttachmentManifest this is an index lookup; without one every file
+    in the folder is hashed.
+    """
+    if manifest is not None:
+        return manifest.find_hash(content_hash)
+    if not os.path.isdir(target_folder):
+        return None
+    for existing_file in os.listdir(target_folder):
+        existing_file_path = os.path.join(target_folder, existing_file)
+        if os.path.isfile(existing_file_path) and not existing_file.endswith(".part"):
+            if calculate_file_hash(existing_file_path) == content_hash:
+                return existing_file_path
+    return None
+
+
+# Function to hash what a previous attempt left in a download's part file
+# Returns (sha256 hash object, size) to continue the transfer from.
+def resume_part_file(part_file_path):
+    sha256_hash = hashlib.sha256()
+    offset = 0
+    if os.path.exists(part_file_path):
+        with open(part_file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(65536), b""):
+                sha256_hash.update(chunk)
+                offset += len(chunk)
+    return sha256_hash, offset
+
+
+# Function to store a finished part file under its final name
+# Content already stored (by hash) is reused and the part file dropped instead.
+# Returns (True, stored_path).
+def commit_part_file(part_file_path, final_file_path, content_hash, manifest=None):
+    existing_file_path = find_duplicate_file(os.path.dirname(final_file_path), content_hash, manifest)
+    if existing_file_path:
+        os.remove(part_file_path)
+        METRICS.incr("downloads", result="duplicate")
+        return True, existing_file_path
+
+    os.replace(part_file_path, final_file_path)
+    if manifest is not None:
+        manifest.add_hash(content_hash, final_file_path)
+    METRICS.incr("downloads", result="ok")
+    return True, final_file_path
+
+
+# Function to download a file straight into its target folder
+# The bytes are streamed into a hidden `.<name>.part` file next to the final
+# path and hashed as they arrive; an interrupted transfer is resumed with an
+# HTTP Range request (on a retry, or on the next run), and the finished file is
+# committed with one atomic rename (or dropped if identical content is already
+# stored). Returns (success, stored_path).
+def download_file(
+    file_url,
+    target_folder,
+    file_name,
+    session=None,
+    manifest=None,
+    final_name=None,
+    retries=3,
+):
     # Create the target folder if it doesn't exist
     os.makedirs(target_folder, exist_ok=True)
 
-    # Calculate the hash of the new file (downloaded to a temporary location)
-    temp_file_path = os.path.join(tempfile.gettempdir(), file_name)
-    new_file_hash = calculate_file_hash(temp_file_path)
+    # Without an explicit name, append a timestamp suffix to avoid conflicts
+    if final_name is None:
+        base_name, ext = os.path.splitext(file_name)
+        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+        final_name = f"{base_name}-{timestamp}{ext}"
+    final_file_path = os.path.join(target_folder, final_name)
+    part_file_path = os.path.join(target_folder, f".{final_name}.part")
 
-    # Check if a file with the same content already exists in the target folder
-    for existing_file in os.listdir(target_folder):
-        existing_file_path = os.path.join(target_folder, existing_file)
-        if os.path.isfile(existing_file_path):
-            existing_file_hash = calculate_file_hash(existing_file_path)
-            if existing_file_hash == new_file_hash:
-                # Reuse the existing file and delete the temporary file
-                os.remove(temp_file_path)
-                return existing_file_path  # Return the path of the existing file
-
-    # If no matching file is found, move the temporary file to the target folder
-    # and append a timestamp suffix to avoid conflicts
-    base_name, ext = os.path.splitext(file_name)
-    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-    new_file_path = os.path.join(target_folder, f"{base_name}-{timestamp}{ext}")
-    shutil.move(temp_file_path, new_file_path)
-    return new_file_path
-
-
-def download_file(file_url, target_folder, file_name):
+    started = time.perf_counter()
     try:
-        config = load_config()
-        headers = {"Authorization": f"Bearer {config['slack_token']}"}
-        response = requests.get(file_url, headers=headers, stream=True)
-        if response.status_code == 200:
-            # Download the file to a temporary location
-            temp_file_path = os.path.join(tempfile.gettempdir(), file_name)
-            with open(temp_file_path, "wb") as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-
-            # Resolve file name conflicts and move the file to the target folder
-            final_file_path = resolve_file_name_conflict(target_folder, file_name)
-            return True, final_file_path
+        if session is None:
+            config = load_config()
+            headers = {"Authorization": f"Bearer {config['slack_token']}"}
+            get = requests.get
         else:
-            print(f"Failed to download file: {file_name} (HTTP {response.status_code})")
-            return False, None
+            # The pooled session already carries the Authorization header
+            headers = {}
+            get = session.get
+
+        for attempt in range(retries):
+            # Pick up where a previous attempt stopped
+            sha256_hash, offset = resume_part_file(part_file_path)
+            request_headers = dict(headers)
+            if offset:
+                request_headers["Range"] = f"bytes={offset}-"
+                METRICS.incr("download_resumed")
+
+            # Closed on every path, so a refused download frees its pooled connection
+            with get(file_url, headers=request_headers, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+                if response.status_code == 416 and offset:
+                    break  # The partial file is already complete
+                if response.status_code not in (200, 206):
+                    print(f"Failed to download file: {file_name} (HTTP {response.status_code})")
+                    METRICS.incr("downloads", result="failed")
+                    return False, None
+                if response.status_code == 200 and offset:
+                    # The server ignored the range: start over
+                    sha256_hash = hashlib.sha256()
+                    offset = 0
+
+                try:
+                    with open(part_file_path, "ab" if offset else "wb") as f:
+                        for chunk in response.iter_content(chunk_size=65536):
+                            f.write(chunk)
+                            sha256_hash.update(chunk)
+                            METRICS.incr("download_bytes", len(chunk))
+                    break
+                except (
+                    requests.exceptions.ConnectionError,
+                    requests.exceptions.ChunkedEncodingError,
+                    requests.exceptions.Timeout,
+                ):
+                    if attempt == retries - 1:
+                        raise  # keep the partial file for the next run
+
+        return commit_part_file(part_file_path, final_file_path, sha256_hash.hexdigest(), manifest)
     except Exception as e:
         print(f"Error downloading file: {e}")
+        METRICS.incr("downloads", result="failed")
         return False, None
+    finally:
+        METRICS.observe("download", time.perf_counter() - started)
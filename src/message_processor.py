@@ -1,361 +1,905 @@
 import os
-import emoji
+import itertools
+import threading
 
+from concurrent.futures import FIRST_EXCEPTION, Future, ThreadPoolExecutor, wait
 from datetime import datetime
-from src.api import SlackAPI
+from slack_sdk.errors import SlackApiError
+from src.api import HistoryPage, SlackAPI, slack_api_options
 from src.config import load_config
-from src.helper import calculate_url_hash, download_file
-
-
-# Emoji alias mapping for Slack-specific emojis
-SLACK_EMOJI_MAPPING = {
-    "+1": "👍",
-    "-1": "👎",
-    "joy": "😂",
-    "exploding_head": "🤯",
-    "ok_hand": "👌",
-    "ok": "🆗",
-    "white_check_mark": "✅",
-    "zzz": "💤",
-    "raised_hands": "🙌",
-    "smiling_imp": "😈",
-    "tada": "🎉",
-    "scream_cat": "🙀",
-    "pensive": "😔",
-    "smiling_face_with_3_hearts": "🥰",
-    "mega": "📣",
-    "smiley": "😃",
-    "cry": "😢",
-    "smile": "😄",
-    "laughing": "😆",
-    "heart": "❤️",
-    # Add more mappings as needed
-}
-
-
-# Function to replace emoji labels with actual emojis
-def replace_emoji_labels(text):
-    # Replace Slack-specific emoji aliases first
-    for alias, emoji_char in SLACK_EMOJI_MAPPING.items():
-        text = text.replace(f":{alias}:", emoji_char)
-    # Replace general emoji aliases
-    return emoji.emojize(text)
-
-
-# Function to replace user IDs and channel mentions in text with display names
-def replace_user_ids_and_channels(slack, text):
-    if not text:
-        return text
-
-    # Preserve original line structure
-    lines = text.split('\n')
-    processed_lines = []
-    
-    for line in lines:
-        # Preserve leading whitespace for indentation
-        leading_whitespace = len(line) - len(line.lstrip())
-        indent = ' ' * leading_whitespace
-        
-        words = line.strip().split()
-        for i, word in enumerate(words):
-            if word.startswith("<@") and word.endswith(">"):
-                user_id = word[2:-1]
-                display_name = slack.get_user_display_name(user_id)
-                words[i] = f"`@{display_name}`"
-            elif word == "<!channel>":
-                words[i] = "`@channel`"
-        
-        # Reconstruct line with original indentation
-        processed_line = indent + ' '.join(words)
-        processed_lines.append(processed_line)
-    
-    return '\n'.join(processed_lines)
-
-
-# Function to load existing messages from a file
-def load_existing_messages(file_path):
-    if not os.path.exists(file_path):
-        return {}
-    with open(file_path, "r", encoding="utf-8") as file:
-        lines = file.readlines()
-    messages = {}
-    current_date = None
-    for line in lines:
-        if line.startswith("#### "):
-            current_date = line.strip()[5:]
-            messages[current_date] = []
-        elif line.strip() and current_date:
-            messages[current_date].append(line.strip())
-    return messages
-
-
-# Function to save merged messages to a file
-def save_merged_messages(file_path, existing_messages, new_messages):
-    if not new_messages:
-        return  # Skip saving if there are no messages
-    with open(file_path, "w", encoding="utf-8") as file:
-        sorted_new_dates = sorted(new_messages.keys())
-        # Write old records first
-        for date in sorted(existing_messages.keys()):
-            if date >= sorted_new_dates[0]: # if overlapping with new records
-                continue
-            file.write(f"#### {date}\n")
-            for message in existing_messages[date]:
-                file.write(f"{message}\n")
-            file.write("\n")
-        # Write new records
-        for date in sorted_new_dates:
-            file.write(f"#### {date}\n")
-            for message in new_messages[date]:
-                file.write(f"{message}\n")
-            file.write("\n")
-
-
-# Function to fetch and save messages
-def fetch_and_save_messages(channel_id, channel_name, channel_type):
-    config = load_config()
-    slack = SlackAPI(config["slack_token"])
-
-    print(f"Saving {channel_name}...", end="\r")
-
-    messages = slack.get_conversations_history(channel_id, channel_name)
-
-    # Organize messages by date
-    messages_by_date = {}
-    for message in messages:
-        timestamp = float(message.get("ts", 0))
-        date = datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d")
-        if date not in messages_by_date:
-            messages_by_date[date] = []
-        messages_by_date[date].append(message)
-
-    # Create folders for different channel types
-    folder_name = (
-        config["direct_msg_dir"]
-        if channel_type == "im"
-        else config["group_msg_dir"]
-        if channel_type == "mpim"
-        else config["channel_msg_dir"]
-    )
-    os.makedirs(folder_name, exist_ok=True)
-
-    # Replace spaces in channel_name with underscores for filename
-    safe_channel_name = channel_name.replace(" ", "_")
-
-    # File path
-    file_path = os.path.join(folder_name, f"{safe_channel_name}.md")
-
-    # Load existing messages
-    existing_messages = load_existing_messages(file_path)
-
-    # Merge new messages with existing ones (new messages take precedence)
-    merged_messages = {}
-    for date, date_messages in messages_by_date.items():
-        merged_messages[date] = []
-        for message in reversed(date_messages):  # Reverse to get chronological order
+from src.archive import open_archive
+from src.attachment_store import AttachmentManifest
+from src.day_fingerprints import DayFingerprints, day_fingerprint, fingerprint_path
+from src.downloader import DownloadPool, NoDownloads, apply_download_failures
+from src.helper import calculate_url_hash
+from src.messages import compact_pages
+from src.metrics import METRICS
+from src.raw_store import REPLIES_KEY, OfflineSlack, RawSpool, RawStore, StoredThreads
+from src.renderer import render_reaction, render_text
+from src.search_index import SearchIndex
+from src.sync_state import SyncState
+from src.threads import ThreadFetcher, is_thread_parent, thread_cache_path, thread_reply_store
+from src.user_directory import UserDirectory
+
+
+class DayGrouper:
+    """Groups history pages into days (the state shared by both engines' page loops).
+
+    Slack returns messages newest first, so a day is complete as soon as a
+    message from an earlier day arrives. `add(page)` returns the days the page
+    completed and `finish()` the last one, as (date, messages) newest day
+    first with the messages of each day in chronological order.
+    `partial` is a {"date", "messages"} day still being collected when a
+    checkpoint was taken, and `partial_day()` the one to checkpoint now.
+    """
+
+    def __init__(self, partial=None):
+        self.date = partial["date"] if partial else None
+        self.messages = list(partial["messages"]) if partial else []
+
+    def add(self, page):
+        days = []
+        for message in page:
             timestamp = float(message.get("ts", 0))
-            time_str = datetime.fromtimestamp(timestamp).strftime("%H:%M:%S")
-            user_display_name = slack.get_user_display_name(message.get("user", ""))
-            text = replace_emoji_labels(
-                replace_user_ids_and_channels(slack, message.get("text", ""))
+            date = datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d")
+            if date != self.date:
+                if self.messages:
+                    days.append((self.date, self.messages[::-1]))
+                self.date = date
+                self.messages = []
+            self.messages.append(message)
+        return days
+
+    def partial_day(self):
+        return {"date": self.date, "messages": self.messages}
+
+    def finish(self):
+        return [(self.date, self.messages[::-1])] if self.messages else []
+
+
+# Function to group a stream of history pages into days (see DayGrouper)
+# `on_page(page, partial)` is called once every day completed by a page has
+# been consumed.
+def iter_messages_by_date(pages, partial=None, on_page=None):
+    days = DayGrouper(partial)
+    for page in pages:
+        yield from days.add(page)
+        if on_page is not None:
+            on_page(page, days.partial_day())
+    yield from days.finish()
+
+
+# Function to get the local midnight starting the day of a timestamp
+# (the same calendar day that iter_messages_by_date files the message under)
+def day_start(timestamp):
+    day = datetime.fromtimestamp(timestamp).replace(hour=0, minute=0, second=0, microsecond=0)
+    return day.timestamp()
+
+
+# Function to cut the history older than `boundary` into time windows fetched in parallel
+# `boundary` is a local midnight, `created` the conversation's creation time and
+# `slices` the total number of windows including the newest one (everything
+# from `boundary` on). Returns conversations.history bounds, newest window
+# first, cut at local midnight so no day spans two windows; the oldest window
+# is open-ended so nothing older than `created` can be missed.
+def history_windows(boundary, created, slices):
+    start = day_start(float(created))
+    cuts = [boundary]
+    for i in range(1, slices - 1):
+        cut = day_start(boundary - (boundary - start) * i / (slices - 1))
+        if start < cut < cuts[-1]:
+            cuts.append(cut)
+    windows = []
+    for latest, oldest in zip(cuts, cuts[1:] + [None]):
+        window = {"latest": f"{latest:.6f}"}
+        if oldest is not None:
+            # Both bounds are exclusive: a message exactly at midnight belongs to the later window
+            window["oldest"] = f"{oldest - 0.000001:.6f}"
+        windows.append(window)
+    return windows
+
+
+# Function to keep the messages of a history page from `boundary` onwards
+# A page that lost messages is the last one the stream needs.
+def page_until(page, boundary):
+    return HistoryPage([m for m in page if float(m.get("ts", 0)) >= boundary], page.next_cursor)
+
+
+# Function to cut a history page stream off at `boundary` (keeps messages from it onwards)
+def pages_until(pages, boundary):
+    for page in pages:
+        kept = page_until(page, boundary)
+        yield kept
+        if len(kept) < len(page):
+            return
+
+
+# Function to plan the windows of a sliced history fetch from its first page
+# Returns (boundary, windows): the newest stream goes on only until `boundary`,
+# the start of the first page's oldest day, and the older history is fetched
+# window by window. None if the first page is the whole history.
+def plan_slices(first, created, slices):
+    if not first.next_cursor or not first:
+        return None
+    boundary = day_start(float(first[-1]["ts"]))
+    return boundary, history_windows(boundary, created, slices)
+
+
+# Function to split a full history fetch into time windows when the conversation is large
+# The first page is fetched as usual; if more pages follow (see plan_slices),
+# the older history is fetched window by window with `fetch(**bounds)`.
+# Returns page streams, newest first.
+def slice_history(pages, created, slices, fetch):
+    pages = iter(pages)
+    first = next(pages, None)
+    if first is None:
+        return []
+    plan = plan_slices(first, created, slices)
+    if plan is None:
+        return [itertools.chain([first], pages)]
+    boundary, windows = plan
+    return [pages_until(itertools.chain([first], pages), boundary)] + [fetch(**bounds) for bounds in windows]
+
+
+class DaySpool:
+    """Rendered days parked on disk until the channel's history is complete.
+
+    Days arrive newest first but the archive is written oldest first, so each
+    rendered day is appended to a spool file and only its offset is kept.
+    """
+
+    def __init__(self, spool_path, resume=None):
+        self.spool_path = spool_path
+        self.offsets = {}
+        if resume and os.path.exists(spool_path):
+            # Continue a checkpointed spool; anything written after the checkpoint is dropped
+            self._file = open(spool_path, "r+b")
+            self._file.truncate(resume["size"])
+            self.offsets = {
+                date: offset and tuple(offset) for date, offset in resume["offsets"].items()
+            }
+        else:
+            self._file = open(spool_path, "w+b")
+
+    def add(self, date, messages):
+        block = "\0".join(messages).encode("utf-8")
+        self._file.seek(0, os.SEEK_END)
+        self.offsets[date] = (self._file.tell(), len(block))
+        self._file.write(block)
+
+    def keep(self, date):
+        """Record an unchanged day that is kept as it is in the archive."""
+        self.offsets[date] = None
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def iter_days(self):
+        """Yield (date, messages) in ascending date order; kept days have messages None."""
+        self._file.flush()
+        for date in sorted(self.offsets):
+            if self.offsets[date] is None:
+                yield date, None
+                continue
+            offset, length = self.offsets[date]
+            self._file.seek(offset)
+            block = self._file.read(length).decode("utf-8")
+            yield date, block.split("\0")
+
+    def state(self):
+        """Flush the spool and describe it for a checkpoint."""
+        self._file.flush()
+        self._file.seek(0, os.SEEK_END)
+        return {"offsets": self.offsets, "size": self._file.tell()}
+
+    def close(self, keep=False):
+        """Close the spool; `keep=True` leaves the file for a resumed run."""
+        self._file.close()
+        if not keep:
+            os.remove(self.spool_path)
+
+
+class ChannelContext:
+    """Where and how one conversation is being backed up."""
+
+    def __init__(self, channel_id, channel_name, channel_type, config):
+        self.channel_id = channel_id
+        self.channel_name = channel_name
+        self.channel_type = channel_type
+
+        # Folders for different channel types
+        self.folder_name = (
+            config["direct_msg_dir"]
+            if channel_type == "im"
+            else config["group_msg_dir"]
+            if channel_type == "mpim"
+            else config["channel_msg_dir"]
+        )
+
+        # Replace spaces in channel_name with underscores for filename
+        self.safe_channel_name = channel_name.replace(" ", "_")
+
+        # File path
+        self.file_path = os.path.join(self.folder_name, f"{self.safe_channel_name}.md")
+
+        # Attachments of this conversation and their persistent index
+        self.attachment_folder = os.path.join(config["attachments_dir"], self.safe_channel_name)
+        self.attachments = None
+
+        # (future, success_text, failure_text) for attachments still downloading
+        self.pending_downloads = []
+
+
+# Function to render one message (with its thread, reactions and attachments) to Markdown
+# Attachment downloads are queued on `downloads` and tracked in channel.pending_downloads;
+# thread replies come from the channel's ThreadFetcher.
+def render_message(slack, config, channel, message, downloads, threads):
+    folder_name, safe_channel_name = channel.folder_name, channel.safe_channel_name
+
+    timestamp = float(message.get("ts", 0))
+    time_str = datetime.fromtimestamp(timestamp).strftime("%H:%M:%S")
+    user_display_name = slack.get_user_display_name(message.get("user", ""))
+    text = render_text(message.get("text", ""), slack.get_user_display_name)
+
+    # Write message
+    message_str = f"\n**{user_display_name}** ({time_str}):\n{text}"
+
+    # Handle threads (replies broadcast to the channel are not parents)
+    if is_thread_parent(message):
+        for thread_message in threads.get_replies(message):
+            thread_timestamp = float(thread_message.get("ts", 0))
+            thread_time_str = datetime.fromtimestamp(thread_timestamp).strftime(
+                "%H:%M:%S"
             )
-
-            # Detect and format code blocks
-            if '```' in text:
-                # Split into code blocks and regular text
-                parts = text.split('```')
-                formatted_parts = []
-                in_code_block = False
-                
-                for part in parts:
-                    if in_code_block:
-                        formatted_parts.append(f"```\n{part.strip()}\n```")
+            thread_user_display_name = slack.get_user_display_name(
+                thread_message.get("user", "")
+            )
+            thread_text = render_text(
+                thread_message.get("text", ""), slack.get_user_display_name
+            )
+            message_str += f"\n    **{thread_user_display_name}** ({thread_time_str}): {thread_text}"
+
+    # Handle reactions
+    if "reactions" in message:
+        reactions = message["reactions"]
+        reaction_list = []
+        for r in reactions:
+            emoji_label = render_reaction(r["name"])
+            reaction_list.append(f"{emoji_label} (x{r['count']})")
+        reaction_str = ", ".join(reaction_list)
+        message_str += f"\n    _Reactions_: {reaction_str}"
+
+    ## Handle file attachments
+    if config["backup_attachments"]:
+        if "files" in message:
+            attachment_folder = os.path.join(
+                config["attachments_dir"], safe_channel_name
+            )
+            os.makedirs(attachment_folder, exist_ok=True)
+            image_links = []
+            
+            for file_info in message["files"]:
+                # Handle expired files first
+                if file_info.get('mode') == 'hidden_by_limit':
+                    file_id = file_info['id']
+                    # Look up the copy saved while the file was still available
+                    archived_file_path = channel.attachments.find_file(file_id)
+
+                    if archived_file_path:
+                        archived_file = os.path.basename(archived_file_path)
+
+                        # Extract original name from filename pattern: {id}_{user}_{name}
+                        try:
+                            original_name = '_'.join(archived_file.split('_')[2:])
+                            original_name = original_name.rsplit('-', 1)[0]  # Remove timestamp
+                        except:
+                            original_name = "archived_file"
+
+                        message_str += f"\n    [Attachment: {original_name}]({os.path.relpath(archived_file_path, folder_name)})"
+                        
+                        # Handle images
+                        if archived_file.lower().endswith(('.png', '.jpg', '.jpeg', '.gif')):
+                            img_tag = f'<img src="{os.path.relpath(archived_file_path, folder_name)}" alt="{original_name}" width="200">'
+                            image_links.append(img_tag)
                     else:
-                        formatted_parts.append(part)
-                    in_code_block = not in_code_block
-                
-                text = '\n'.join(formatted_parts)
-
-            # Write message
-            message_str = f"\n**{user_display_name}** ({time_str}):\n{text}"
-
-            # Handle threads
-            if "thread_ts" in message:
-                thread_ts = message["thread_ts"]
-                thread_messages = slack.get_conversations_replies(
-                    channel_id, channel_name, thread_ts
-                )
-                for thread_message in thread_messages[
-                    1:
-                ]:  # Skip the first message (already written)
-                    thread_timestamp = float(thread_message.get("ts", 0))
-                    thread_time_str = datetime.fromtimestamp(thread_timestamp).strftime(
-                        "%H:%M:%S"
-                    )
-                    thread_user_display_name = slack.get_user_display_name(
-                        thread_message.get("user", "")
-                    )
-                    thread_text = replace_emoji_labels(
-                        replace_user_ids_and_channels(
-                            slack, thread_message.get("text", "")
-                        )
-                    )
-                    message_str += f"\n    **{thread_user_display_name}** ({thread_time_str}): {thread_text}"
-
-            # Handle reactions
-            if "reactions" in message:
-                reactions = message["reactions"]
-                reaction_list = []
-                for r in reactions:
-                    emoji_label = replace_emoji_labels(f":{r['name']}:")
-                    reaction_list.append(f"{emoji_label} (x{r['count']})")
-                reaction_str = ", ".join(reaction_list)
-                message_str += f"\n    _Reactions_: {reaction_str}"
-
-            ## Handle file attachments
-            if config["backup_attachments"]:
-                if "files" in message:
-                    attachment_folder = os.path.join(
-                        config["attachments_dir"], safe_channel_name
-                    )
-                    os.makedirs(attachment_folder, exist_ok=True)
-                    image_links = []
+                        message_str += f"\n    [Attachment: Expired file (no local copy available, id={file_id})]"
+                    continue
+
+                # Handle active files
+                try:
+                    file_url = file_info["url_private"]
+                    file_id = file_info["id"]
+                    original_name = file_info["name"]
+                    user_part = user_display_name.replace(' ', '_')
                     
-                    for file_info in message["files"]:
-                        # Handle expired files first
-                        if file_info.get('mode') == 'hidden_by_limit':
-                            file_id = file_info['id']
-                            # Search for existing files with this ID pattern: {file_id}_*
-                            existing_files = [f for f in os.listdir(attachment_folder) 
-                                            if f.startswith(f"{file_id}_")]
-                            
-                            if existing_files:
-                                # Find most recent version using timestamp suffix
-                                sorted_files = sorted(existing_files, 
-                                                    key=lambda x: x.split('-')[-1].split('.')[0], 
-                                                    reverse=True)
-                                archived_file = sorted_files[0]
-                                
-                                # Extract original name from filename pattern: {id}_{user}_{name}
+                    # Generate filename pattern: {file_id}_{user}_{name}.ext
+                    base_name, file_ext = os.path.splitext(original_name)
+                    clean_base = base_name.replace(' ', '_').replace('\u202f', '_')
+
+                    # Check for existing file FIRST
+                    final_filename = f"{file_id}_{user_part}_{clean_base}{file_ext}"
+                    final_path = channel.attachments.find_file(file_id)
+                    stored = final_path is not None
+                    if not stored:
+                        final_path = os.path.join(attachment_folder, final_filename)
+                        if os.path.exists(final_path):
+                            stored = True
+                            channel.attachments.add_file(file_id, final_path)
+
+                    # Handle display
+                    if file_info["mimetype"].startswith("image"):
+                        display_text = f'<img src="{os.path.relpath(final_path, folder_name)}" alt="{clean_base}{file_ext}" width="200">'
+                        image_links.append(display_text)
+                    else:
+                        display_text = f"\n    [Attachment: {clean_base}{file_ext}]({os.path.relpath(final_path, folder_name)})"
+                        message_str += display_text
+
+                    if not stored:
+                        # Download only if needed; a failure marker is patched in once the pool finishes
+                        future = downloads.submit(
+                            file_url,
+                            attachment_folder,
+                            final_filename,
+                            final_path,
+                            channel.attachments,
+                            file_id,
+                        )
+                        failure_text = f"[Attachment: {clean_base}{file_ext} (download failed)]"
+                        if not display_text.startswith("<img"):
+                            failure_text = f"\n    {failure_text}"
+                        channel.pending_downloads.append((future, display_text, failure_text))
+
+                except KeyError:
+                    message_str += "\n    [Attachment: Invalid file data]"
+
+            # Display images in a two-column layout using HTML
+            if image_links:
+                message_str += "\n<table>"
+                for i in range(0, len(image_links), 2):
+                    message_str += "<tr>"
+                    # Force to use forward slashes '/'' on Windows for Markdown to display images properly
+                    forward_slash_path = image_links[i].replace("\\", "/")
+                    message_str += f"<td>{forward_slash_path}</td>"
+                    if i + 1 < len(image_links):
+                        forward_slash_path = image_links[i + 1].replace("\\", "/")
+                        message_str += f"<td>{forward_slash_path}</td>"
+                    message_str += "</tr>"
+                message_str += "</table>"
+        
+        if "attachments" in message:
+            attachment_folder = os.path.join(config["attachments_dir"], safe_channel_name)
+            image_links = []
+            
+            for attachment in message["attachments"]:
+                if "blocks" in attachment:
+                    for block in attachment["blocks"]:
+                        if block["type"] == "image":
+                            image_url = block.get("image_url")
+                            if image_url:
+                                # Similar download logic as files
                                 try:
-                                    original_name = '_'.join(archived_file.split('_')[2:])
-                                    original_name = original_name.rsplit('-', 1)[0]  # Remove timestamp
-                                except:
-                                    original_name = "archived_file"
+                                    # Generate filename from URL
+                                    file_id = calculate_url_hash(image_url.encode())
+                                    user_part = user_display_name.replace(' ', '_')
+                                    original_name = os.path.basename(image_url).split('?')[0]
+                                    base_name, file_ext = os.path.splitext(original_name)
                                     
-                                archived_file_path = os.path.join(attachment_folder, archived_file)
-                                message_str += f"\n    [Attachment: {original_name}]({os.path.relpath(archived_file_path, folder_name)})"
-                                
-                                # Handle images
-                                if archived_file.lower().endswith(('.png', '.jpg', '.jpeg', '.gif')):
-                                    img_tag = f'<img src="{os.path.relpath(archived_file_path, folder_name)}" alt="{original_name}" width="200">'
+                                    # Download and process
+                                    final_filename = f"{file_id}_{user_part}_{base_name}{file_ext}"
+                                    final_path = channel.attachments.find_file(file_id)
+                                    stored = final_path is not None
+                                    if not stored:
+                                        final_path = os.path.join(attachment_folder, final_filename)
+                                        if os.path.exists(final_path):
+                                            stored = True
+                                            channel.attachments.add_file(file_id, final_path)
+                                    
+                                    # Add image to message
+                                    img_tag = f'<img src="{os.path.relpath(final_path, folder_name)}" width="200">'
                                     image_links.append(img_tag)
-                            else:
-                                message_str += f"\n    [Attachment: Expired file (no local copy available, id={file_id})]"
-                            continue
 
-                        # Handle active files
-                        try:
-                            file_url = file_info["url_private"]
-                            file_id = file_info["id"]
-                            original_name = file_info["name"]
-                            user_part = user_display_name.replace(' ', '_')
-                            
-                            # Generate filename pattern: {file_id}_{user}_{name}-{timestamp}.ext
-                            base_name, file_ext = os.path.splitext(original_name)
-                            clean_base = base_name.replace(' ', '_').replace('\u202f', '_')
-                            timestamp_str = datetime.now().strftime('%Y%m%d%H%M%S')
-                            
-                            # Construct temp filename with timestamp before extension
-                            temp_filename = f"{file_id}_{user_part}_{clean_base}-{timestamp_str}{file_ext}"
-                            
-                            # Check for existing file FIRST
-                            final_filename = f"{file_id}_{user_part}_{clean_base}{file_ext}"
-                            final_path = os.path.join(attachment_folder, final_filename)
-
-                            if not os.path.exists(final_path):
-                                # Download only if needed
-                                temp_filename = f"{file_id}_{user_part}_{clean_base}-{timestamp_str}{file_ext}"
-                                success, temp_path = download_file(file_url, attachment_folder, temp_filename)
-                                
-                                if success:
-                                    os.rename(temp_path, final_path)  # Safe atomic operation
-                                    # message_str += f"\n    [Attachment: {clean_base}{file_ext}]"
-                                else:
-                                    message_str += f"\n    [Attachment: {clean_base}{file_ext} (download failed)]"
-
-                            # Handle display
-                            if file_info["mimetype"].startswith("image"):
-                                img_tag = f'<img src="{os.path.relpath(final_path, folder_name)}" alt="{clean_base}{file_ext}" width="200">'
-                                image_links.append(img_tag)
-                            else:
-                                message_str += f"\n    [Attachment: {clean_base}{file_ext}]({os.path.relpath(final_path, folder_name)})"
-                            
-                        except KeyError:
-                            message_str += "\n    [Attachment: Invalid file data]"
-
-                    # Display images in a two-column layout using HTML
-                    if image_links:
-                        message_str += "\n<table>"
-                        for i in range(0, len(image_links), 2):
-                            message_str += "<tr>"
-                            # Force to use forward slashes '/'' on Windows for Markdown to display images properly
-                            forward_slash_path = image_links[i].replace("\\", "/")
-                            message_str += f"<td>{forward_slash_path}</td>"
-                            if i + 1 < len(image_links):
-                                forward_slash_path = image_links[i + 1].replace("\\", "/")
-                                message_str += f"<td>{forward_slash_path}</td>"
-                            message_str += "</tr>"
-                        message_str += "</table>"
-                
-                if "attachments" in message:
-                    attachment_folder = os.path.join(config["attachments_dir"], safe_channel_name)
-                    image_links = []
-                    
-                    for attachment in message["attachments"]:
-                        if "blocks" in attachment:
-                            for block in attachment["blocks"]:
-                                if block["type"] == "image":
-                                    image_url = block.get("image_url")
-                                    if image_url:
-                                        # Similar download logic as files
-                                        try:
-                                            # Generate filename from URL
-                                            file_id = calculate_url_hash(image_url.encode())
-                                            user_part = user_display_name.replace(' ', '_')
-                                            original_name = os.path.basename(image_url).split('?')[0]
-                                            base_name, file_ext = os.path.splitext(original_name)
-                                            
-                                            # Download and process
-                                            final_filename = f"{file_id}_{user_part}_{base_name}{file_ext}"
-                                            final_path = os.path.join(attachment_folder, final_filename)
-                                            
-                                            if not os.path.exists(final_path):
-                                                success, temp_path = download_file(image_url, attachment_folder, final_filename)
-                                                if not success:
-                                                    continue
-                                                os.rename(temp_path, final_path)
-                                            
-                                            # Add image to message
-                                            img_tag = f'<img src="{os.path.relpath(final_path, folder_name)}" width="200">'
-                                            image_links.append(img_tag)
-                                        except Exception as e:
-                                            message_str += f"\n    [GIF download failed: {str(e)}]"
-                    
-                    # Add image grid
-                    if image_links:
-                        message_str += "\n<table>"
-                        for i in range(0, len(image_links), 2):
-                            message_str += "<tr>"
-                            message_str += f"<td>{image_links[i]}</td>"
-                            if i+1 < len(image_links):
-                                message_str += f"<td>{image_links[i+1]}</td>"
-                            message_str += "</tr>"
-                        message_str += "</table>"
-
-            merged_messages[date].append(message_str)
-
-    # Save merged messages
-    save_merged_messages(file_path, existing_messages, merged_messages)
-
-    print(f"Saved {len(messages)} messages from {channel_name} to {file_path}")
+                                    if not stored:
+                                        future = downloads.submit(
+                                            image_url,
+                                            attachment_folder,
+                                            final_filename,
+                                            final_path,
+                                            channel.attachments,
+                                            file_id,
+                                        )
+                                        failure_text = f"[Attachment: {base_name}{file_ext} (download failed)]"
+                                        channel.pending_downloads.append((future, img_tag, failure_text))
+                                except Exception as e:
+                                    message_str += f"\n    [GIF download failed: {str(e)}]"
+            
+            # Add image grid
+            if image_links:
+                message_str += "\n<table>"
+                for i in range(0, len(image_links), 2):
+                    message_str += "<tr>"
+                    message_str += f"<td>{image_links[i]}</td>"
+                    if i+1 < len(image_links):
+                        message_str += f"<td>{image_links[i+1]}</td>"
+                    message_str += "</tr>"
+                message_str += "</table>"
+
+    return message_str
+
+
+# Function to get a message's payload for the raw store (thread parents with their replies)
+def raw_message(message, threads):
+    if not is_thread_parent(message):
+        return dict(message)
+    return dict(message, **{REPLIES_KEY: threads.cached_replies(message)})
+
+
+# Function to list a message and its thread replies as search index rows
+# (ts, thread_ts, user_id, user_name, text), with the text rendered as in the archive
+def search_rows(slack, message, threads):
+    items = [message]
+    if is_thread_parent(message):
+        items += threads.cached_replies(message)
+    rows = []
+    for item in items:
+        user_id = item.get("user", "")
+        rows.append(
+            (
+                item["ts"],
+                message.get("thread_ts"),
+                user_id,
+                slack.get_user_display_name(user_id),
+                render_text(item.get("text", ""), slack.get_user_display_name),
+            )
+        )
+    return rows
+
+
+# Function to queue a checkpointed channel's attachment downloads again
+# Files that finished before the interruption are found through the manifest.
+def restore_downloads(channel, downloads, jobs):
+    for file_url, target_folder, file_name, final_path, file_id, success_text, failure_text in jobs:
+        stored_path = channel.attachments.find_file(file_id) if channel.attachments else None
+        if stored_path is None:
+            future = downloads.submit(
+                file_url, target_folder, file_name, final_path, channel.attachments, file_id
+            )
+        else:
+            future = Future()
+            future.final_path = final_path
+            future.set_result(stored_path)
+        future.args = (file_url, target_folder, file_name, final_path, file_id)
+        channel.pending_downloads.append((future, success_text, failure_text))
+
+
+class ChannelBackup:
+    """One conversation being backed up: everything between its history pages and its archive.
+
+    Holds the channel's spool, archive, day fingerprints, raw store and
+    checkpoint entry. The engines only differ in how they fetch: the threaded
+    `fetch_and_save_messages` and the asyncio engine (`src.async_engine`)
+    both feed it days and then write the archive, so they produce the same files.
+    """
+
+    def __init__(
+        self,
+        channel_id,
+        channel_name,
+        channel_type,
+        slack,
+        threads,
+        sync_state,
+        config,
+        downloads,
+        checkpoint=None,
+        search_index=None,
+    ):
+        self.slack = slack
+        self.threads = threads
+        self.sync_state = sync_state
+        self.config = config
+        self.downloads = downloads
+        self.checkpoint = checkpoint
+        self.search_index = search_index
+
+        channel = self.channel = ChannelContext(channel_id, channel_name, channel_type, config)
+        os.makedirs(channel.folder_name, exist_ok=True)
+        if config["backup_attachments"]:
+            channel.attachments = AttachmentManifest(channel.attachment_folder)
+        self.file_path = channel.file_path
+        spool_path = f"{self.file_path}.spool"
+        raw_spool_path = f"{self.file_path}.raw.spool"
+
+        # Progress saved by an interrupted run (only usable while its spools still exist)
+        resumed = checkpoint.get_channel(channel_id) if checkpoint is not None else None
+        if resumed is not None and not os.path.exists(spool_path):
+            resumed = None
+        if resumed is not None and config["keep_raw_messages"]:
+            if not (resumed.get("raw_spool") and os.path.exists(raw_spool_path)):
+                resumed = None  # The original payloads of its unfinished day are gone
+        self.resumed = resumed
+
+        # Raw API payloads, kept so the Markdown can be rebuilt offline
+        self.raw_store = None
+        self.raw_spool = None
+        if config["keep_raw_messages"]:
+            self.raw_store = RawStore(os.path.join(config["state_dir"], "raw"))
+            self.raw_store.write_channel(channel_id, channel_name, channel_type)
+            self.raw_spool = RawSpool(raw_spool_path, resume=resumed and resumed["raw_spool"])
+
+        if resumed is not None:
+            self.oldest = resumed["oldest"]
+        elif not config["full_resync"] and os.path.exists(self.file_path):
+            # Only fetch messages newer than the last backup, unless a full resync is forced
+            self.oldest = sync_state.get_latest(channel_id)
+        else:
+            self.oldest = None
+        self.incremental = self.oldest is not None
+
+        # Days whose fingerprint matches the last write are kept without rendering them
+        self.archive = open_archive(self.file_path, config["archive_layout"])
+        self.fingerprints = None
+        self.archived_days = {}
+        if config["skip_unchanged_days"]:
+            self.fingerprints = DayFingerprints(fingerprint_path(config["state_dir"], channel_id))
+            if not self.incremental:
+                self.archived_days = self.archive.days
+        # Enabling a store re-renders the days it is missing
+        self.fingerprint_salt = (
+            f"attachments={config['backup_attachments']}"
+            f";raw={config['keep_raw_messages']};search={config['search_index']}"
+        )
+        self.day_prints = dict(resumed.get("fingerprints", {})) if resumed else {}
+
+        self.message_count = resumed["messages"] if resumed else 0
+        self.latest = resumed["latest"] if resumed else None
+        self.spool = DaySpool(spool_path, resume=resumed and resumed["spool"])
+        if resumed:
+            restore_downloads(channel, downloads, resumed["downloads"])
+        self.page_count = 0
+
+    def history_request(self):
+        """Keyword arguments for the history request, or None if every page was already fetched."""
+        if self.resumed is None:
+            return {"oldest": self.oldest}
+        if self.resumed["cursor"]:
+            return {"oldest": self.oldest, "cursor": self.resumed["cursor"]}
+        return None  # Every page had been fetched before the interruption
+
+    @property
+    def partial(self):
+        """The day still being collected when the resumed checkpoint was taken."""
+        return self.resumed and self.resumed["partial"]
+
+    def save_progress(self, page, partial):
+        """Checkpoint the channel every Checkpoint_Pages pages (an `on_page` callback)."""
+        self.page_count += 1
+        if self.checkpoint is None or self.page_count % self.config["checkpoint_pages"]:
+            return
+        channel = self.channel
+        if channel.attachments is not None:
+            channel.attachments.save()
+        self.threads.save()
+        self.checkpoint.set_channel(
+            channel.channel_id,
+            {
+                "oldest": self.oldest,
+                "cursor": getattr(page, "next_cursor", None),
+                "latest": self.latest,
+                "messages": self.message_count,
+                "spool": self.spool.state(),
+                "raw_spool": self.raw_spool.state() if self.raw_spool is not None else None,
+                "partial": dict(partial, messages=[dict(m) for m in partial["messages"]]),
+                "fingerprints": self.day_prints,
+                "downloads": [
+                    [*future.args, success_text, failure_text]
+                    for future, success_text, failure_text in channel.pending_downloads
+                ],
+            },
+        )
+
+    def keep_raw(self, messages):
+        """Spool the original messages of a history page for the raw store (a `compact_pages` hook)."""
+        if self.raw_spool is not None:
+            self.raw_spool.add(messages)
+
+    def skip_day(self, date, date_messages):
+        """Count a fetched day; returns True if it is unchanged and was kept as archived."""
+        for message in date_messages:
+            if self.latest is None or float(message.get("ts", 0)) > float(self.latest):
+                self.latest = message.get("ts")
+        self.message_count += len(date_messages)
+
+        fingerprint = day_fingerprint(date_messages, self.fingerprint_salt)
+        self.day_prints[date] = fingerprint
+        if date in self.archived_days and self.fingerprints.get(date) == fingerprint:
+            self.spool.keep(date)  # Nothing changed: not rendered, not rewritten
+            self.threads.release(date_messages)
+            if self.raw_spool is not None:
+                self.raw_spool.discard(date_messages)
+            METRICS.incr("days_unchanged")
+            return True
+        return False
+
+    def render_day(self, date, date_messages):
+        """Render a day to the spool and store it in the raw store and search index."""
+        self.write_day(date, date_messages, *self.render(date, date_messages))
+
+    def render(self, date, date_messages):
+        """Render a day's messages and their search index rows, in memory.
+
+        Returns (rendered, rows) for `write_day`; rows is None without a search index.
+        """
+        slack, threads, channel = self.slack, self.threads, self.channel
+        with METRICS.timer("render"):
+            rendered = [
+                render_message(slack, self.config, channel, message, self.downloads, threads)
+                for message in date_messages
+            ]
+        if any(threads.has_failed(m) for m in date_messages if is_thread_parent(m)):
+            # Rendered without some replies: no fingerprint, so the day is rendered again next time
+            self.day_prints[date] = None
+        rows = None
+        if self.search_index is not None:
+            rows = [row for message in date_messages for row in search_rows(slack, message, threads)]
+        return rendered, rows
+
+    def write_day(self, date, date_messages, rendered, rows):
+        """Write a rendered day to the spool, the raw store and the search index.
+
+        Only file and database I/O, so the asyncio engine runs it in a worker thread.
+        """
+        channel, threads = self.channel, self.threads
+        with METRICS.timer("write", phase="spool"):
+            self.spool.add(date, rendered)
+        if self.raw_store is not None:
+            with METRICS.timer("write", phase="raw"):
+                self.raw_store.write_day(
+                    channel.channel_id,
+                    date,
+                    [raw_message(self.raw_spool.pop(message), threads) for message in date_messages],
+                    merge=self.incremental,
+                )
+        if rows is not None:
+            with METRICS.timer("write", phase="search_index"):
+                self.search_index.add_messages(channel.channel_id, channel.channel_name, rows)
+        threads.release(date_messages)
+
+    def write_archive(self, failures):
+        """Splice the spooled days into the archive once the attachments are settled.
+
+        `failures` are the replacements returned by joining channel.pending_downloads.
+        """
+        channel = self.channel
+        if channel.attachments is not None:
+            channel.attachments.save()
+
+        # Days showing a failed download are rendered again next time to retry it
+        failed_texts = set(failures.values()) & {job[2] for job in channel.pending_downloads}
+        incomplete_days = []
+
+        def patched_days():
+            for date, lines in apply_download_failures(self.spool.iter_days(), failures):
+                if lines and failed_texts and any(text in line for line in lines for text in failed_texts):
+                    incomplete_days.append(date)
+                yield date, lines
+
+        # Save merged messages (only the changed tail of the file is rewritten)
+        with METRICS.timer("write", phase="archive"):
+            self.archive.write_days(patched_days(), self.incremental)
+        if self.fingerprints is not None:
+            if self.incremental:
+                # Only a delta was fetched for these days, so its fingerprint does not describe them
+                self.fingerprints.discard(self.day_prints)
+            else:
+                self.fingerprints.replace_from(self.day_prints)
+                incomplete_days.extend(date for date, value in self.day_prints.items() if value is None)
+                self.fingerprints.discard(incomplete_days)
+            self.fingerprints.save()
+
+    def close(self, finished):
+        # A spool referenced by the checkpoint is kept until the channel completes
+        channel_id = self.channel.channel_id
+        checkpointed = self.checkpoint is not None and self.checkpoint.get_channel(channel_id) is not None
+        self.spool.close(keep=checkpointed and not finished)
+        if self.raw_spool is not None:
+            self.raw_spool.close(keep=checkpointed and not finished)
+
+    def complete(self):
+        """Record a successfully saved channel; returns its message count."""
+        channel_id, channel_type = self.channel.channel_id, self.channel.channel_type
+        # Remember the newest message so the next run only fetches the delta
+        self.sync_state.update(
+            channel_id, self.latest, self.message_count, full_resync=not self.incremental
+        )
+        self.sync_state.save()
+        if self.checkpoint is not None:
+            self.checkpoint.mark_completed(channel_id)
+        METRICS.incr("channels", type=channel_type)
+        METRICS.incr("messages", self.message_count, type=channel_type)
+        return self.message_count
+
+
+# Function to add the days of several history windows to a backup at the same time
+# Each window is fetched and grouped into days on its own worker thread; days
+# are rendered one at a time (the spool puts them in order). Stops every
+# window and re-raises as soon as one of them fails.
+def add_windows_concurrently(backup, streams):
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def add_window(pages):
+        for date, date_messages in iter_messages_by_date(pages):
+            if stop.is_set():
+                return
+            # Wait for the day's threads before taking the lock other windows render under
+            backup.threads.wait(date_messages)
+            with lock:
+                if not backup.skip_day(date, date_messages):
+                    backup.render_day(date, date_messages)
+
+    with ThreadPoolExecutor(max_workers=len(streams)) as executor:
+        futures = [executor.submit(add_window, pages) for pages in streams]
+        done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+        failed = [future for future in done if future.exception() is not None]
+        if failed:
+            stop.set()
+            raise failed[0].exception()
+
+
+# Function to fetch and save messages
+# Returns the number of messages saved, or None if the history could not be fetched.
+# `progress=False` silences the per-channel status lines (used by the concurrent scheduler).
+#
+# History is processed as a stream: pages are grouped into days as they arrive,
+# each finished day is rendered and spooled to disk, and the new days are then
+# spliced into the archive. Peak memory is one page plus one day of messages,
+# held as CompactMessage records rather than full API payloads.
+#
+# With a `checkpoint`, progress is saved every Checkpoint_Pages pages and a
+# channel left half-fetched by an earlier run continues from its saved cursor.
+#
+# With History_Slices > 1, a whole history (first backup or full resync) that
+# is longer than one page is fetched as that many time windows in parallel,
+# back to the conversation's `created` time. Sliced conversations are not
+# checkpointed: an interrupted one is fetched again.
+def fetch_and_save_messages(
+    channel_id,
+    channel_name,
+    channel_type,
+    slack=None,
+    sync_state=None,
+    config=None,
+    progress=True,
+    downloads=None,
+    checkpoint=None,
+    search_index=None,
+    created=None,
+):
+    if config is None:
+        config = load_config()
+    if slack is None:
+        slack = SlackAPI(config["slack_token"], **slack_api_options(config))
+    if sync_state is None:
+        sync_state = SyncState(os.path.join(config["state_dir"], "sync_state.json"))
+    own_downloads = downloads is None
+    if own_downloads:
+        downloads = DownloadPool(config["slack_token"], config["download_workers"])
+    own_search_index = search_index is None and config["search_index"]
+    if own_search_index:
+        search_index = SearchIndex(os.path.join(config["state_dir"], "search.db"))
+
+    if progress:
+        print(f"Saving {channel_name}...", end="\r")
+
+    # Thread replies are fetched concurrently as soon as their parent's page arrives
+    threads = ThreadFetcher(
+        slack,
+        channel_id,
+        channel_name,
+        cache_file=thread_cache_path(config["state_dir"], channel_id),
+        raw_store=thread_reply_store(config),
+        workers=config["thread_workers"],
+    )
+    backup = ChannelBackup(
+        channel_id,
+        channel_name,
+        channel_type,
+        slack,
+        threads,
+        sync_state,
+        config,
+        downloads,
+        checkpoint,
+        search_index,
+    )
+    request = backup.history_request()
+    if request is None:
+        history = iter([])
+    else:
+        history = slack.iter_conversations_history(channel_id, channel_name, **request)
+    # Messages are projected to compact records as each page arrives
+    pages = threads.iter_pages(compact_pages(history, backup.keep_raw))
+    finished = False
+
+    try:
+        streams = [pages]
+        if config["history_slices"] > 1 and created and request == {"oldest": None}:
+            streams = slice_history(
+                pages,
+                created,
+                config["history_slices"],
+                lambda **bounds: threads.iter_pages(
+                    compact_pages(
+                        slack.iter_conversations_history(channel_id, channel_name, **bounds), backup.keep_raw
+                    )
+                ),
+            )
+        if len(streams) > 1:
+            add_windows_concurrently(backup, streams)
+        else:
+            pages = itertools.chain(*streams)
+            for date, date_messages in iter_messages_by_date(pages, backup.partial, backup.save_progress):
+                if not backup.skip_day(date, date_messages):
+                    backup.render_day(date, date_messages)
+
+        # Wait for this channel's attachments and mark the ones that failed
+        with METRICS.timer("download_wait"):
+            failures = downloads.join(backup.channel.pending_downloads)
+        backup.write_archive(failures)
+        finished = True
+    except SlackApiError as e:
+        # Keep the previous archive and high-water mark untouched
+        print(f"Error fetching messages from {channel_name}: {e.response['error']}")
+        METRICS.incr("channel_failures", type=channel_type)
+        return None
+    finally:
+        backup.close(finished)
+        threads.close()
+        threads.save()
+        if own_downloads:
+            downloads.close()
+        if own_search_index:
+            search_index.close()
+
+    message_count = backup.complete()
+    if progress:
+        print(f"Saved {message_count} messages from {channel_name} to {backup.file_path}")
+    return message_count
+
+
+# Function to rebuild one conversation's Markdown from the raw message store
+# Works without network access: user names come from the cached user directory,
+# replies from the store, and attachments that were never downloaded are marked
+# as failed. Returns the number of messages rendered.
+def render_saved_messages(channel_id, config):
+    raw_store = RawStore(os.path.join(config["state_dir"], "raw"))
+    info = raw_store.read_channel(channel_id)
+    slack = OfflineSlack(UserDirectory(os.path.join(config["state_dir"], "users.json")))
+    threads = StoredThreads()
+    downloads = NoDownloads()
+
+    channel = ChannelContext(channel_id, info["name"], info["type"], config)
+    os.makedirs(channel.folder_name, exist_ok=True)
+    if config["backup_attachments"]:
+        channel.attachments = AttachmentManifest(channel.attachment_folder)
+
+    message_count = 0
+    # Not `.md.spool`: that one may belong to a checkpointed backup waiting for --resume
+    spool = DaySpool(f"{channel.file_path}.render.spool")
+    try:
+        for date, date_messages in raw_store.iter_days(channel_id):
+            spool.add(
+                date,
+                [
+                    render_message(slack, config, channel, message, downloads, threads)
+                    for message in date_messages
+                ],
+            )
+            message_count += len(date_messages)
+        failures = downloads.join(channel.pending_downloads)
+        open_archive(channel.file_path, config["archive_layout"]).write_days(
+            apply_download_failures(spool.iter_days(), failures)
+        )
+    finally:
+        spool.close()
+    return message_count
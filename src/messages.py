@@ -0,0 +1,101 @@
+import sys
+
+from collections.abc import Mapping
+from src.api import HistoryPage
+
+
+# Fields of a file SlackDown renders, fingerprints, downloads or plans with
+FILE_FIELDS = ("id", "name", "mimetype", "url_private", "mode", "size")
+
+
+class CompactMessage(Mapping):
+    """The fields of a Slack message SlackDown uses, in `__slots__`.
+
+    A history message from the API carries rich-text `blocks`, unfurl
+    `attachments`, full file metadata and more, none of which the archive
+    shows. `compact_message` projects it onto this record as soon as its page
+    arrives and the raw dict is dropped. It reads like the dict it replaces
+    (`message["ts"]`, `message.get("files")`, `"reactions" in message`), so the
+    renderer, threads, fingerprints and search index take either; absent fields
+    are None. `dict(message)` gives the JSON-serializable form.
+    """
+
+    __slots__ = (
+        "ts",
+        "user",
+        "text",
+        "thread_ts",
+        "reply_count",
+        "latest_reply",
+        "edited",
+        "reactions",
+        "files",
+        "attachments",
+    )
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    def __getitem__(self, key):
+        value = getattr(self, key, None) if key in self.__slots__ else None
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __iter__(self):
+        return (name for name in self.__slots__ if getattr(self, name) is not None)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"CompactMessage({dict(self)!r})"
+
+
+# Function to project an API message onto a CompactMessage
+# Reactions keep their name and count, files their FILE_FIELDS, edits their ts
+# and unfurl attachments only their image blocks (the only part the renderer
+# shows), collected into one attachment.
+def compact_message(message):
+    user = message.get("user")
+    edited = message.get("edited")
+    reactions = message.get("reactions")
+    files = message.get("files")
+    images = [
+        {"type": "image", "image_url": block["image_url"]}
+        for attachment in message.get("attachments") or []
+        for block in attachment.get("blocks") or []
+        if block.get("type") == "image" and block.get("image_url")
+    ]
+    return CompactMessage(
+        ts=message.get("ts"),
+        user=sys.intern(user) if user else user,
+        text=message.get("text"),
+        thread_ts=message.get("thread_ts"),
+        reply_count=message.get("reply_count"),
+        latest_reply=message.get("latest_reply"),
+        edited={"ts": edited.get("ts")} if edited else None,
+        reactions=[
+            {"name": sys.intern(r["name"]), "count": r.get("count")} for r in reactions
+        ] if reactions is not None else None,
+        files=[
+            {field: f[field] for field in FILE_FIELDS if field in f} for f in files
+        ] if files is not None else None,
+        attachments=[{"blocks": images}] if images else None,
+    )
+
+
+# Function to project every message of a history page
+# `keep_raw`, if given, is called with the page's original messages first
+# (ChannelBackup spools them for the raw store).
+def compact_page(page, keep_raw=None):
+    if keep_raw is not None:
+        keep_raw(page)
+    return HistoryPage([compact_message(m) for m in page], getattr(page, "next_cursor", None))
+
+
+# Function to project every message of a history page stream as it arrives
+def compact_pages(pages, keep_raw=None):
+    for page in pages:
+        yield compact_page(page, keep_raw)
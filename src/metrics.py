@@ -0,0 +1,137 @@
+import os
+import json
+import time
+import threading
+
+from contextlib import contextmanager
+
+
+class Metrics:
+    """Thread-safe counters and timers for one SlackDown run.
+
+    Every metric has a name and optional labels, e.g.
+    `METRICS.incr("api_errors", method="users_info")` or
+    `with METRICS.timer("api", method="conversations_history"): ...`.
+    A timer records how many times it ran and the total seconds spent.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.timers = {}
+            self.started = time.time()
+
+    def incr(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            count, total = self.timers.get(key, (0, 0.0))
+            self.timers[key] = (count + 1, total + seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def merge(self, summary, **labels):
+        """Add the counters and timers of another run's summary (e.g. from a child process)."""
+        with self._lock:
+            for counter in summary["counters"]:
+                key = (counter["name"], tuple(sorted({**counter["labels"], **labels}.items())))
+                self.counters[key] = self.counters.get(key, 0) + counter["value"]
+            for timer in summary["timers"]:
+                key = (timer["name"], tuple(sorted({**timer["labels"], **labels}.items())))
+                count, total = self.timers.get(key, (0, 0.0))
+                self.timers[key] = (count + timer["count"], total + timer["seconds"])
+
+    def summary(self):
+        """The run's metrics as a JSON-serializable dict."""
+        with self._lock:
+            counters = sorted(self.counters.items())
+            timers = sorted(self.timers.items())
+            started = self.started
+        return {
+            "started": started,
+            "duration_seconds": time.time() - started,
+            "counters": [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in counters
+            ],
+            "timers": [
+                {"name": name, "labels": dict(labels), "count": count, "seconds": seconds}
+                for (name, labels), (count, seconds) in timers
+            ],
+        }
+
+
+# Process-wide metrics of the current run
+METRICS = Metrics()
+
+
+# Function to format one Prometheus sample line
+def _prometheus_sample(name, labels, value):
+    if labels:
+        label_text = ",".join(
+            '{}="{}"'.format(key, str(val).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+            for key, val in labels.items()
+        )
+        name = f"{name}{{{label_text}}}"
+    return f"{name} {value}\n"
+
+
+# Function to render a run summary in the Prometheus text exposition format
+# Counters become `slackdown_<name>_total`; timers become `slackdown_<name>_seconds`
+# summaries (`_sum` seconds and `_count` calls).
+def format_prometheus(summary):
+    families = {}
+    for counter in summary["counters"]:
+        name = f"slackdown_{counter['name']}_total"
+        families.setdefault((name, "counter"), []).append((name, counter["labels"], counter["value"]))
+    for timer in summary["timers"]:
+        name = f"slackdown_{timer['name']}_seconds"
+        samples = families.setdefault((name, "summary"), [])
+        samples.append((f"{name}_sum", timer["labels"], round(timer["seconds"], 6)))
+        samples.append((f"{name}_count", timer["labels"], timer["count"]))
+
+    lines = []
+    for (family, metric_type), samples in families.items():
+        lines.append(f"# TYPE {family} {metric_type}\n")
+        lines.extend(_prometheus_sample(name, labels, value) for name, labels, value in samples)
+    lines.append("# TYPE slackdown_last_run_timestamp_seconds gauge\n")
+    lines.append(f"slackdown_last_run_timestamp_seconds {summary['started']:.3f}\n")
+    lines.append("# TYPE slackdown_run_duration_seconds gauge\n")
+    lines.append(f"slackdown_run_duration_seconds {summary['duration_seconds']:.3f}\n")
+    return "".join(lines)
+
+
+# Function to replace a file atomically so a collector never reads a partial file
+def _write_atomic(file_path, text):
+    folder = os.path.dirname(file_path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    temp_path = f"{file_path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(temp_path, file_path)
+
+
+# Function to write the run summary as JSON and as a Prometheus textfile
+# (src.helper is not used here: it reports its downloads to this module)
+def write_metrics(json_path, prometheus_path, metrics=METRICS):
+    summary = metrics.summary()
+    if json_path:
+        _write_atomic(json_path, json.dumps(summary, indent=2))
+    if prometheus_path:
+        _write_atomic(prometheus_path, format_prometheus(summary))
+    return summary
@@ -0,0 +1,124 @@
+import math
+import time
+
+from slack_sdk.errors import SlackApiError
+from src.api import METHOD_TIERS, TIER_LIMITS
+from src.helper import load_json, save_json
+from src.threads import ThreadCache, is_thread_parent, thread_cache_path, thread_reply_store
+
+
+# Messages requested per conversations.history / conversations.replies page
+PAGE_SIZE = 200
+
+
+# Function to fetch the newest history pages of a conversation as a sample
+# Returns (messages, complete) where `complete` tells the sample is the whole
+# history newer than `oldest`.
+def sample_history(slack, channel_id, channel_name, oldest=None, pages=2):
+    sample = []
+    for page in slack.iter_conversations_history(channel_id, channel_name, oldest=oldest):
+        sample.extend(page)
+        pages -= 1
+        if page.next_cursor and pages <= 0:
+            return sample, False
+    return sample, True
+
+
+# Function to estimate a conversation's backup from a sample of its newest messages
+# An incomplete sample is extrapolated over the rest of the history, back to
+# `since` (the high-water mark of an incremental sync, or the conversation's
+# creation time), at the message rate seen in the sample. Threads whose
+# replies are cached as of their latest reply (`is_cached`) cost no request.
+def estimate_conversation(sample, complete, since=None, is_cached=None):
+    scale = 1.0
+    if not complete and since:
+        newest, oldest = float(sample[0]["ts"]), float(sample[-1]["ts"])
+        if newest > oldest:
+            scale = max(1.0, (newest - float(since)) / (newest - oldest))
+
+    parents = [m for m in sample if is_thread_parent(m)]
+    fetched = [m for m in parents if not (is_cached and is_cached(m))]
+    files = [f for m in sample for f in m.get("files", [])]
+    messages = len(sample) * scale
+    replies_calls = sum(math.ceil((m.get("reply_count", 0) + 1) / PAGE_SIZE) for m in fetched)
+    return {
+        "messages": round(messages),
+        "threads": round(len(parents) * scale),
+        "replies": round(sum(m.get("reply_count", 0) for m in parents) * scale),
+        "files": round(len(files) * scale),
+        "attachment_bytes": round(sum(f.get("size") or 0 for f in files) * scale),
+        "api_calls": {
+            "conversations_history": max(1, math.ceil(messages / PAGE_SIZE)),
+            "conversations_replies": round(replies_calls * scale),
+        },
+        "exact": complete,
+    }
+
+
+# Function to estimate how long API calls take under the rate limiter
+# Every tier has its own token bucket shared by all conversations, so the
+# busiest tier sets the time (however many workers run at once).
+def estimate_seconds(api_calls, rate_limit_multiplier=1.0):
+    per_tier = {}
+    for method, calls in api_calls.items():
+        tier = METHOD_TIERS.get(method, 3)
+        per_tier[tier] = per_tier.get(tier, 0) + calls * 60 / (TIER_LIMITS[tier] * rate_limit_multiplier)
+    return max(per_tier.values(), default=0.0)
+
+
+# Function to plan the backup of one (id, name, type, channel) job from a sample of its history
+def plan_conversation(slack, job, sync_state, config):
+    channel_id, channel_name, channel_type, channel = job
+    oldest = None if config["full_resync"] else sync_state.get_latest(channel_id)
+    entry = {"id": channel_id, "name": channel_name, "type": channel_type}
+    try:
+        sample, complete = sample_history(
+            slack, channel_id, channel_name, oldest, config["plan_sample_pages"]
+        )
+    except SlackApiError as e:
+        return dict(entry, error=e.response["error"], api_calls={}, seconds=0.0)
+
+    threads = ThreadCache(
+        slack,
+        channel_id,
+        channel_name,
+        thread_cache_path(config["state_dir"], channel_id),
+        thread_reply_store(config),
+    )
+    entry.update(estimate_conversation(sample, complete, oldest or channel.get("created"), threads.is_cached))
+    entry["seconds"] = estimate_seconds(entry["api_calls"], config["rate_limit_multiplier"])
+    return entry
+
+
+# Function to add up the estimates of every planned conversation
+def plan_totals(conversations, rate_limit_multiplier=1.0):
+    totals = {"messages": 0, "threads": 0, "replies": 0, "files": 0, "attachment_bytes": 0}
+    api_calls = {}
+    for conversation in conversations:
+        for key in totals:
+            totals[key] += conversation.get(key, 0)
+        for method, calls in conversation["api_calls"].items():
+            api_calls[method] = api_calls.get(method, 0) + calls
+    totals["api_calls"] = api_calls
+    totals["seconds"] = estimate_seconds(api_calls, rate_limit_multiplier)
+    return totals
+
+
+# Function to save a plan (its conversations longest first) and return it
+def save_plan(plan_file, conversations, rate_limit_multiplier=1.0):
+    plan = {
+        "created": time.time(),
+        "rate_limit_multiplier": rate_limit_multiplier,
+        "conversations": sorted(conversations, key=lambda c: c["seconds"], reverse=True),
+        "totals": plan_totals(conversations, rate_limit_multiplier),
+    }
+    save_json(plan_file, plan)
+    return plan
+
+
+# Function to load the estimated seconds per conversation of a saved plan, or None
+def load_plan(plan_file):
+    plan = load_json(plan_file, None)
+    if not plan:
+        return None
+    return {conversation["id"]: conversation["seconds"] for conversation in plan["conversations"]}
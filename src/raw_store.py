@@ -0,0 +1,162 @@
+import os
+import gzip
+import json
+import threading
+
+from src.helper import load_json, save_json
+
+
+# Key under which a thread parent's replies are stored next to its raw payload
+REPLIES_KEY = "slackdown_replies"
+
+
+class RawStore:
+    """Raw Slack API messages, partitioned by channel and day.
+
+    Layout: `<root>/<channel_id>/channel.json` (id, name, type) and one
+    gzip-compressed JSON Lines file per day, `<root>/<channel_id>/<date>.jsonl.gz`,
+    holding that day's messages in chronological order. Thread parents carry
+    their replies under `slackdown_replies`. This is enough to rebuild every
+    Markdown file without talking to Slack.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def _channel_dir(self, channel_id):
+        return os.path.join(self.root, channel_id)
+
+    def _day_path(self, channel_id, date):
+        return os.path.join(self._channel_dir(channel_id), f"{date}.jsonl.gz")
+
+    def write_channel(self, channel_id, channel_name, channel_type):
+        save_json(
+            os.path.join(self._channel_dir(channel_id), "channel.json"),
+            {"id": channel_id, "name": channel_name, "type": channel_type},
+        )
+
+    def read_channel(self, channel_id):
+        return load_json(os.path.join(self._channel_dir(channel_id), "channel.json"))
+
+    def list_channels(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(
+            name
+            for name in os.listdir(self.root)
+            if os.path.exists(os.path.join(self.root, name, "channel.json"))
+        )
+
+    def list_days(self, channel_id):
+        channel_dir = self._channel_dir(channel_id)
+        if not os.path.isdir(channel_dir):
+            return []
+        return sorted(name[: -len(".jsonl.gz")] for name in os.listdir(channel_dir) if name.endswith(".jsonl.gz"))
+
+    def read_day(self, channel_id, date):
+        path = self._day_path(channel_id, date)
+        if not os.path.exists(path):
+            return []
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def write_day(self, channel_id, date, messages, merge=False):
+        """Store a day's messages; with `merge=True` they are merged by ts into what is stored."""
+        if merge:
+            by_ts = {m.get("ts"): m for m in self.read_day(channel_id, date)}
+            by_ts.update((m.get("ts"), m) for m in messages)
+            messages = sorted(by_ts.values(), key=lambda m: float(m.get("ts", 0)))
+        path = self._day_path(channel_id, date)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with gzip.open(temp_path, "wt", encoding="utf-8") as f:
+            for message in messages:
+                f.write(json.dumps(message, ensure_ascii=False, separators=(",", ":")))
+                f.write("\n")
+        os.replace(temp_path, path)
+
+    def day_signature(self, channel_id, date):
+        """(size, mtime_ns) of a stored day, which changes whenever the day is written."""
+        stat = os.stat(self._day_path(channel_id, date))
+        return stat.st_size, stat.st_mtime_ns
+
+    def iter_days(self, channel_id):
+        """Yield (date, messages) for every stored day in ascending order."""
+        for date in self.list_days(channel_id):
+            yield date, self.read_day(channel_id, date)
+
+
+class RawSpool:
+    """Original API payloads of fetched messages, parked on disk until their day is stored.
+
+    History pages are projected to compact records as soon as they arrive
+    (`src.messages`); their original messages are appended here first, so the
+    raw store still receives every field Slack sent (subtype, bot_id, blocks,
+    ...) without holding them in memory. Only {ts: (offset, length)} is kept
+    per message still waiting. Like the DaySpool it is checkpointed (`state`),
+    so the unfinished day of a resumed run is stored with its payloads too.
+    """
+
+    def __init__(self, spool_path, resume=None):
+        self.spool_path = spool_path
+        self._lock = threading.Lock()
+        self._index = {}
+        if resume and os.path.exists(spool_path):
+            # Continue a checkpointed spool; anything written after the checkpoint is dropped
+            self._file = open(spool_path, "r+b")
+            self._file.truncate(resume["size"])
+            self._index = {ts: tuple(entry) for ts, entry in resume["index"].items()}
+        else:
+            self._file = open(spool_path, "w+b")
+
+    def add(self, messages):
+        with self._lock:
+            self._file.seek(0, os.SEEK_END)
+            for message in messages:
+                data = json.dumps(message, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+                self._index[message.get("ts")] = (self._file.tell(), len(data))
+                self._file.write(data)
+
+    def pop(self, message):
+        """The original payload of a (compact) message, or the message itself if it was not spooled."""
+        with self._lock:
+            entry = self._index.pop(message.get("ts"), None)
+            if entry is None:
+                return message
+            self._file.seek(entry[0])
+            return json.loads(self._file.read(entry[1]).decode("utf-8"))
+
+    def discard(self, messages):
+        with self._lock:
+            for message in messages:
+                self._index.pop(message.get("ts"), None)
+
+    def state(self):
+        """Flush the spool and describe it for a checkpoint."""
+        with self._lock:
+            self._file.flush()
+            self._file.seek(0, os.SEEK_END)
+            return {"index": dict(self._index), "size": self._file.tell()}
+
+    def close(self, keep=False):
+        """Close the spool; `keep=True` leaves the file for a resumed run."""
+        self._file.close()
+        if not keep and os.path.exists(self.spool_path):
+            os.remove(self.spool_path)
+
+
+class StoredThreads:
+    """Serves thread replies from the raw store (offline stand-in for ThreadFetcher)."""
+
+    def get_replies(self, message):
+        return message.get(REPLIES_KEY, [])
+
+
+class OfflineSlack:
+    """Resolves user names from the cached user directory only, without network access."""
+
+    def __init__(self, users):
+        self.users = users
+
+    def get_user_display_name(self, user_id):
+        return self.users.get(user_id, allow_stale=True) or "Unknown User"
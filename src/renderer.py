@@ -0,0 +1,124 @@
+import re
+import unicodedata
+
+from functools import lru_cache
+from emoji import EMOJI_DATA
+from emoji.unicode_codes import STATUS
+
+
+# Emoji alias mapping for Slack-specific emojis
+SLACK_EMOJI_MAPPING = {
+    "+1": "👍",
+    "-1": "👎",
+    "joy": "😂",
+    "exploding_head": "🤯",
+    "ok_hand": "👌",
+    "ok": "🆗",
+    "white_check_mark": "✅",
+    "zzz": "💤",
+    "raised_hands": "🙌",
+    "smiling_imp": "😈",
+    "tada": "🎉",
+    "scream_cat": "🙀",
+    "pensive": "😔",
+    "smiling_face_with_3_hearts": "🥰",
+    "mega": "📣",
+    "smiley": "😃",
+    "cry": "😢",
+    "smile": "😄",
+    "laughing": "😆",
+    "heart": "❤️",
+    # Add more mappings as needed
+}
+
+
+# Function to build the alias -> emoji lookup table
+# Slack-specific aliases win over the emoji package's English names, which win
+# over its GitHub-style aliases (the names Slack mostly uses).
+def build_emoji_table():
+    table = {}
+    aliases = {}
+    for emoji_char, data in EMOJI_DATA.items():
+        if data["status"] > STATUS["fully_qualified"]:
+            continue
+        table.setdefault(data["en"][1:-1], emoji_char)
+        for alias in data.get("alias", []):
+            aliases.setdefault(alias[1:-1], emoji_char)
+    for alias, emoji_char in aliases.items():
+        table.setdefault(alias, emoji_char)
+    table.update(SLACK_EMOJI_MAPPING)
+    return table
+
+
+EMOJI_TABLE = build_emoji_table()
+
+# One pass over the text finds code fences, user mentions, @channel and :emoji: aliases
+TOKEN_PATTERN = re.compile(
+    r"(?P<fence>```)"
+    r"|<@(?P<user>[A-Z0-9]+)(?:\|[^>]*)?>"
+    r"|(?P<channel><!channel>)"
+    r"|:(?P<emoji>[^:\s`<>]+):"
+)
+
+
+# Function to look up an emoji alias (None if unknown)
+def lookup_emoji(name):
+    emoji_char = EMOJI_TABLE.get(name)
+    if emoji_char is None:
+        emoji_char = EMOJI_TABLE.get(unicodedata.normalize("NFKC", name))
+    return emoji_char
+
+
+# Function to render Slack mrkdwn text to Markdown in a single pass
+# Mentions become `@name` (resolved through `resolve_user`), `<!channel>` becomes
+# `@channel`, emoji aliases become emoji, and ``` fences are put on their own
+# lines. Text inside code blocks is left untouched.
+def render_text(text, resolve_user):
+    if not text:
+        return text
+
+    parts = []  # text between fences; odd entries are code blocks
+    current = []
+    in_code_block = False
+    pos = 0
+    while True:
+        match = TOKEN_PATTERN.search(text, pos)
+        if match is None:
+            current.append(text[pos:])
+            break
+        current.append(text[pos:match.start()])
+        pos = match.end()
+        if match.group("fence"):
+            parts.append("".join(current))
+            current = []
+            in_code_block = not in_code_block
+        elif in_code_block:
+            current.append(match.group(0))
+        elif match.group("user"):
+            current.append(f"`@{resolve_user(match.group('user'))}`")
+        elif match.group("channel"):
+            current.append("`@channel`")
+        else:
+            emoji_char = lookup_emoji(match.group("emoji"))
+            if emoji_char is None:
+                # Not an alias: keep the text, and let the closing colon open the next one
+                current.append(match.group(0)[:-1])
+                pos -= 1
+            else:
+                current.append(emoji_char)
+    parts.append("".join(current))
+
+    if len(parts) == 1:
+        return parts[0]
+
+    # Detect and format code blocks
+    return "\n".join(
+        f"```\n{part.strip()}\n```" if i % 2 else part for i, part in enumerate(parts)
+    )
+
+
+# Function to render a reaction name (memoized: workspaces reuse a small set of reactions)
+# Skin tone variants ("thumbsup::skin-tone-2") are shown with the base emoji.
+@lru_cache(maxsize=4096)
+def render_reaction(name):
+    return render_text(f":{name.split('::')[0]}:", None)
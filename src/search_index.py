@@ -0,0 +1,120 @@
+import os
+import sqlite3
+import threading
+
+from datetime import datetime
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    channel_id TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    ts TEXT NOT NULL,
+    thread_ts TEXT,
+    date TEXT NOT NULL,
+    user_id TEXT,
+    user TEXT,
+    text TEXT NOT NULL,
+    UNIQUE (channel_id, ts)
+);
+CREATE INDEX IF NOT EXISTS messages_by_date ON messages (channel_id, date);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    text, user, channel, content='messages', content_rowid='id', tokenize='unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, text, user, channel) VALUES (new.id, new.text, new.user, new.channel);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_ad AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, text, user, channel)
+    VALUES ('delete', old.id, old.text, old.user, old.channel);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_au AFTER UPDATE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, text, user, channel)
+    VALUES ('delete', old.id, old.text, old.user, old.channel);
+    INSERT INTO messages_fts (rowid, text, user, channel) VALUES (new.id, new.text, new.user, new.channel);
+END;
+"""
+
+# Insert a message, or update it only if it was edited (or its names changed)
+UPSERT = """
+INSERT INTO messages (channel_id, channel, ts, thread_ts, date, user_id, user, text)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (channel_id, ts) DO UPDATE SET
+    channel = excluded.channel, thread_ts = excluded.thread_ts, date = excluded.date,
+    user_id = excluded.user_id, user = excluded.user, text = excluded.text
+WHERE messages.text IS NOT excluded.text
+    OR messages.user IS NOT excluded.user
+    OR messages.channel IS NOT excluded.channel
+"""
+
+
+class SearchIndex:
+    """SQLite FTS5 full-text index of every backed-up message and thread reply.
+
+    Messages are keyed by (channel_id, ts) and also carry the date, user and
+    thread they belong to. Adding a message that is already indexed with the
+    same text is a no-op, so a sync only touches new and edited messages.
+    One index can be shared by several worker threads.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        folder = os.path.dirname(db_path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._lock = threading.Lock()
+        # The processes backing up one workspace's shards write the same index
+        self._db = sqlite3.connect(db_path, timeout=60, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+
+    def add_messages(self, channel_id, channel_name, messages):
+        """Index (ts, thread_ts, user_id, user_name, text) tuples of one channel."""
+        rows = [
+            (
+                channel_id,
+                channel_name,
+                ts,
+                thread_ts,
+                datetime.fromtimestamp(float(ts)).strftime("%Y-%m-%d"),
+                user_id,
+                user_name,
+                text or "",
+            )
+            for ts, thread_ts, user_id, user_name, text in messages
+        ]
+        with self._lock, self._db:
+            self._db.executemany(UPSERT, rows)
+
+    def search(self, query, channel=None, user=None, limit=20):
+        """Return the best matches of an FTS5 query, most relevant first."""
+        sql = (
+            "SELECT m.channel, m.date, m.ts, m.thread_ts, m.user,"
+            " snippet(messages_fts, 0, '**', '**', '...', 16)"
+            " FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid"
+            " WHERE messages_fts MATCH ?"
+        )
+        params = [query]
+        if channel:
+            sql += " AND m.channel = ?"
+            params.append(channel)
+        if user:
+            sql += " AND m.user = ?"
+            params.append(user)
+        sql += " ORDER BY bm25(messages_fts) LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        return [
+            dict(zip(("channel", "date", "ts", "thread_ts", "user", "snippet"), row))
+            for row in rows
+        ]
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,43 @@
+import threading
+
+from src.helper import load_json, update_json
+
+
+class SyncState:
+    """Per-channel high-water marks persisted between runs.
+
+    Stored as {channel_id: {"latest": <newest message ts>, "messages": <total saved>}}.
+    One file serves a whole workspace: `save` only writes the channels this
+    process updated, so the processes backing up its shards share it.
+    """
+
+    def __init__(self, state_file=None):
+        self.state_file = state_file
+        self._lock = threading.Lock()
+        self._channels = (load_json(state_file, {}) or {}) if state_file else {}
+        self._updated = set()
+
+    def get_latest(self, channel_id):
+        """Return the newest `ts` already backed up for the channel, or None."""
+        with self._lock:
+            return self._channels.get(channel_id, {}).get("latest")
+
+    def get_message_count(self, channel_id):
+        with self._lock:
+            return self._channels.get(channel_id, {}).get("messages", 0)
+
+    def update(self, channel_id, latest, new_messages, full_resync=False):
+        """Advance the channel's high-water mark after a successful save."""
+        with self._lock:
+            entry = self._channels.setdefault(channel_id, {})
+            if latest and float(latest) > float(entry.get("latest") or 0):
+                entry["latest"] = latest
+            entry["messages"] = new_messages + (0 if full_resync else entry.get("messages", 0))
+            self._updated.add(channel_id)
+
+    def save(self):
+        if not self.state_file:
+            return
+        with self._lock:
+            updated = {channel_id: dict(self._channels[channel_id]) for channel_id in self._updated}
+        update_json(self.state_file, lambda channels: dict(channels or {}, **updated))
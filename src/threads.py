@@ -0,0 +1,267 @@
+import os
+import json
+import asyncio
+import threading
+
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from src.raw_store import REPLIES_KEY, RawStore
+
+
+# Function to tell a real thread parent from a reply that was also sent to the channel
+def is_thread_parent(message):
+    return message.get("thread_ts") == message.get("ts") and message.get("reply_count", 0) > 0
+
+
+class ThreadCache:
+    """Which of one channel's threads are stored, by the parent's `latest_reply`.
+
+    Only {thread_ts: latest_reply} is kept, as an append-only JSON Lines log
+    (each checkpoint appends the threads fetched since the last one). The
+    replies themselves are read back from the raw message store, where the
+    parent's day holds them, so a thread that has not changed since the last
+    run is never fetched again. Without a raw store every thread is fetched.
+    Replies fetched (or read) in this run stay in memory until their day has
+    been written (`release`). Base of ThreadFetcher and AsyncThreadFetcher,
+    which only differ in how they fetch.
+    """
+
+    def __init__(self, slack, channel_id, channel_name, cache_file=None, raw_store=None):
+        self.slack = slack
+        self.channel_id = channel_id
+        self.channel_name = channel_name
+        self.cache_file = cache_file
+        self.raw_store = raw_store
+        self._lock = threading.Lock()
+        self._futures = {}
+        # Threads whose replies could not be fetched in this run
+        self.failed = set()
+        self.latest_replies, self._logged = self._load()
+        self._unsaved = {}
+        self._replies = {}
+        self._raw_day = None
+
+    def _load(self):
+        """Read the log; returns ({thread_ts: latest_reply}, number of lines)."""
+        latest_replies, lines = {}, 0
+        if self.cache_file and os.path.exists(self.cache_file):
+            with open(self.cache_file, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        thread_ts, latest_reply = json.loads(line)
+                    except ValueError:
+                        continue  # Cut short by an interrupted run
+                    latest_replies[thread_ts] = latest_reply
+                    lines += 1
+        return latest_replies, lines
+
+    def _stored_replies(self, message):
+        """Replies of a thread as stored with its parent in the raw store, or None."""
+        if self.raw_store is None:
+            return None
+        date = datetime.fromtimestamp(float(message["ts"])).strftime("%Y-%m-%d")
+        if self._raw_day is None or self._raw_day[0] != date:
+            stored = self.raw_store.read_day(self.channel_id, date)
+            self._raw_day = (date, {m.get("ts"): m for m in stored if is_thread_parent(m)})
+        parent = self._raw_day[1].get(message["ts"])
+        if parent is None or parent.get("latest_reply") != message.get("latest_reply"):
+            return None
+        return parent.get(REPLIES_KEY)
+
+    def is_cached(self, message):
+        """Whether the thread's replies are stored as of the parent's `latest_reply`."""
+        held = self._replies.get(message["ts"])
+        if held is not None:
+            return held[0] == message.get("latest_reply")
+        if self.latest_replies.get(message["ts"]) != message.get("latest_reply"):
+            return False
+        replies = self._stored_replies(message)
+        if replies is None:
+            return False
+        self._replies[message["ts"]] = (message.get("latest_reply"), replies)
+        return True
+
+    def _store(self, message, thread_messages):
+        """Keep the replies of a fetched thread (parent message first) and return them."""
+        thread_ts = message["ts"]
+        if thread_messages is None:
+            with self._lock:
+                self.failed.add(thread_ts)
+            return []  # Error already reported; retry on the next run
+        replies = [reply for reply in thread_messages if reply.get("ts") != thread_ts]
+        with self._lock:
+            self._replies[thread_ts] = (message.get("latest_reply"), replies)
+            self.latest_replies[thread_ts] = message.get("latest_reply")
+            self._unsaved[thread_ts] = message.get("latest_reply")
+        return replies
+
+    def load_stored(self, messages):
+        """Read the stored replies of the unchanged threads among `messages` (raw store reads)."""
+        with self._lock:
+            for message in messages:
+                if is_thread_parent(message):
+                    self.is_cached(message)
+
+    def has_failed(self, message):
+        """Whether the replies of a thread parent were missing when it was rendered."""
+        with self._lock:
+            return message.get("ts") in self.failed
+
+    def cached_replies(self, message):
+        """Replies of an already fetched thread (for the raw store), or []."""
+        with self._lock:
+            return self._replies.get(message["ts"], (None, []))[1]
+
+    def release(self, messages):
+        """Drop the replies of the thread parents among `messages` once their day is written."""
+        with self._lock:
+            for message in messages:
+                self._replies.pop(message.get("ts"), None)
+            self._raw_day = None
+
+    def save(self):
+        """Append the threads fetched since the last save (compacting a log that outgrew its index)."""
+        if not self.cache_file:
+            return
+        with self._lock:
+            unsaved, self._unsaved = self._unsaved, {}
+            if not unsaved:
+                return
+            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+            if self._logged + len(unsaved) > 2 * len(self.latest_replies):
+                entries, mode = self.latest_replies.items(), "w"
+                temp_path = f"{self.cache_file}.tmp"
+            else:
+                entries, mode = unsaved.items(), "a"
+                temp_path = self.cache_file
+            with open(temp_path, mode, encoding="utf-8") as f:
+                for thread_ts, latest_reply in entries:
+                    f.write(json.dumps([thread_ts, latest_reply]) + "\n")
+            if mode == "w":
+                os.replace(temp_path, self.cache_file)
+                self._logged = len(self.latest_replies)
+            else:
+                self._logged += len(unsaved)
+
+
+class ThreadFetcher(ThreadCache):
+    """Fetches the replies of one channel's threads in the background.
+
+    Parents seen in a history page are queued as soon as the page arrives so
+    the replies are usually ready by the time the message is rendered.
+    """
+
+    def __init__(self, slack, channel_id, channel_name, cache_file=None, raw_store=None, workers=4):
+        super().__init__(slack, channel_id, channel_name, cache_file, raw_store)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+    def _fetch(self, message):
+        thread_messages = self.slack.get_conversations_replies(
+            self.channel_id, self.channel_name, message["ts"]
+        )
+        return self._store(message, thread_messages)
+
+    def prefetch(self, messages):
+        """Queue reply fetches for the uncached thread parents among `messages`."""
+        for message in messages:
+            if not is_thread_parent(message):
+                continue
+            with self._lock:
+                if message["ts"] in self._futures or self.is_cached(message):
+                    continue
+                self._futures[message["ts"]] = self.executor.submit(self._fetch, message)
+
+    def iter_pages(self, pages):
+        """Pass history pages through, queueing their threads on the way."""
+        for page in pages:
+            self.prefetch(page)
+            yield page
+
+    def wait(self, messages):
+        """Block until the queued replies of the thread parents among `messages` are fetched."""
+        with self._lock:
+            futures = [self._futures[m["ts"]] for m in messages if m.get("ts") in self._futures]
+        for future in futures:
+            future.exception()  # errors surface in get_replies
+
+    def get_replies(self, message):
+        """Return the replies of a thread parent (without the parent itself)."""
+        with self._lock:
+            future = self._futures.pop(message["ts"], None)
+            if future is None and self.is_cached(message):
+                return self._replies[message["ts"]][1]
+        if future is None:
+            return self._fetch(message)
+        return future.result()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+class AsyncThreadFetcher(ThreadCache):
+    """asyncio counterpart of ThreadFetcher, for an AsyncSlackAPI.
+
+    `prefetch` starts one task per uncached thread as soon as its page
+    arrives. Rendering is synchronous, so `wait` has to be awaited for a day's
+    messages first; `get_replies` then answers from the finished tasks.
+    """
+
+    async def _fetch(self, message):
+        thread_messages = await self.slack.get_conversations_replies(
+            self.channel_id, self.channel_name, message["ts"]
+        )
+        return self._store(message, thread_messages)
+
+    def prefetch(self, messages):
+        """Start reply fetches for the uncached thread parents among `messages`."""
+        for message in messages:
+            if not is_thread_parent(message):
+                continue
+            if message["ts"] in self._futures or self.is_cached(message):
+                continue
+            self._futures[message["ts"]] = asyncio.ensure_future(self._fetch(message))
+
+    async def iter_pages(self, pages):
+        """Pass history pages through, starting their thread fetches on the way."""
+        async for page in pages:
+            if self.raw_store is not None:
+                # Stored replies are read off the event loop
+                await asyncio.to_thread(self.load_stored, page)
+            self.prefetch(page)
+            yield page
+
+    async def wait(self, messages):
+        """Wait until the replies of every thread parent among `messages` are available."""
+        self.prefetch(messages)
+        tasks = [self._futures[m["ts"]] for m in messages if m.get("ts") in self._futures]
+        if tasks:
+            await asyncio.gather(*tasks)
+
+    def get_replies(self, message):
+        """Return the replies of a thread parent (without the parent itself)."""
+        task = self._futures.pop(message["ts"], None)
+        if task is not None:
+            return task.result()
+        if self.is_cached(message):
+            return self._replies[message["ts"]][1]
+        return []
+
+    async def close(self):
+        """Cancel the fetches of threads that were never rendered (e.g. after an error)."""
+        tasks = list(self._futures.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._futures.clear()
+
+
+# Function to get the path of a channel's thread cache
+def thread_cache_path(state_dir, channel_id):
+    return os.path.join(state_dir, "threads", f"{channel_id}.jsonl")
+
+
+# Function to get the raw store replies of unchanged threads are read from (None if disabled)
+def thread_reply_store(config):
+    if not config["keep_raw_messages"]:
+        return None
+    return RawStore(os.path.join(config["state_dir"], "raw"))
@@ -0,0 +1,95 @@
+import time
+import threading
+
+from src.helper import load_json, update_json
+
+
+class UserDirectory:
+    """In-memory map of Slack user IDs to display names, persisted between runs.
+
+    Entries are stored as {"name": ..., "fetched": <epoch seconds>}. An entry
+    older than `ttl` seconds is considered stale and is refreshed on the next
+    bulk load or lookup.
+    """
+
+    def __init__(self, cache_file=None, ttl=24 * 3600):
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+        # Names that could not be resolved this run (not persisted)
+        self._unknown = set()
+        if cache_file:
+            self._entries = load_json(cache_file, {}) or {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _is_fresh(self, entry, now=None):
+        now = time.time() if now is None else now
+        return now - entry.get("fetched", 0) < self.ttl
+
+    def is_stale(self):
+        """True if the directory is empty or any cached entry has expired."""
+        with self._lock:
+            if not self._entries:
+                return True
+            now = time.time()
+            return not all(self._is_fresh(e, now) for e in self._entries.values())
+
+    def get(self, user_id, allow_stale=False):
+        """Return the cached name, "Unknown User" for known failures, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and (allow_stale or self._is_fresh(entry)):
+                return entry["name"]
+            if user_id in self._unknown:
+                return "Unknown User"
+            return None
+
+    def names(self):
+        """Every cached {user_id: name}, stale or not."""
+        with self._lock:
+            return {user_id: entry["name"] for user_id, entry in self._entries.items()}
+
+    def set(self, user_id, name):
+        with self._lock:
+            self._entries[user_id] = {"name": name, "fetched": time.time()}
+            self._unknown.discard(user_id)
+
+    def mark_unknown(self, user_id):
+        with self._lock:
+            self._unknown.add(user_id)
+
+    def update_from_members(self, members):
+        """Store every member of a `users.list` / `users.info` response."""
+        now = time.time()
+        with self._lock:
+            for member in members:
+                self._entries[member["id"]] = {
+                    "name": display_name_of(member),
+                    "fetched": now,
+                }
+                self._unknown.discard(member["id"])
+
+    def save(self):
+        if not self.cache_file:
+            return
+        with self._lock:
+            entries = dict(self._entries)
+
+        # Other processes of the workspace may have saved names since it was loaded
+        def merge(saved):
+            saved = dict(saved or {})
+            for user_id, entry in entries.items():
+                if entry.get("fetched", 0) >= saved.get(user_id, {}).get("fetched", 0):
+                    saved[user_id] = entry
+            return saved
+
+        update_json(self.cache_file, merge)
+
+
+def display_name_of(user):
+    """Pick the name SlackDown shows for a Slack user object."""
+    profile = user.get("profile", {})
+    return profile.get("display_name") or profile.get("real_name") or user.get("name", "")
@@ -0,0 +1,29 @@
+# helpers.py
+import os
+from unittest.mock import MagicMock
+from src.config import load_config
+
+# Function to build a test config from the load_config() defaults
+# Every output folder is `root` (state under root/state), so a test never
+# writes to the working directory; keyword arguments override single options.
+def make_config(root, **overrides):
+    root = str(root)
+    config = load_config(os.path.join(root, "no-config.txt"))
+    config.update(
+        slack_token="dummy",
+        direct_msg_dir=root,
+        group_msg_dir=root,
+        channel_msg_dir=root,
+        attachments_dir=root,
+        state_dir=os.path.join(root, "state"),
+        analytics_dir=os.path.join(root, "analytics"),
+    )
+    config.update(overrides)
+    return config
+
+
+# Function to build a mocked requests response usable as `with get(...) as response:`
+def fake_response(**attributes):
+    response = MagicMock(**attributes)
+    response.__enter__.return_value = response
+    return response
@@ -0,0 +1,63 @@
+# test_analytics.py
+import os
+import pytest
+
+pytest.importorskip("pyarrow")
+
+import pyarrow.dataset as ds
+from src.analytics import export_analytics, partition_path
+from src.raw_store import REPLIES_KEY, RawStore
+from src.user_directory import UserDirectory
+
+def make_store(state_dir):
+    raw_store = RawStore(os.path.join(state_dir, "raw"))
+    raw_store.write_channel("C1", "general", "public_channel")
+    raw_store.write_day("C1", "2024-01-31", [
+        {"ts": "1706700000.000100", "user": "U1", "text": "hi", "thread_ts": "1706700000.000100", "reply_count": 1,
+         REPLIES_KEY: [{"ts": "1706700060.000100", "user": "U2", "text": "hello"}],
+         "reactions": [{"name": "tada", "count": 2}]},
+    ])
+    raw_store.write_day("C1", "2024-02-01", [
+        {"ts": "1706790000.000100", "user": "U2", "text": "report",
+         "files": [{"id": "F1", "name": "a.pdf", "mimetype": "application/pdf", "size": 1234}]},
+    ])
+    return raw_store
+
+def read(analytics_dir, table):
+    return ds.dataset(os.path.join(analytics_dir, table), partitioning="hive").to_table()
+
+def test_export_analytics_partitions_by_channel_and_month(tmpdir):
+    state_dir = str(tmpdir.join("state"))
+    analytics_dir = str(tmpdir.join("analytics"))
+    make_store(state_dir)
+    users = UserDirectory(os.path.join(state_dir, "users.json"))
+    users.set("U1", "Alice")
+    users.save()
+    config = {"state_dir": state_dir, "analytics_dir": analytics_dir}
+
+    assert export_analytics(config) == 2
+    assert os.path.exists(os.path.join(partition_path(analytics_dir, "messages", "C1", "2024-01"), "part-0.parquet"))
+    messages = read(analytics_dir, "messages").sort_by("ts").to_pylist()
+    assert [(m["channel"], m["month"], m["user_id"], m["text"]) for m in messages] == [
+        ("C1", "2024-01", "U1", "hi"),
+        ("C1", "2024-02", "U2", "report"),
+    ]
+    assert messages[0]["reaction_count"] == 2 and messages[1]["file_count"] == 1
+    assert read(analytics_dir, "replies").to_pylist()[0]["thread_ts"] == "1706700000.000100"
+    assert read(analytics_dir, "reactions").column("name").to_pylist() == ["tada"]
+    assert read(analytics_dir, "files").column("size").to_pylist() == [1234]
+    assert ds.dataset(os.path.join(analytics_dir, "users.parquet")).to_table().to_pylist() == [
+        {"user_id": "U1", "name": "Alice"}
+    ]
+
+def test_export_analytics_only_rewrites_changed_months(tmpdir):
+    state_dir = str(tmpdir.join("state"))
+    analytics_dir = str(tmpdir.join("analytics"))
+    raw_store = make_store(state_dir)
+    config = {"state_dir": state_dir, "analytics_dir": analytics_dir}
+    export_analytics(config)
+    assert export_analytics(config) == 0
+
+    raw_store.write_day("C1", "2024-02-02", [{"ts": "1706880000.000100", "user": "U1", "text": "more"}])
+    assert export_analytics(config) == 1
+    assert read(analytics_dir, "messages").num_rows == 3
@@ -1,8 +1,9 @@
 # test_api.py
-from unittest.mock import patch
+import os
+from unittest.mock import Mock, patch
 import pytest
 from slack_sdk.errors import SlackApiError
-from src.api import SlackAPI
+from src.api import SlackAPI, TokenBucket, slack_api_options
 
 @pytest.fixture
 def mock_webclient():
@@ -36,4 +37,83 @@ def test_get_user_display_name_fallback(mock_webclient):
 def test_get_user_display_name_error(mock_webclient):
     mock_webclient.users_info.side_effect = SlackApiError("error", {"error": "invalid_auth"})
     slack_api = SlackAPI("dummy_token")
-    assert slack_api.get_user_display_name("U123") == "Unknown User"
\ No newline at end of file
+    assert slack_api.get_user_display_name("U123") == "Unknown User"
+
+def test_get_user_display_name_cached(mock_webclient):
+    mock_webclient.users_info.return_value = {
+        "user": {"profile": {"display_name": "test_user", "real_name": "Real Name"}}
+    }
+    slack_api = SlackAPI("dummy_token")
+    slack_api.get_user_display_name("U123")
+    assert slack_api.get_user_display_name("U123") == "test_user"
+    assert mock_webclient.users_info.call_count == 1
+
+def test_load_user_directory_paginates(mock_webclient, tmpdir):
+    mock_webclient.users_list.side_effect = [
+        {"members": [{"id": "U1", "profile": {"display_name": "alice"}}],
+         "response_metadata": {"next_cursor": "abc"}},
+        {"members": [{"id": "U2", "profile": {"display_name": "", "real_name": "Bob"}}],
+         "response_metadata": {"next_cursor": ""}},
+    ]
+    cache_file = str(tmpdir.join("users.json"))
+    slack_api = SlackAPI("dummy_token", user_cache_file=cache_file)
+    slack_api.load_user_directory()
+    assert slack_api.get_user_display_name("U2") == "Bob"
+    mock_webclient.users_info.assert_not_called()
+
+    # A second run is served entirely from the on-disk cache
+    reloaded = SlackAPI("dummy_token", user_cache_file=cache_file)
+    reloaded.load_user_directory()
+    assert reloaded.get_user_display_name("U1") == "alice"
+    assert mock_webclient.users_list.call_count == 2
+
+def test_rate_limiter_retries_after_429(mock_webclient):
+    rate_limited = Mock(status_code=429, headers={"Retry-After": "3"})
+    rate_limited.__getitem__ = Mock(return_value="ratelimited")
+    mock_webclient.conversations_replies.side_effect = [
+        SlackApiError("ratelimited", rate_limited),
+        {"messages": [{"ts": "1.0"}]},
+    ]
+    slack_api = SlackAPI("dummy_token")
+    with patch('src.api.time.sleep') as mock_sleep:
+        assert slack_api.get_conversations_replies("C1", "general", "1.0") == [{"ts": "1.0"}]
+    assert mock_webclient.conversations_replies.call_count == 2
+    assert mock_sleep.call_args.args[0] == pytest.approx(3, abs=0.1)
+
+def test_token_bucket_spaces_requests_after_burst():
+    bucket = TokenBucket(rate_per_minute=60, burst=2)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(1, abs=0.05)
+
+def test_get_conversations_replies_paginates(mock_webclient):
+    mock_webclient.conversations_replies.side_effect = [
+        {"messages": [{"ts": "1.0"}, {"ts": "1.1"}], "response_metadata": {"next_cursor": "next"}},
+        {"messages": [{"ts": "1.0"}, {"ts": "1.2"}], "response_metadata": {"next_cursor": ""}},
+    ]
+    slack_api = SlackAPI("dummy_token")
+    replies = slack_api.get_conversations_replies("C1", "general", "1.0")
+    assert [m["ts"] for m in replies] == ["1.0", "1.1", "1.2"]
+
+def test_slack_api_options_scales_rate_limits():
+    config = {
+        "state_dir": "state",
+        "user_cache_ttl": 60,
+        "api_base_url": "http://127.0.0.1:8080/api/",
+        "rate_limit_multiplier": 10,
+    }
+    options = slack_api_options(config)
+    assert options["base_url"] == "http://127.0.0.1:8080/api/"
+    assert options["user_cache_file"] == os.path.join("state", "users.json")
+    assert options["rate_limiter"].bucket_for("conversations_history").max_rate == pytest.approx(500 / 60)
+
+def test_get_conversations_list_paginates(mock_webclient):
+    mock_webclient.conversations_list.side_effect = [
+        {"channels": [{"id": "C1"}], "response_metadata": {"next_cursor": "next"}},
+        {"channels": [{"id": "D1"}], "response_metadata": {"next_cursor": ""}},
+    ]
+    slack_api = SlackAPI("dummy_token")
+    channels = slack_api.get_conversations_list(types="public_channel,im", limit=100)
+    assert [c["id"] for c in channels] == ["C1", "D1"]
+    assert mock_webclient.conversations_list.call_args.kwargs["cursor"] == "next"
+    assert mock_webclient.conversations_list.call_args.kwargs["limit"] == 100
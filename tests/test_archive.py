@@ -0,0 +1,194 @@
+# test_archive.py
+import os
+import pytest
+import src.archive
+from src.archive import MarkdownArchive, format_day, list_shards, open_archive
+
+def test_archive_appends_without_rewriting(tmpdir):
+    file_path = str(tmpdir.join("general.md"))
+    archive = MarkdownArchive(file_path)
+    archive.write_days([("2024-01-01", ["\n**alice** (10:00:00):\nhi"]), ("2024-01-02", ["\n**bob** (11:00:00):\nyo"])])
+    first_day = archive.days["2024-01-01"]
+
+    # Next run: the first day is identical, only the new day is appended
+    archive = MarkdownArchive(file_path)
+    written = archive.write_days([
+        ("2024-01-01", ["\n**alice** (10:00:00):\nhi"]),
+        ("2024-01-02", ["\n**bob** (11:00:00):\nyo"]),
+        ("2024-01-03", ["\n**carol** (12:00:00):\nnew"]),
+    ])
+    assert written == 1
+    assert archive.days["2024-01-01"] == first_day
+    with open(file_path, encoding="utf-8") as f:
+        content = f.read()
+    assert content == (
+        format_day("2024-01-01", ["\n**alice** (10:00:00):\nhi"])
+        + format_day("2024-01-02", ["\n**bob** (11:00:00):\nyo"])
+        + format_day("2024-01-03", ["\n**carol** (12:00:00):\nnew"])
+    )
+
+def test_archive_incremental_merges_same_day(tmpdir):
+    file_path = str(tmpdir.join("general.md"))
+    MarkdownArchive(file_path).write_days([("2024-01-01", ["first"]), ("2024-01-02", ["second"])])
+    MarkdownArchive(file_path).write_days([("2024-01-02", ["third"])], incremental=True)
+    with open(file_path, encoding="utf-8") as f:
+        assert f.read() == "#### 2024-01-01\nfirst\n\n#### 2024-01-02\nsecond\nthird\n\n"
+
+def test_archive_rescans_after_external_edit(tmpdir):
+    file_path = tmpdir.join("general.md")
+    file_path.write("#### 2024-01-01\nhand written\n\n")
+    archive = MarkdownArchive(str(file_path))
+    assert list(archive.days) == ["2024-01-01"]
+    archive.write_days([("2024-01-02", ["new"])], incremental=True)
+    assert file_path.read_text("utf-8").startswith("#### 2024-01-01\nhand written\n\n#### 2024-01-02")
+    assert os.path.exists(str(file_path) + ".idx.json")
+
+def test_archive_keeps_unchanged_days_in_place(tmpdir):
+    file_path = str(tmpdir.join("general.md"))
+    MarkdownArchive(file_path).write_days([("2024-01-01", ["one"]), ("2024-01-02", ["two"]), ("2024-01-03", ["three"])])
+
+    # A day passed as None keeps its archived block, even after a rewritten day
+    written = MarkdownArchive(file_path).write_days([("2024-01-02", ["TWO"]), ("2024-01-03", None)])
+    assert written == 1
+    with open(file_path, encoding="utf-8") as f:
+        assert f.read() == format_day("2024-01-01", ["one"]) + format_day("2024-01-02", ["TWO"]) + format_day("2024-01-03", ["three"])
+    with pytest.raises(ValueError):
+        MarkdownArchive(file_path).write_days([("2024-01-04", None)])
+
+def test_archive_write_is_atomic(tmpdir, monkeypatch):
+    file_path = str(tmpdir.join("general.md"))
+    MarkdownArchive(file_path).write_days([("2024-01-01", ["one"]), ("2024-01-02", ["two"])])
+    before = tmpdir.join("general.md").read_binary()
+
+    # A write that fails halfway leaves the archive and its index as they were
+    def failing_days():
+        yield "2024-01-02", ["TWO"]
+        raise RuntimeError("interrupted")
+    archive = MarkdownArchive(file_path)
+    with pytest.raises(RuntimeError):
+        archive.write_days(failing_days())
+    assert tmpdir.join("general.md").read_binary() == before
+    assert archive.days == MarkdownArchive(file_path).days
+    assert sorted(os.listdir(str(tmpdir))) == ["general.md", "general.md.idx.json"]
+
+    # A write killed before it could clean up is undone when the archive is next opened
+    monkeypatch.setattr(src.archive, "replay_journal", lambda file_path: False)
+    with pytest.raises(RuntimeError):
+        MarkdownArchive(file_path).write_days(failing_days())
+    assert os.path.exists(file_path + ".journal")
+    monkeypatch.undo()
+    assert MarkdownArchive(file_path).days == archive.days
+    assert tmpdir.join("general.md").read_binary() == before
+    assert not os.path.exists(file_path + ".journal")
+
+
+class TrackedFile:
+    """A file that records the (start, end) offsets of every read and write."""
+
+    def __init__(self, file, accesses):
+        self.file, self.accesses = file, accesses
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.file.close()
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+    def __iter__(self):
+        for line in self.file:
+            self.accesses.append((self.file.tell() - len(line), self.file.tell()))
+            yield line
+
+    def read(self, size=-1):
+        start = self.file.tell()
+        data = self.file.read(size)
+        self.accesses.append((start, start + len(data)))
+        return data
+
+    def write(self, data):
+        start = self.file.tell()
+        self.accesses.append((start, start + len(data)))
+        return self.file.write(data)
+
+
+def test_archive_write_leaves_the_prefix_alone(tmpdir, monkeypatch):
+    file_path = str(tmpdir.join("general.md"))
+    MarkdownArchive(file_path).write_days([(f"2024-01-{d:02d}", [f"day {d}"]) for d in range(1, 21)])
+    cut = MarkdownArchive(file_path).days["2024-01-20"][0]
+
+    accesses = []
+    def tracked_open(path, *args, **kwargs):
+        file = open(path, *args, **kwargs)
+        return TrackedFile(file, accesses) if path == file_path else file
+    monkeypatch.setattr(src.archive, "open", tracked_open, raising=False)
+    archive = MarkdownArchive(file_path)
+    archive.write_days([("2024-01-20", ["day 20", "more"]), ("2024-01-21", ["day 21"])])
+    archive.write_days([("2024-01-21", ["late"])], incremental=True)
+    monkeypatch.undo()
+
+    # Neither the full nor the incremental path touches the days before the first changed one
+    assert accesses and min(start for start, _ in accesses) >= cut
+    with open(file_path, encoding="utf-8") as f:
+        content = f.read()
+    assert content.startswith("".join(format_day(f"2024-01-{d:02d}", [f"day {d}"]) for d in range(1, 20)))
+    assert content.endswith(format_day("2024-01-20", ["day 20", "more"]) + "#### 2024-01-21\nday 21\nlate\n\n")
+    assert not os.path.exists(file_path + ".journal")
+
+def test_sharded_archive_touches_only_current_shard(tmpdir):
+    file_path = str(tmpdir.join("general.md"))
+    days = [("2024-01-30", ["jan"]), ("2024-02-01", ["feb 1"]), ("2024-02-02", ["feb 2"])]
+    assert open_archive(file_path, "month").write_days(days) == 3
+    assert list(list_shards(file_path)) == ["2024-01", "2024-02"]
+    index = tmpdir.join("general.md").read_text("utf-8")
+    assert "[2024-01](general.2024-01.md)" in index and "[2024-02](general.2024-02.md)" in index
+
+    january = tmpdir.join("general.2024-01.md")
+    mtime = january.mtime()
+    os.utime(str(january), (mtime - 100, mtime - 100))
+    open_archive(file_path, "month").write_days([("2024-02-02", ["feb 2b"]), ("2024-03-01", ["mar"])], incremental=True)
+    assert january.mtime() == mtime - 100
+    assert tmpdir.join("general.2024-02.md").read_text("utf-8") == (
+        format_day("2024-02-01", ["feb 1"]) + "#### 2024-02-02\nfeb 2\nfeb 2b\n\n"
+    )
+
+    # A full rewrite from February on drops the days Slack no longer returned
+    open_archive(file_path, "month").write_days([("2024-02-02", ["feb 2"])])
+    assert list(list_shards(file_path)) == ["2024-01", "2024-02"]
+    assert tmpdir.join("general.2024-02.md").read_text("utf-8") == format_day("2024-02-01", ["feb 1"]) + format_day("2024-02-02", ["feb 2"])
+
+def test_archive_layout_conversion_round_trip(tmpdir):
+    file_path = str(tmpdir.join("general.md"))
+    days = [("2023-12-31", ["old"]), ("2024-01-01", ["new"]), ("2024-02-01", ["newer"])]
+    MarkdownArchive(file_path).write_days(days)
+    single = tmpdir.join("general.md").read_text("utf-8")
+
+    open_archive(file_path, "year")
+    assert list(list_shards(file_path)) == ["2023", "2024"]
+    open_archive(file_path, "month")
+    assert list(list_shards(file_path)) == ["2023-12", "2024-01", "2024-02"]
+
+    archive = open_archive(file_path, "single")
+    assert list_shards(file_path) == {}
+    assert tmpdir.join("general.md").read_text("utf-8") == single
+    assert sorted(archive.days) == ["2023-12-31", "2024-01-01", "2024-02-01"]
+
+def test_interrupted_split_is_done_again_from_scratch(tmpdir, monkeypatch):
+    file_path = str(tmpdir.join("general.md"))
+    days = [("2024-01-01", ["jan"]), ("2024-02-01", ["feb"])]
+    MarkdownArchive(file_path).write_days(days)
+
+    # Killed after the shards were written but before the single file was removed
+    def killed(file_path):
+        raise KeyboardInterrupt
+    monkeypatch.setattr(src.archive, "remove_archive", killed)
+    with pytest.raises(KeyboardInterrupt):
+        open_archive(file_path, "month")
+    monkeypatch.undo()
+    assert list(list_shards(file_path)) == ["2024-01", "2024-02"]
+
+    open_archive(file_path, "month")
+    assert tmpdir.join("general.2024-01.md").read_text("utf-8") == format_day("2024-01-01", ["jan"])
+    assert sorted(os.listdir(str(tmpdir))) == ["general.2024-01.md", "general.2024-02.md", "general.md"]
@@ -0,0 +1,107 @@
+# test_async_engine.py
+import os
+import pytest
+
+pytest.importorskip("aiohttp")
+
+from benchmarks.fake_slack import FakeSlackServer, generate_workspace
+from src.api import SlackAPI, slack_api_options
+from src.async_engine import run_jobs_async
+from src.message_processor import fetch_and_save_messages
+from src.sync_state import SyncState
+from tests.helpers import make_config
+
+# Function to build the config of one engine's backup under `root`
+def engine_config(root, api_url):
+    return make_config(
+        root,
+        direct_msg_dir=str(root.join("dm")),
+        channel_msg_dir=str(root.join("channels")),
+        group_msg_dir=str(root.join("groups")),
+        attachments_dir=str(root.join("attachments")),
+        api_base_url=api_url,
+        rate_limit_multiplier=1000.0,
+        engine="async",
+        async_concurrency=8,
+        download_workers=2,
+        thread_workers=2,
+    )
+
+def read_tree(root):
+    files = {}
+    for folder in ("channels", "dm", "attachments"):
+        for dirpath, _, names in os.walk(str(root.join(folder))):
+            for name in names:
+                path = os.path.join(dirpath, name)
+                if not name.endswith(".json"):
+                    with open(path, "rb") as f:
+                        files[os.path.relpath(path, str(root))] = f.read()
+    return files
+
+def test_async_engine_matches_threaded_backup(tmpdir):
+    workspace = generate_workspace(channels=2, messages=120, users=5, dms=1, thread_ratio=0.3, attachment_ratio=0.2, attachment_size=1024, messages_per_day=30)
+    jobs = [
+        (channel["id"], channel.get("name") or "User 0", channel["type"], channel)
+        for channel in workspace.channels
+    ]
+    with FakeSlackServer(workspace) as server:
+        threaded = engine_config(tmpdir.join("threads"), server.api_url)
+        slack = SlackAPI("dummy", **slack_api_options(threaded))
+        for channel_id, channel_name, channel_type, _ in jobs:
+            fetch_and_save_messages(channel_id, channel_name, channel_type, slack=slack, config=threaded, progress=False)
+
+        asynchronous = engine_config(tmpdir.join("async"), server.api_url)
+        slack = SlackAPI("dummy", **slack_api_options(asynchronous))
+        sync_state = SyncState(os.path.join(asynchronous["state_dir"], "sync_state.json"))
+        run_jobs_async(jobs, slack, sync_state, asynchronous)
+
+    expected = read_tree(tmpdir.join("threads"))
+    assert any(path.startswith("attachments") for path in expected)
+    assert read_tree(tmpdir.join("async")) == expected
+    assert sync_state.get_message_count("C0000000") == 120
+
+def test_async_download_resumes_stalls_and_outlives_the_session_timeout(tmpdir, monkeypatch):
+    import asyncio
+    import aiohttp
+    from aiohttp import web
+    from src import async_downloader
+
+    content = os.urandom(4096)
+    ranges = []
+
+    async def serve(request):
+        ranges.append(request.headers.get("Range"))
+        offset = int(request.headers["Range"][len("bytes="):-1]) if ranges[-1] else 0
+        response = web.StreamResponse(status=206 if offset else 200, headers={"Content-Length": str(len(content) - offset)})
+        await response.prepare(request)
+        if not offset:
+            # Send half of the file, then stall past the read timeout
+            await response.write(content[:2048])
+            await asyncio.sleep(1)
+            return response
+        # Trickle the rest for longer than the session's total timeout
+        for start in range(offset, len(content), 256):
+            await response.write(content[start:start + 256])
+            await asyncio.sleep(0.1)
+        return response
+
+    async def download():
+        app = web.Application()
+        app.router.add_get("/file", serve)
+        runner = web.AppRunner(app, shutdown_timeout=0)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=0.5)) as session:
+                return await async_downloader.download_file_async(
+                    session, f"http://127.0.0.1:{port}/file", str(tmpdir), "file.bin", "file.bin"
+                )
+        finally:
+            await runner.cleanup()
+
+    monkeypatch.setattr(async_downloader, "ASYNC_DOWNLOAD_TIMEOUT", aiohttp.ClientTimeout(total=None, sock_read=0.3))
+    success, path = asyncio.run(download())
+    assert success and ranges == [None, "bytes=2048-"]
+    assert tmpdir.join("file.bin").read_binary() == content
@@ -0,0 +1,28 @@
+# test_attachment_store.py
+import os
+from src.attachment_store import AttachmentManifest
+from src.helper import calculate_file_hash
+
+def test_manifest_migrates_existing_folder(tmpdir):
+    folder = tmpdir.mkdir("general")
+    folder.join("F1_alice_report.pdf").write("report")
+    folder.join("F2_bob_photo-20240101120000.png").write("photo")
+
+    manifest = AttachmentManifest(str(folder))
+    assert manifest.find_file("F1") == os.path.join(str(folder), "F1_alice_report.pdf")
+    photo_hash = calculate_file_hash(str(folder.join("F2_bob_photo-20240101120000.png")))
+    assert manifest.find_hash(photo_hash).endswith("F2_bob_photo-20240101120000.png")
+    assert manifest.find_file("F3") is None
+
+def test_manifest_persists(tmpdir):
+    folder = tmpdir.mkdir("general")
+    folder.join("F1_alice_a.txt").write("a")
+    manifest = AttachmentManifest(str(folder))
+    manifest.add_file("F9", str(folder.join("F1_alice_a.txt")))
+    manifest.save()
+
+    # Later runs read the index instead of rescanning the folder
+    folder.join("F5_carol_new.txt").write("new")
+    reloaded = AttachmentManifest(str(folder))
+    assert reloaded.find_file("F9").endswith("F1_alice_a.txt")
+    assert reloaded.find_file("F5") is None
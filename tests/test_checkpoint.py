@@ -0,0 +1,27 @@
+# test_checkpoint.py
+from src.checkpoint import Checkpoint
+
+def test_checkpoint_persists_progress(tmpdir):
+    state_file = str(tmpdir.join("checkpoint.json"))
+    checkpoint = Checkpoint(state_file)
+    checkpoint.start(full_resync=True)
+    checkpoint.set_channel("C1", {"cursor": "next"})
+    checkpoint.mark_completed("C2")
+
+    reloaded = Checkpoint(state_file)
+    assert reloaded.full_resync is True
+    assert reloaded.get_channel("C1") == {"cursor": "next"}
+    assert reloaded.is_completed("C2") and not reloaded.is_completed("C1")
+
+    reloaded.mark_completed("C1")
+    assert reloaded.get_channel("C1") is None
+
+def test_checkpoint_start_and_clear(tmpdir):
+    state_file = tmpdir.join("checkpoint.json")
+    checkpoint = Checkpoint(str(state_file))
+    checkpoint.mark_completed("C1")
+    checkpoint.start()
+    assert not checkpoint.is_completed("C1")
+    checkpoint.clear()
+    assert not state_file.exists()
+    assert Checkpoint(str(state_file)).full_resync is False
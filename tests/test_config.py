@@ -2,7 +2,7 @@
 import configparser
 from unittest.mock import patch
 import pytest
-from src.config import load_config
+from src.config import load_config, load_profiles
 
 @pytest.fixture
 def mock_config(tmpdir, monkeypatch):
@@ -39,4 +39,23 @@ def test_load_config_defaults(tmpdir, monkeypatch):
     config_file.write(config_content)
     monkeypatch.chdir(tmpdir)  # Switch to tmpdir
     config = load_config()
-    assert config["direct_msg_dir"] == "dm"
\ No newline at end of file
+    assert config["direct_msg_dir"] == "dm"
+
+def test_load_profiles(tmpdir):
+    tmpdir.mkdir("beta").join("config.txt").write("[Options]\nWorkers = 4\n")
+    profiles_file = tmpdir.join("profiles.txt")
+    profiles_file.write("""
+    [acme]
+    User_OAuth_Token = xoxp-1, xoxp-2
+    Rate_Limit_Multiplier = 2
+
+    [beta]
+    User_OAuth_Token = xoxp-3
+    """)
+    acme, beta = load_profiles(str(profiles_file))
+    assert acme["tokens"] == ["xoxp-1", "xoxp-2"]
+    assert acme["directory"] == str(tmpdir.join("acme"))
+    assert acme["config_file"] == str(tmpdir.join("config.txt"))
+    assert acme["rate_limit_multiplier"] == 2.0
+    assert beta["config_file"] == str(tmpdir.join("beta", "config.txt"))
+    assert beta["rate_limit_multiplier"] is None
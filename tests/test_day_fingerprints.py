@@ -0,0 +1,26 @@
+# test_day_fingerprints.py
+from src.day_fingerprints import DayFingerprints, day_fingerprint, fingerprint_path
+
+def test_day_fingerprint_tracks_rendered_changes():
+    messages = [{"ts": "1.0", "text": "hi", "reactions": [{"name": "tada", "count": 1}]}]
+    fingerprint = day_fingerprint(messages)
+    assert day_fingerprint([dict(messages[0])]) == fingerprint
+    assert day_fingerprint([dict(messages[0], edited={"ts": "2.0"})]) != fingerprint
+    assert day_fingerprint([dict(messages[0], reactions=[{"name": "tada", "count": 2}])]) != fingerprint
+    assert day_fingerprint([dict(messages[0], reply_count=1, latest_reply="3.0")]) != fingerprint
+    assert day_fingerprint(messages + [{"ts": "4.0"}]) != fingerprint
+    assert day_fingerprint(messages, salt="attachments=True") != fingerprint
+
+def test_day_fingerprints_replace_and_discard(tmpdir):
+    state_file = fingerprint_path(str(tmpdir), "C123")
+    fingerprints = DayFingerprints(state_file)
+    fingerprints.replace_from({"2024-01-01": "a", "2024-01-02": "b", "2024-01-03": "c"})
+
+    # A full write starting at 01-02 drops the stored days it no longer contains
+    fingerprints.replace_from({"2024-01-02": "b2"})
+    fingerprints.discard(["2024-01-01"])
+    fingerprints.save()
+
+    loaded = DayFingerprints(state_file)
+    assert loaded.days == {"2024-01-02": "b2"}
+    assert loaded.get("2024-01-03") is None
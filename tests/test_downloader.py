@@ -0,0 +1,35 @@
+# test_downloader.py
+import os
+from unittest.mock import patch
+from src.downloader import DownloadPool, apply_download_failures
+from tests.helpers import fake_response
+
+def test_download_pool_reuses_session(tmpdir):
+    target = str(tmpdir.mkdir("attachments"))
+    pool = DownloadPool("dummy", workers=2)
+    def fake_get(url, headers, stream, timeout):
+        response = fake_response(status_code=200)
+        response.iter_content.return_value = [url.encode()]
+        return response
+    with patch.object(pool.session, "get", side_effect=fake_get) as mock_get:
+        jobs = []
+        for i in range(3):
+            final_path = os.path.join(target, f"F{i}.txt")
+            future = pool.submit(f"http://example.com/{i}", target, f"F{i}.txt", final_path)
+            jobs.append((future, f"ok {i}", f"failed {i}"))
+        assert pool.join(jobs) == {}
+    pool.close()
+    assert pool.session.headers["Authorization"] == "Bearer dummy"
+    assert mock_get.call_count == 3
+    assert sorted(os.listdir(target)) == ["F0.txt", "F1.txt", "F2.txt"]
+
+def test_download_pool_reports_failures(tmpdir):
+    pool = DownloadPool("dummy", workers=2)
+    with patch.object(pool.session, "get", return_value=fake_response(status_code=404)) as mock_get:
+        future = pool.submit("http://example.com/x", str(tmpdir), "x.txt", str(tmpdir.join("x.txt")))
+        failures = pool.join([(future, "[Attachment: x.txt](x.txt)", "[Attachment: x.txt (download failed)]")])
+    pool.close()
+    # The refused response is closed, handing its connection back to the pool
+    mock_get.return_value.__exit__.assert_called_once()
+    days = list(apply_download_failures(iter([("2024-01-01", ["see [Attachment: x.txt](x.txt)"])]), failures))
+    assert days == [("2024-01-01", ["see [Attachment: x.txt (download failed)]"])]
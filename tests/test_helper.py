@@ -1,34 +1,75 @@
 # test_helper.py
 import os
-import tempfile
 from unittest.mock import Mock, patch
 import pytest
-from src.helper import download_file, resolve_file_name_conflict
+import requests
+from src.attachment_store import AttachmentManifest
+from src.helper import DOWNLOAD_TIMEOUT, calculate_file_hash, download_file, find_duplicate_file
+from tests.helpers import fake_response
 
 @patch('src.helper.requests.get')
 @patch('src.helper.load_config')
 def test_download_file_success(mock_load_config, mock_get, tmpdir):
     mock_load_config.return_value = {"slack_token": "dummy"}
-    mock_response = Mock()
-    mock_response.status_code = 200
+    mock_response = fake_response(status_code=200)
     mock_response.iter_content.return_value = [b"test content"]
     mock_get.return_value = mock_response
     
     success, path = download_file("http://example.com/file.txt", str(tmpdir), "file.txt")
     assert success is True
     assert os.path.exists(path)
+    assert mock_get.call_args.kwargs["timeout"] == DOWNLOAD_TIMEOUT
+    mock_response.__exit__.assert_called_once()
 
-def test_resolve_file_name_conflict(tmpdir, monkeypatch):
-    # Mock tempfile.gettempdir() to use test directory
-    monkeypatch.setattr(tempfile, 'gettempdir', lambda: str(tmpdir))
-    
-    target_folder = str(tmpdir)
-    test_file = tmpdir.join("existing.txt")
+def test_find_duplicate_file(tmpdir):
+    target_folder = str(tmpdir.mkdir("attachments"))
+    test_file = tmpdir.join("attachments", "existing.txt")
     test_file.write("same content")
-    
-    # Create temp file with same content in system temp dir (now mocked to tmpdir)
-    temp_file = tmpdir.join("temp.txt")
-    temp_file.write("same content")
-    
-    result = resolve_file_name_conflict(target_folder, "temp.txt")
-    assert os.path.basename(result) == "existing.txt"
\ No newline at end of file
+
+    new_file = tmpdir.join("new.txt")
+    new_file.write("same content")
+
+    result = find_duplicate_file(target_folder, calculate_file_hash(str(new_file)))
+    assert os.path.basename(result) == "existing.txt"
+
+def test_download_file_deduplicates_with_manifest(tmpdir):
+    target_folder = tmpdir.mkdir("attachments")
+    manifest = AttachmentManifest(str(target_folder))
+    session = Mock()
+    session.get.return_value = fake_response(status_code=200, iter_content=Mock(return_value=[b"same content"]))
+
+    success, first = download_file("http://x/1", str(target_folder), "a.txt", session, manifest, "F1_a.txt")
+    assert success and os.path.basename(first) == "F1_a.txt"
+
+    # Identical content is found through the index and not stored twice
+    success, second = download_file("http://x/2", str(target_folder), "b.txt", session, manifest, "F2_b.txt")
+    assert success and second == first
+    assert os.listdir(str(target_folder)) == ["F1_a.txt"]
+
+def test_download_file_resumes_with_range(tmpdir):
+    target_folder = tmpdir.mkdir("attachments")
+    target_folder.join(".F1_big.bin.part").write_binary(b"first half ")
+    session = Mock()
+    session.get.return_value = fake_response(status_code=206, iter_content=Mock(return_value=[b"second half"]))
+
+    success, path = download_file("http://x/big", str(target_folder), "F1_big.bin", session, final_name="F1_big.bin")
+
+    assert success
+    assert session.get.call_args.kwargs["headers"] == {"Range": "bytes=11-"}
+    with open(path, "rb") as f:
+        assert f.read() == b"first half second half"
+    assert not os.path.exists(str(target_folder.join(".F1_big.bin.part")))
+
+def test_download_file_keeps_partial_after_interruption(tmpdir):
+    target_folder = tmpdir.mkdir("attachments")
+
+    def broken_stream(chunk_size):
+        yield b"partial"
+        raise requests.exceptions.ChunkedEncodingError("connection reset")
+
+    session = Mock()
+    session.get.return_value = fake_response(status_code=200, iter_content=broken_stream)
+
+    success, path = download_file("http://x/big", str(target_folder), "big.bin", session, final_name="big.bin", retries=1)
+    assert success is False
+    assert target_folder.join(".big.bin.part").read_binary() == b"partial"
@@ -2,28 +2,263 @@
 import os
 from unittest.mock import Mock, patch
 import pytest
-from src.message_processor import fetch_and_save_messages
+from slack_sdk.errors import SlackApiError
+from src.api import HistoryPage
+from src.checkpoint import Checkpoint
+from src.raw_store import REPLIES_KEY, RawStore
+from tests.helpers import make_config
+from src.message_processor import (
+    day_start,
+    fetch_and_save_messages,
+    history_windows,
+    iter_messages_by_date,
+    render_saved_messages,
+)
 
 @patch('src.message_processor.SlackAPI')
 @patch('src.message_processor.load_config')
 def test_fetch_and_save_messages(mock_load_config, mock_slack, tmpdir):
-    mock_config = {
-        "slack_token": "dummy",
-        "direct_msg_dir": str(tmpdir),
-        "channel_msg_dir": str(tmpdir),  # Added required keys
-        "group_msg_dir": str(tmpdir),
-        "attachments_dir": str(tmpdir),
-        "backup_attachments": False
-    }
+    mock_config = make_config(tmpdir, backup_attachments=False)
     mock_load_config.return_value = mock_config
     
-    mock_slack.return_value.get_conversations_history.return_value = [{
+    mock_slack.return_value.iter_conversations_history.return_value = iter([[{
         "ts": "1234567890.123456",
         "user": "U123",
         "text": "Hello world"
-    }]
+    }]])
     
     fetch_and_save_messages("C123", "test_channel", "public_channel")
     
     expected_file = os.path.join(str(tmpdir), "test_channel.md")
-    assert os.path.exists(expected_file)
\ No newline at end of file
+    assert os.path.exists(expected_file)
+
+@patch('src.message_processor.SlackAPI')
+@patch('src.message_processor.load_config')
+def test_fetch_and_save_messages_incremental(mock_load_config, mock_slack, tmpdir):
+    mock_load_config.return_value = make_config(tmpdir, backup_attachments=False)
+    slack = mock_slack.return_value
+    slack.get_user_display_name.return_value = "alice"
+    slack.iter_conversations_history.return_value = iter([
+        [{"ts": "1234567890.123456", "user": "U123", "text": "first"}]
+    ])
+    fetch_and_save_messages("C123", "test_channel", "public_channel")
+    slack.iter_conversations_history.assert_called_with("C123", "test_channel", oldest=None)
+
+    # Second run only asks for messages newer than the high-water mark
+    slack.iter_conversations_history.return_value = iter([
+        [{"ts": "1234567895.000000", "user": "U123", "text": "second"}]
+    ])
+    fetch_and_save_messages("C123", "test_channel", "public_channel")
+    slack.iter_conversations_history.assert_called_with(
+        "C123", "test_channel", oldest="1234567890.123456"
+    )
+
+    content = tmpdir.join("test_channel.md").read_text("utf-8")
+    assert "first" in content and "second" in content
+    assert content.count("#### ") == 1
+
+
+def test_iter_messages_by_date_streams_days():
+    day = 24 * 3600
+    base = 1700000000 - 1700000000 % day + 12 * 3600
+    pages = [
+        [{"ts": f"{base + 2 * day + 1}.0"}, {"ts": f"{base + 2 * day}.0"}],
+        [{"ts": f"{base + day}.0"}],
+        [{"ts": f"{base}.0"}],
+    ]
+    days = list(iter_messages_by_date(iter(pages)))
+    assert len(days) == 3
+    assert [m["ts"] for m in days[0][1]] == [f"{base + 2 * day}.0", f"{base + 2 * day + 1}.0"]
+    assert days[0][0] > days[1][0] > days[2][0]
+
+
+@patch('src.message_processor.SlackAPI')
+@patch('src.message_processor.load_config')
+def test_render_saved_messages_matches_backup(mock_load_config, mock_slack, tmpdir):
+    config = make_config(tmpdir, backup_attachments=False)
+    mock_load_config.return_value = config
+    slack = mock_slack.return_value
+    slack.get_user_display_name.side_effect = lambda user_id: {"U1": "alice", "U2": "bob"}[user_id]
+    slack.iter_conversations_history.return_value = iter([[
+        {"ts": "1234567895.000000", "user": "U2", "text": "hey <@U1> :tada:",
+         "reactions": [{"name": "+1", "count": 2, "users": ["U1", "U3"]}],
+         "subtype": "thread_broadcast", "blocks": [{"type": "rich_text"}]},
+        {"ts": "1234567890.000000", "user": "U1", "text": "thread", "thread_ts": "1234567890.000000",
+         "reply_count": 1, "latest_reply": "1234567891.000000"},
+    ]])
+    slack.get_conversations_replies.return_value = [
+        {"ts": "1234567890.000000", "user": "U1", "text": "thread"},
+        {"ts": "1234567891.000000", "user": "U2", "text": "reply"},
+    ]
+    fetch_and_save_messages("C123", "test_channel", "public_channel")
+    backup = tmpdir.join("test_channel.md").read_text("utf-8")
+
+    # The raw store keeps every field Slack sent, not only the rendered ones
+    (date,) = RawStore(str(tmpdir.join("state", "raw"))).list_days("C123")
+    parent, message = RawStore(str(tmpdir.join("state", "raw"))).read_day("C123", date)
+    assert message["subtype"] == "thread_broadcast" and message["blocks"] == [{"type": "rich_text"}]
+    assert message["reactions"][0]["users"] == ["U1", "U3"]
+    assert parent[REPLIES_KEY] == [{"ts": "1234567891.000000", "user": "U2", "text": "reply"}]
+    assert not tmpdir.join("test_channel.md.raw.spool").exists()
+
+    # Rebuild from the raw store with names from the cached user directory only
+    tmpdir.join("state", "users.json").write(
+        '{"U1": {"name": "alice", "fetched": 0}, "U2": {"name": "bob", "fetched": 0}}'
+    )
+    tmpdir.join("test_channel.md").remove()
+    # The spool of an interrupted backup survives a render
+    tmpdir.join("test_channel.md.spool").write_binary(b"checkpointed days")
+    assert render_saved_messages("C123", config) == 2
+    assert tmpdir.join("test_channel.md").read_text("utf-8") == backup
+    assert tmpdir.join("test_channel.md.spool").read_binary() == b"checkpointed days"
+    assert not tmpdir.join("test_channel.md.render.spool").exists()
+    assert "reply" in backup
+
+
+@patch('src.message_processor.SlackAPI')
+@patch('src.message_processor.load_config')
+def test_fetch_and_save_messages_resumes_from_checkpoint(mock_load_config, mock_slack, tmpdir):
+    config = make_config(tmpdir, backup_attachments=False, checkpoint_pages=1, keep_raw_messages=True)
+    mock_load_config.return_value = config
+    slack = mock_slack.return_value
+    slack.get_user_display_name.return_value = "alice"
+    day = 24 * 3600
+    base = 1700000000 - 1700000000 % day + 12 * 3600
+    message = lambda ts, text: {"ts": f"{ts}.000000", "user": "U1", "text": text, "blocks": [{"type": "rich_text"}]}
+    checkpoint = Checkpoint(str(tmpdir.join("state", "checkpoint.json")))
+
+    def interrupted_history(*args, **kwargs):
+        yield HistoryPage([message(base + 2 * day, "day 3"), message(base + day + 1, "day 2b")], "page2")
+        yield HistoryPage([message(base + day, "day 2a")], "page3")
+        error = Mock()
+        error.__getitem__ = Mock(return_value="fatal_error")
+        raise SlackApiError("network", error)
+
+    slack.iter_conversations_history.side_effect = interrupted_history
+    assert fetch_and_save_messages("C123", "test_channel", "public_channel", checkpoint=checkpoint) is None
+    assert not tmpdir.join("test_channel.md").exists()
+
+    # The next run continues at the saved cursor with the days already spooled
+    slack.iter_conversations_history.side_effect = None
+    slack.iter_conversations_history.return_value = iter([HistoryPage([message(base, "day 1")])])
+    resumed = Checkpoint(str(tmpdir.join("state", "checkpoint.json")))
+    assert fetch_and_save_messages("C123", "test_channel", "public_channel", checkpoint=resumed) == 4
+    slack.iter_conversations_history.assert_called_with(
+        "C123", "test_channel", oldest=None, cursor="page3"
+    )
+
+    content = tmpdir.join("test_channel.md").read_text("utf-8")
+    assert content.count("#### ") == 3
+    assert content.index("day 1") < content.index("day 2a") < content.index("day 2b") < content.index("day 3")
+    assert resumed.is_completed("C123")
+    assert not tmpdir.join("test_channel.md.spool").exists()
+    assert not tmpdir.join("test_channel.md.raw.spool").exists()
+
+    # The day that was unfinished at the checkpoint is stored with its original payloads
+    raw_store = RawStore(str(tmpdir.join("state", "raw")))
+    stored = [m for date in raw_store.list_days("C123") for m in raw_store.read_day("C123", date)]
+    assert len(stored) == 4 and all(m["blocks"] == [{"type": "rich_text"}] for m in stored)
+
+
+@patch('src.message_processor.render_message')
+@patch('src.message_processor.SlackAPI')
+@patch('src.message_processor.load_config')
+def test_full_resync_skips_unchanged_days(mock_load_config, mock_slack, mock_render, tmpdir):
+    mock_load_config.return_value = make_config(tmpdir, backup_attachments=False, full_resync=True, keep_raw_messages=False)
+    mock_render.side_effect = lambda slack, config, channel, message, downloads, threads: f"\n{message['text']}"
+    day = 24 * 3600
+    base = 1700000000 - 1700000000 % day + 12 * 3600
+    history = lambda edited: [HistoryPage([
+        {"ts": f"{base + day}.000000", "text": "day 2", **({"edited": {"ts": "1"}} if edited else {})},
+        {"ts": f"{base}.000000", "text": "day 1"},
+    ])]
+    slack = mock_slack.return_value
+    slack.iter_conversations_history.return_value = iter(history(False))
+    fetch_and_save_messages("C123", "test_channel", "public_channel")
+    first = tmpdir.join("test_channel.md").read_text("utf-8")
+    assert mock_render.call_count == 2
+
+    # Nothing changed: the whole history is fetched again but no day is re-rendered
+    mock_render.reset_mock()
+    slack.iter_conversations_history.return_value = iter(history(False))
+    assert fetch_and_save_messages("C123", "test_channel", "public_channel") == 2
+    assert mock_render.call_count == 0
+    assert tmpdir.join("test_channel.md").read_text("utf-8") == first
+
+    # An edit only re-renders its own day
+    slack.iter_conversations_history.return_value = iter(history(True))
+    fetch_and_save_messages("C123", "test_channel", "public_channel")
+    assert mock_render.call_count == 1
+
+
+@patch('src.message_processor.SlackAPI')
+@patch('src.message_processor.load_config')
+def test_full_resync_renders_again_days_with_failed_threads(mock_load_config, mock_slack, tmpdir):
+    mock_load_config.return_value = make_config(tmpdir, backup_attachments=False, full_resync=True, keep_raw_messages=False)
+    slack = mock_slack.return_value
+    slack.get_user_display_name.return_value = "alice"
+    history = lambda: iter([HistoryPage([
+        {"ts": "1700000000.000000", "user": "U1", "text": "thread", "thread_ts": "1700000000.000000",
+         "reply_count": 1, "latest_reply": "1700000001.000000"},
+    ])])
+    replies = [
+        {"ts": "1700000000.000000", "user": "U1", "text": "thread"},
+        {"ts": "1700000001.000000", "user": "U1", "text": "the reply"},
+    ]
+    # The first replies request fails (the API wrapper reports it and returns None)
+    slack.get_conversations_replies.side_effect = [None, replies]
+    slack.iter_conversations_history.return_value = history()
+    fetch_and_save_messages("C123", "test_channel", "public_channel")
+    assert "the reply" not in tmpdir.join("test_channel.md").read_text("utf-8")
+
+    # Its day got no fingerprint, so the unchanged history is rendered again with the replies
+    slack.iter_conversations_history.return_value = history()
+    fetch_and_save_messages("C123", "test_channel", "public_channel")
+    assert "the reply" in tmpdir.join("test_channel.md").read_text("utf-8")
+
+
+def test_history_windows_cover_older_history_at_midnight():
+    day = 24 * 3600
+    boundary = day_start(1700000000)
+    windows = history_windows(boundary, boundary - 9 * day + 600, 4)
+    assert len(windows) == 3  # plus the newest window, from `boundary` on
+    assert windows[0] == {"latest": f"{boundary:.6f}", "oldest": f"{boundary - 3 * day - 0.000001:.6f}"}
+    assert "oldest" not in windows[-1]  # nothing before `created` can be missed
+    for newer, older in zip(windows, windows[1:]):
+        assert float(older["latest"]) == float(newer["oldest"]) + 0.000001
+        assert day_start(float(older["latest"])) == float(older["latest"])
+
+
+@patch('src.message_processor.SlackAPI')
+@patch('src.message_processor.load_config')
+def test_fetch_and_save_messages_in_time_slices(mock_load_config, mock_slack, tmpdir):
+    config = make_config(tmpdir, backup_attachments=False, full_resync=True, keep_raw_messages=False)
+    mock_load_config.return_value = config
+    slack = mock_slack.return_value
+    slack.get_user_display_name.return_value = "alice"
+    day = 24 * 3600
+    base = 1700000000 - 1700000000 % day
+    history = [
+        {"ts": f"{base + n * 7200}.000000", "user": "U1", "text": f"message {n}"}
+        for n in range(60, -1, -1)
+    ]
+
+    def iter_history(channel_id, channel_name, oldest=None, cursor=None, latest=None):
+        messages = [
+            m for m in history
+            if float(m["ts"]) > float(oldest or 0) and float(m["ts"]) < float(latest or "inf")
+        ]
+        for start in range(0, len(messages), 4):
+            more = start + 4 < len(messages)
+            yield HistoryPage(messages[start:start + 4], str(start + 4) if more else None)
+
+    slack.iter_conversations_history.side_effect = iter_history
+    fetch_and_save_messages("C123", "whole", "public_channel", created=base)
+    config["history_slices"] = 3
+    assert fetch_and_save_messages("C123", "sliced", "public_channel", created=base) == 61
+
+    # The older history was requested in windows, and stitched back in day order
+    assert any(c.kwargs.get("latest") for c in slack.iter_conversations_history.call_args_list)
+    whole = tmpdir.join("whole.md").read_text("utf-8")
+    assert whole.count("#### ") == 6
+    assert tmpdir.join("sliced.md").read_text("utf-8") == whole
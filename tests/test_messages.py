@@ -0,0 +1,54 @@
+# test_messages.py
+import json
+from src.api import HistoryPage
+from src.messages import CompactMessage, compact_message, compact_pages
+
+RAW = {
+    "client_msg_id": "2f1c",
+    "type": "message",
+    "ts": "1700000000.000100",
+    "user": "U123",
+    "text": "hello <@U456>",
+    "blocks": [{"type": "rich_text", "elements": []}],
+    "thread_ts": "1700000000.000100",
+    "reply_count": 2,
+    "latest_reply": "1700000100.000100",
+    "reply_users": ["U456"],
+    "edited": {"user": "U123", "ts": "1700000050.000000"},
+    "reactions": [{"name": "tada", "users": ["U456", "U789"], "count": 2}],
+    "files": [{"id": "F1", "name": "a.png", "mimetype": "image/png", "url_private": "https://x/a.png",
+               "size": 42, "thumb_64": "https://x/a_64.png", "permalink": "https://x/p"}],
+    "attachments": [
+        {"title": "link", "blocks": [{"type": "section"}, {"type": "image", "image_url": "https://x/i.png"}]},
+        {"title": "no image"},
+    ],
+}
+
+def test_compact_message_keeps_rendered_fields():
+    message = compact_message(RAW)
+    assert isinstance(message, CompactMessage)
+    assert message["ts"] == "1700000000.000100"
+    assert message.get("reply_count") == 2
+    assert message.get("edited") == {"ts": "1700000050.000000"}
+    assert message["reactions"] == [{"name": "tada", "count": 2}]
+    assert message["files"] == [
+        {"id": "F1", "name": "a.png", "mimetype": "image/png", "url_private": "https://x/a.png", "size": 42}
+    ]
+    assert message["attachments"] == [{"blocks": [{"type": "image", "image_url": "https://x/i.png"}]}]
+    assert "blocks" not in message and message.get("blocks") is None
+    assert not hasattr(message, "__dict__")
+
+def test_compact_message_reads_like_a_dict():
+    message = compact_message({"ts": "1.0", "text": ""})
+    assert "reactions" not in message
+    assert message.get("user", "") == ""
+    assert message.get("text", "x") == ""
+    assert dict(message) == {"ts": "1.0", "text": ""}
+    assert message == {"ts": "1.0", "text": ""}
+    # The JSON form (raw store, checkpoint) loads back into an equal record
+    assert compact_message(json.loads(json.dumps(dict(compact_message(RAW))))) == compact_message(RAW)
+
+def test_compact_pages_keeps_cursor():
+    pages = list(compact_pages([HistoryPage([RAW], "next"), HistoryPage([{"ts": "1.0"}])]))
+    assert [page.next_cursor for page in pages] == ["next", None]
+    assert pages[0][0] == compact_message(RAW)
@@ -0,0 +1,57 @@
+# test_metrics.py
+import json
+import pytest
+from src.metrics import Metrics, format_prometheus, write_metrics
+
+def test_metrics_counters_and_timers():
+    metrics = Metrics()
+    metrics.incr("api_errors", method="users_info")
+    metrics.incr("api_errors", method="users_info")
+    metrics.incr("download_bytes", 2048)
+    with metrics.timer("api", method="users_list"):
+        pass
+    metrics.observe("api", 0.5, method="users_list")
+
+    summary = metrics.summary()
+    counters = {(c["name"], tuple(c["labels"].items())): c["value"] for c in summary["counters"]}
+    assert counters[("api_errors", (("method", "users_info"),))] == 2
+    assert counters[("download_bytes", ())] == 2048
+    timer = summary["timers"][0]
+    assert timer["labels"] == {"method": "users_list"}
+    assert timer["count"] == 2
+    assert timer["seconds"] == pytest.approx(0.5, abs=0.05)
+
+def test_metrics_merge_labels_child_runs():
+    child = Metrics()
+    child.incr("messages", 10, type="im")
+    child.observe("api", 0.5)
+    merged = Metrics()
+    merged.merge(child.summary(), workspace="acme")
+    merged.merge(child.summary(), workspace="acme")
+
+    summary = merged.summary()
+    assert summary["counters"] == [{"name": "messages", "labels": {"type": "im", "workspace": "acme"}, "value": 20}]
+    assert summary["timers"][0]["count"] == 2
+    assert summary["timers"][0]["seconds"] == pytest.approx(1.0)
+
+def test_format_prometheus():
+    metrics = Metrics()
+    metrics.incr("messages", 42, type="im")
+    metrics.observe("write", 1.25, phase="archive")
+    text = format_prometheus(metrics.summary())
+    assert "# TYPE slackdown_messages_total counter\n" in text
+    assert 'slackdown_messages_total{type="im"} 42\n' in text
+    assert "# TYPE slackdown_write_seconds summary\n" in text
+    assert 'slackdown_write_seconds_sum{phase="archive"} 1.25\n' in text
+    assert 'slackdown_write_seconds_count{phase="archive"} 1\n' in text
+    assert "slackdown_run_duration_seconds " in text
+
+def test_write_metrics(tmpdir):
+    metrics = Metrics()
+    metrics.incr("channels")
+    json_path = str(tmpdir.join("metrics.json"))
+    prometheus_path = str(tmpdir.join("textfiles", "slackdown.prom"))
+    write_metrics(json_path, prometheus_path, metrics)
+    with open(json_path) as f:
+        assert json.load(f)["counters"] == [{"name": "channels", "labels": {}, "value": 1}]
+    assert "slackdown_channels_total 1\n" in open(prometheus_path).read()
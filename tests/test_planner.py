@@ -0,0 +1,53 @@
+# test_planner.py
+from unittest.mock import MagicMock
+from src.api import HistoryPage
+from src.planner import estimate_conversation, estimate_seconds, load_plan, sample_history, save_plan
+
+def test_sample_history_stops_after_pages():
+    slack = MagicMock()
+    slack.iter_conversations_history.return_value = iter(
+        [HistoryPage([{"ts": "3.0"}], "c1"), HistoryPage([{"ts": "2.0"}], "c2"), HistoryPage([{"ts": "1.0"}])]
+    )
+    assert sample_history(slack, "C1", "general", pages=2) == ([{"ts": "3.0"}, {"ts": "2.0"}], False)
+
+    slack.iter_conversations_history.return_value = iter([HistoryPage([{"ts": "1.0"}])])
+    assert sample_history(slack, "C1", "general", pages=2) == ([{"ts": "1.0"}], True)
+
+def test_estimate_conversation_extrapolates_to_creation():
+    # 4 messages over the newest 300 seconds of a 1200 second history
+    sample = [
+        {"ts": "1300.0", "thread_ts": "1300.0", "reply_count": 3, "latest_reply": "1301.0"},
+        {"ts": "1200.0", "files": [{"id": "F1", "size": 1000}]},
+        {"ts": "1100.0", "thread_ts": "1100.0", "reply_count": 1, "latest_reply": "1102.0"},
+        {"ts": "1000.0"},
+    ]
+    estimate = estimate_conversation(sample, complete=False, since=100)
+    assert estimate["messages"] == 16
+    assert estimate["threads"] == 8
+    assert estimate["replies"] == 16
+    assert estimate["attachment_bytes"] == 4000
+    assert estimate["api_calls"] == {"conversations_history": 1, "conversations_replies": 8}
+    assert estimate["exact"] is False
+
+    # A complete sample is taken as is; cached threads need no request
+    estimate = estimate_conversation(sample, complete=True, since=100, is_cached=lambda m: m["ts"] == "1300.0")
+    assert estimate["messages"] == 4
+    assert estimate["api_calls"] == {"conversations_history": 1, "conversations_replies": 1}
+
+def test_estimate_seconds_uses_busiest_tier():
+    # Tier 3 allows 50 calls a minute, tier 4 100
+    assert estimate_seconds({"conversations_history": 40, "conversations_replies": 60}) == 120
+    assert estimate_seconds({"conversations_history": 100, "users_info": 100}, rate_limit_multiplier=2) == 60
+
+def test_save_and_load_plan(tmpdir):
+    plan_file = str(tmpdir.join("plan.json"))
+    conversations = [
+        {"id": "C1", "name": "a", "messages": 10, "api_calls": {"conversations_history": 1}, "seconds": 1.2},
+        {"id": "C2", "name": "b", "messages": 900, "api_calls": {"conversations_history": 5}, "seconds": 6.0},
+    ]
+    plan = save_plan(plan_file, conversations)
+    assert [c["id"] for c in plan["conversations"]] == ["C2", "C1"]
+    assert plan["totals"]["messages"] == 910
+    assert plan["totals"]["api_calls"] == {"conversations_history": 6}
+    assert load_plan(plan_file) == {"C1": 1.2, "C2": 6.0}
+    assert load_plan(str(tmpdir.join("missing.json"))) is None
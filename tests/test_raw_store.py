@@ -0,0 +1,19 @@
+# test_raw_store.py
+from src.raw_store import RawStore
+
+def test_raw_store_round_trip(tmpdir):
+    store = RawStore(str(tmpdir.join("raw")))
+    store.write_channel("C1", "general", "public_channel")
+    store.write_day("C1", "2024-01-02", [{"ts": "2.0", "text": "b"}])
+    store.write_day("C1", "2024-01-01", [{"ts": "1.0", "text": "a", "blocks": [{"type": "rich_text"}]}])
+
+    assert store.list_channels() == ["C1"]
+    assert store.read_channel("C1")["name"] == "general"
+    assert [date for date, _ in store.iter_days("C1")] == ["2024-01-01", "2024-01-02"]
+    assert store.read_day("C1", "2024-01-01")[0]["blocks"] == [{"type": "rich_text"}]
+
+def test_raw_store_merges_incremental_days(tmpdir):
+    store = RawStore(str(tmpdir.join("raw")))
+    store.write_day("C1", "2024-01-01", [{"ts": "1.0", "text": "a"}, {"ts": "2.0", "text": "b"}])
+    store.write_day("C1", "2024-01-01", [{"ts": "2.0", "text": "b edited"}, {"ts": "3.0", "text": "c"}], merge=True)
+    assert [m["text"] for m in store.read_day("C1", "2024-01-01")] == ["a", "b edited", "c"]
@@ -0,0 +1,23 @@
+# test_renderer.py
+from src.renderer import render_reaction, render_text
+
+def resolve_user(user_id):
+    return {"U123": "alice"}.get(user_id, "Unknown User")
+
+def test_render_text_mentions_and_emoji():
+    text = "Hi <@U123>, see <!channel> :tada: :+1: and :thumbs_up:"
+    assert render_text(text, resolve_user) == "Hi `@alice`, see `@channel` 🎉 👍 and 👍"
+
+def test_render_text_keeps_unknown_aliases():
+    assert render_text("at 10:30:smile: :not_an_emoji:", resolve_user) == "at 10:30😄 :not_an_emoji:"
+
+def test_render_text_code_blocks():
+    text = "run this:```print(':smile:') <@U123>```done"
+    assert render_text(text, resolve_user) == "run this:\n```\nprint(':smile:') <@U123>\n```\ndone"
+
+def test_render_text_preserves_indentation():
+    assert render_text("list:\n    - item", resolve_user) == "list:\n    - item"
+
+def test_render_reaction():
+    assert render_reaction("heart") == "❤️"
+    assert render_reaction("thumbsup::skin-tone-2") == "👍"
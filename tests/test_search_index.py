@@ -0,0 +1,25 @@
+# test_search_index.py
+from src.search_index import SearchIndex
+
+def test_search_index_upserts_and_searches(tmpdir):
+    index = SearchIndex(str(tmpdir.join("search.db")))
+    index.add_messages("C1", "general", [
+        ("1700000000.000100", None, "U1", "alice", "the deploy is green"),
+        ("1700000100.000100", "1700000100.000100", "U2", "bob", "lunch anyone?"),
+        ("1700000200.000100", "1700000100.000100", "U1", "alice", "deploy after lunch"),
+    ])
+    index.add_messages("C2", "random", [("1700000300.000100", None, "U2", "bob", "deploy party")])
+    assert len(index) == 4
+
+    results = index.search("deploy")
+    assert {r["channel"] for r in results} == {"general", "random"}
+    assert [r["user"] for r in index.search("lunch", user="alice")] == ["alice"]
+    reply = index.search("deploy", channel="general", user="alice")
+    assert "**deploy**" in reply[0]["snippet"]
+
+    # Re-adding is a no-op; an edited message replaces its old text
+    index.add_messages("C1", "general", [("1700000000.000100", None, "U1", "alice", "the deploy is red")])
+    assert len(index) == 4
+    assert index.search("green") == []
+    assert len(index.search("red")) == 1
+    index.close()
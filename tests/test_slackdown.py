@@ -1,32 +1,167 @@
 # test_slackdown.py
 from unittest.mock import patch, MagicMock
 import pytest
-from slackdown import backup_all_messages
+from slackdown import backup_all_messages, in_shard, run_workspace_shard, schedule_jobs
+from src.planner import save_plan
+from src.sync_state import SyncState
+from tests.helpers import make_config
 
 @patch('slackdown.SlackAPI')
 @patch('slackdown.fetch_and_save_messages')
-def test_backup_all_messages(mock_fetch, mock_slack):
-    config = {
-        "slack_token": "dummy",
-        "backup_list": ["general"],
-        "direct_msg_dir": "dm",
-        "group_msg_dir": "groups",
-        "channel_msg_dir": "channels",
-        "attachments_dir": "attachments",
-        "backup_attachments": True
-    }
+def test_backup_all_messages(mock_fetch, mock_slack, tmpdir):
+    config = make_config(tmpdir, backup_list=["general"], state_dir=str(tmpdir))
     
     # Mock user display name for IM channel
     mock_slack_instance = MagicMock()
     mock_slack_instance.get_user_display_name.return_value = "general"
     mock_slack.return_value = mock_slack_instance
     
-    mock_slack.return_value.get_conversations_list.side_effect = [
-        [{"name": "general", "id": "C123"}],  # public
-        [],  # private
-        [],  # mpim
-        [{"user": "U123", "id": "D123"}]      # im
+    # One sweep over every conversation type
+    mock_slack.return_value.get_conversations_list.return_value = [
+        {"user": "U123", "id": "D123", "is_im": True},  # im
+        {"name": "general", "id": "C123"},  # public
     ]
     
     backup_all_messages(config)
-    assert mock_fetch.call_count == 2  # public channel + IM
\ No newline at end of file
+    assert mock_fetch.call_count == 2  # public channel + IM
+    mock_slack.return_value.get_conversations_list.assert_called_once_with(
+        types="public_channel,private_channel,mpim,im", limit=200
+    )
+    assert [c.args[2] for c in mock_fetch.call_args_list] == ["public_channel", "im"]
+    # A run summary is left for monitoring
+    assert tmpdir.join("metrics.json").check()
+    assert tmpdir.join("metrics.prom").check()
+
+
+@patch('slackdown.SyncState')
+@patch('slackdown.SlackAPI')
+@patch('slackdown.fetch_and_save_messages')
+def test_backup_all_messages_concurrent(mock_fetch, mock_slack, mock_sync_state, tmpdir):
+    config = make_config(tmpdir, workers=4)
+    mock_slack.return_value.get_conversations_list.return_value = [
+        {"name": "small", "id": "C1", "num_members": 2},
+        {"name": "big", "id": "C2", "num_members": 50},
+        {"name": "secret", "id": "G1", "num_members": 5, "is_private": True},
+    ]
+    mock_sync_state.return_value.get_message_count.return_value = 0
+    mock_fetch.return_value = 1
+
+    backup_all_messages(config)
+
+    assert mock_fetch.call_count == 3
+    assert {c.args[1] for c in mock_fetch.call_args_list} == {"small", "big", "secret"}
+    assert all(c.kwargs["progress"] is False for c in mock_fetch.call_args_list)
+
+
+def test_schedule_jobs_largest_first():
+    sync_state = MagicMock()
+    sync_state.get_message_count.side_effect = lambda channel_id: {"C1": 10, "C2": 5000}.get(channel_id, 0)
+    jobs = [
+        ("C1", "quiet", "public_channel", {"num_members": 100}),
+        ("C2", "busy", "public_channel", {"num_members": 3}),
+        ("C3", "new", "public_channel", {"num_members": 40}),
+    ]
+    assert [job[1] for job in schedule_jobs(jobs, sync_state)] == ["busy", "quiet", "new"]
+
+    # A saved plan's estimates come first
+    plan = {"C3": 120.0, "C1": 30.0}
+    assert [job[1] for job in schedule_jobs(jobs, sync_state, plan)] == ["new", "quiet", "busy"]
+
+
+@patch('slackdown.SlackAPI')
+@patch('slackdown.fetch_and_save_messages')
+def test_sequential_backup_follows_the_plan(mock_fetch, mock_slack, tmpdir):
+    config = make_config(tmpdir)
+    mock_slack.return_value.get_conversations_list.return_value = [
+        {"name": "short", "id": "C1"},
+        {"name": "long", "id": "C2"},
+    ]
+    conversations = [{"id": "C1", "seconds": 5.0, "api_calls": {}}, {"id": "C2", "seconds": 60.0, "api_calls": {}}]
+    save_plan(str(tmpdir.join("state", "plan.json")), conversations)
+
+    # Completed conversations fake the checkpoint entry written by fetch_and_save_messages
+    def fetch(channel_id, *args, checkpoint=None, **kwargs):
+        checkpoint.mark_completed(channel_id)
+        return 1
+    mock_fetch.side_effect = fetch
+
+    backup_all_messages(config)
+    assert [c.args[1] for c in mock_fetch.call_args_list] == ["long", "short"]
+    assert not tmpdir.join("state", "plan.json").exists()
+
+
+@patch('slackdown.SyncState')
+@patch('slackdown.SlackAPI')
+@patch('slackdown.fetch_and_save_messages')
+def test_backup_all_messages_skips_unchanged(mock_fetch, mock_slack, mock_sync_state, tmpdir):
+    config = make_config(tmpdir)
+    channels = [
+        {"name": "quiet", "id": "C1", "updated": 1000, "latest": {"ts": "1.0"}},
+        {"name": "busy", "id": "C2", "updated": 1000, "latest": {"ts": "1.0"}},
+        {"name": "unknown", "id": "C3", "updated": 1000},
+    ]
+    mock_slack.return_value.get_conversations_list.return_value = channels
+    mock_sync_state.return_value.get_latest.return_value = "1.0"
+    tmpdir.join("quiet.md").write("")
+    tmpdir.join("busy.md").write("")
+    tmpdir.join("unknown.md").write("")
+
+    # Completed conversations fake the checkpoint entry written by fetch_and_save_messages
+    def fetch(channel_id, *args, checkpoint=None, **kwargs):
+        checkpoint.mark_completed(channel_id)
+        return 1
+    mock_fetch.side_effect = fetch
+
+    backup_all_messages(config)
+    assert mock_fetch.call_count == 3
+
+    # Only the conversation whose latest message moved is fetched again, along
+    # with the one whose listing has no `latest` to tell
+    channels[1] = dict(channels[1], latest={"ts": "2.0"})
+    mock_fetch.reset_mock()
+    backup_all_messages(config)
+    assert sorted(c.args[1] for c in mock_fetch.call_args_list) == ["busy", "unknown"]
+
+    # A full resync ignores the directory
+    mock_fetch.reset_mock()
+    backup_all_messages(dict(config, full_resync=True))
+    assert mock_fetch.call_count == 3
+
+
+def test_in_shard_spreads_public_channels_over_tokens():
+    channel_ids = [f"C{i:07d}" for i in range(100)]
+    shards = [[c for c in channel_ids if in_shard(c, "public_channel", (i, 3))] for i in range(3)]
+    assert sorted(sum(shards, [])) == channel_ids  # every channel exactly once
+    assert all(shards)
+    # Conversations only some tokens can see stay with the first one
+    assert in_shard("D1", "im", (0, 3)) and not in_shard("D1", "im", (1, 3))
+    assert in_shard("C1", "public_channel", None)
+
+
+def test_sync_state_is_shared_by_the_shards_of_a_workspace(tmpdir):
+    state_file = str(tmpdir.join("sync_state.json"))
+    shards = [SyncState(state_file), SyncState(state_file)]
+    shards[0].update("C1", "1.0", 3)
+    shards[1].update("C2", "2.0", 5)
+    for sync_state in shards:
+        sync_state.save()
+    merged = SyncState(state_file)
+    assert (merged.get_latest("C1"), merged.get_latest("C2")) == ("1.0", "2.0")
+
+
+@patch('slackdown.backup_all_messages')
+def test_run_workspace_shard_shares_the_state_directory(mock_backup, tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)  # run_workspace_shard changes into the profile's directory
+    profile = {
+        "name": "acme",
+        "directory": str(tmpdir.join("acme")),
+        "config_file": str(tmpdir.join("acme", "config.txt")),
+        "tokens": ["xoxp-1", "xoxp-2"],
+        "rate_limit_multiplier": None,
+    }
+    run_workspace_shard(profile, 1, {"analytics_export": True})
+    config = mock_backup.call_args.args[0]
+    assert config["slack_token"] == "xoxp-2" and config["shard"] == (1, 2)
+    # Sync state and stores stay at workspace level; the export runs once for all shards
+    assert config["state_dir"] == ".slackdown"
+    assert config["analytics_export"] is False
@@ -0,0 +1,68 @@
+# test_threads.py
+from datetime import datetime
+from unittest.mock import MagicMock
+from src.raw_store import REPLIES_KEY, RawStore
+from src.threads import ThreadFetcher, is_thread_parent
+
+def test_is_thread_parent():
+    assert is_thread_parent({"ts": "1.0", "thread_ts": "1.0", "reply_count": 2})
+    assert not is_thread_parent({"ts": "2.0", "thread_ts": "1.0"})  # broadcast reply
+    assert not is_thread_parent({"ts": "3.0"})
+
+def test_thread_fetcher_caches_by_latest_reply(tmpdir):
+    slack = MagicMock()
+    slack.get_conversations_replies.return_value = [
+        {"ts": "1.0", "user": "U1", "text": "parent"},
+        {"ts": "1.5", "user": "U2", "text": "reply", "blocks": []},
+    ]
+    parent = {"ts": "1.0", "thread_ts": "1.0", "reply_count": 1, "latest_reply": "1.5"}
+    broadcast = {"ts": "1.5", "thread_ts": "1.0"}
+    cache_file = str(tmpdir.join("threads", "C1.jsonl"))
+    raw_store = RawStore(str(tmpdir.join("raw")))
+    date = datetime.fromtimestamp(1.0).strftime("%Y-%m-%d")
+
+    threads = ThreadFetcher(slack, "C1", "general", cache_file=cache_file, raw_store=raw_store)
+    page = list(threads.iter_pages([[broadcast, parent]]))[0]
+    assert threads.get_replies(page[1]) == [{"ts": "1.5", "user": "U2", "text": "reply", "blocks": []}]
+    # The day is written with its replies (as ChannelBackup.render_day does), then released
+    raw_store.write_day("C1", date, [dict(parent, **{REPLIES_KEY: threads.cached_replies(parent)})])
+    threads.release([parent])
+    assert threads.cached_replies(parent) == []
+    threads.close()
+    threads.save()
+    assert slack.get_conversations_replies.call_count == 1
+
+    # Unchanged thread: only its latest_reply is cached, the replies come from the raw store
+    with open(cache_file) as f:
+        assert f.read() == '["1.0", "1.5"]\n'
+    threads = ThreadFetcher(slack, "C1", "general", cache_file=cache_file, raw_store=raw_store)
+    threads.prefetch([parent])
+    assert threads.get_replies(parent)[0]["text"] == "reply"
+    assert slack.get_conversations_replies.call_count == 1
+
+    # A new reply changes latest_reply and triggers a refetch
+    threads.prefetch([dict(parent, latest_reply="1.9")])
+    threads.get_replies(dict(parent, latest_reply="1.9"))
+    threads.close()
+    assert slack.get_conversations_replies.call_count == 2
+
+    # Saving appends the refetched thread instead of rewriting the cache
+    threads.save()
+    with open(cache_file) as f:
+        assert f.read() == '["1.0", "1.5"]\n["1.0", "1.9"]\n'
+
+def test_thread_cache_needs_the_replies_in_the_raw_store(tmpdir):
+    slack = MagicMock()
+    slack.get_conversations_replies.return_value = [{"ts": "1.0"}, {"ts": "1.5", "text": "reply"}]
+    parent = {"ts": "1.0", "thread_ts": "1.0", "reply_count": 1, "latest_reply": "1.5"}
+    cache_file = str(tmpdir.join("threads", "C1.jsonl"))
+    tmpdir.join("threads").mkdir()
+    tmpdir.join("threads", "C1.jsonl").write('["1.0", "1.5"]\n')
+
+    # Logged as fetched, but the day never reached the raw store: fetched again
+    threads = ThreadFetcher(slack, "C1", "general", cache_file=cache_file, raw_store=RawStore(str(tmpdir.join("raw"))))
+    assert threads.latest_replies == {"1.0": "1.5"}
+    threads.prefetch([parent])
+    assert threads.get_replies(parent) == [{"ts": "1.5", "text": "reply"}]
+    threads.close()
+    assert slack.get_conversations_replies.call_count == 1
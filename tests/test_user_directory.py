@@ -0,0 +1,35 @@
+# test_user_directory.py
+import json
+import time
+from src.user_directory import UserDirectory
+
+def test_user_directory_stale_entries(tmpdir):
+    cache_file = tmpdir.join("users.json")
+    cache_file.write(json.dumps({
+        "U1": {"name": "alice", "fetched": time.time()},
+        "U2": {"name": "bob", "fetched": time.time() - 7200},
+    }))
+    users = UserDirectory(str(cache_file), ttl=3600)
+    assert users.get("U1") == "alice"
+    assert users.get("U2") is None  # stale, must be refreshed
+    assert users.is_stale()
+
+def test_user_directory_save(tmpdir):
+    cache_file = str(tmpdir.join("state", "users.json"))
+    users = UserDirectory(cache_file)
+    users.update_from_members([{"id": "U1", "profile": {"display_name": "alice"}}])
+    users.mark_unknown("U9")
+    users.save()
+    reloaded = UserDirectory(cache_file)
+    assert reloaded.get("U1") == "alice"
+    assert reloaded.get("U9") is None
+
+def test_user_directory_save_keeps_names_saved_by_other_processes(tmpdir):
+    cache_file = str(tmpdir.join("state", "users.json"))
+    first, second = UserDirectory(cache_file), UserDirectory(cache_file)
+    first.set("U1", "alice")
+    second.set("U2", "bob")
+    first.save()
+    second.save()
+    reloaded = UserDirectory(cache_file)
+    assert (reloaded.get("U1"), reloaded.get("U2")) == ("alice", "bob")